@@ -1,16 +1,36 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, abort, Response, stream_with_context, g, has_request_context
+from flask import session as session_navigateur
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as SessionFlaskSQLAlchemy
+from sqlalchemy.exc import OperationalError
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 from werkzeug.security import generate_password_hash, check_password_hash
-import pandas as pd
-from io import BytesIO
+from io import BytesIO, StringIO
+import re
+import calendar
+import functools
 import json
+import base64
+import difflib
+import unicodedata
+import time
+import threading
+import queue
 import traceback
+import atexit
+import click
+import uuid
+import hashlib
+import hmac
+from collections import OrderedDict, deque, namedtuple
+from decimal import Decimal
+import csv
+from concurrent.futures import ThreadPoolExecutor
 
-# ==================== FORCER LA CRÉATION DE LA BASE DE DONNÉES ====================
-print("🔧 Démarrage de l'application SOCoMA...")
+# pandas, numpy et openpyxl ne sont importés que par l'import et les exports Excel :
+# un worker qui ne sert que des pages démarre sans les charger.
 
 app = Flask(__name__)
 # CONFIGURATION INTELLIGENTE POUR RENDER
@@ -27,22 +47,114 @@ if DATABASE_URL:
     if DATABASE_URL.startswith('postgres://'):
         DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
     app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
-    print(f"✅ PostgreSQL Render détecté")
 else:
     # SQLite pour développement local
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///creances.db'
-    print("💻 SQLite local (mode développement)")
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# ==================== PROFILS DU MOTEUR ====================
+# Réglages du pool et de la connexion selon la base, modifiables par variables
+# d'environnement. DB_PROFIL=defaut garde les valeurs par défaut de SQLAlchemy.
+DB_PROFIL = os.environ.get('DB_PROFIL', 'optimise')
+
+PROFILS_MOTEUR = {
+    'postgresql': {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),  # Render coupe les connexions inactives
+        'pool_pre_ping': True,
+        # Délai maximal d'une requête (0 = illimité, ex. pour flask init-db sur une grosse base)
+        'connect_args': {'options': f"-c statement_timeout={int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))}"},
+    },
+    'sqlite': {
+        # Délai d'attente du verrou d'écriture, repris par PRAGMA busy_timeout
+        'connect_args': {'timeout': int(os.environ.get('DB_BUSY_TIMEOUT_MS', 15000)) / 1000},
+    },
+}
+
+PRAGMAS_SQLITE = {
+    'journal_mode': 'WAL',  # les lectures ne bloquent plus les écritures (et inversement)
+    'synchronous': 'NORMAL',  # sûr en WAL : seul le dernier commit peut être perdu en cas de coupure
+    'busy_timeout': int(os.environ.get('DB_BUSY_TIMEOUT_MS', 15000)),
+    'mmap_size': int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024)),
+}
+
+def profil_moteur(url):
+    """SQLALCHEMY_ENGINE_OPTIONS pour l'URL de connexion."""
+    if DB_PROFIL == 'defaut':
+        return {}
+    dialecte = url.split(':', 1)[0].split('+', 1)[0]
+    return dict(PROFILS_MOTEUR.get(dialecte, {}))
+
+def _pragmas_sqlite(connexion_dbapi, enregistrement):
+    curseur = connexion_dbapi.cursor()
+    for nom, valeur in PRAGMAS_SQLITE.items():
+        curseur.execute(f'PRAGMA {nom} = {valeur}')
+    curseur.close()
+
+def configurer_moteur():
+    """Réglages appliqués à chaque nouvelle connexion (appelé au démarrage du module)."""
+    for moteur in db.engines.values():
+        if DB_PROFIL != 'defaut' and moteur.dialect.name == 'sqlite':
+            db.event.listen(moteur, 'connect', _pragmas_sqlite)
+
+def sans_delai_requetes(connexion):
+    """Lève statement_timeout pour la transaction en cours (traitements de masse sur PostgreSQL)."""
+    if connexion.dialect.name == 'postgresql':
+        connexion.execute(db.text('SET LOCAL statement_timeout = 0'))
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = profil_moteur(app.config['SQLALCHEMY_DATABASE_URI'])
+
+# ==================== RÉPLIQUE EN LECTURE ====================
+# Avec DATABASE_REPLICA_URL, les routes de rapport (décorateur lecture_replique)
+# lisent sur la réplique ; toutes les écritures et les autres routes restent sur
+# la base principale. Un utilisateur qui vient d'écrire relit la base principale
+# pendant REPLIQUE_DELAI_LECTURE secondes (lire ses propres écritures malgré le retard
+# de réplication).
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+REPLIQUE_DELAI_LECTURE = int(os.environ.get('REPLIQUE_DELAI_LECTURE', 30))
+
+if DATABASE_REPLICA_URL:
+    if DATABASE_REPLICA_URL.startswith('postgres://'):
+        DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace('postgres://', 'postgresql://', 1)
+    app.config['SQLALCHEMY_BINDS'] = {'replique': {'url': DATABASE_REPLICA_URL, **profil_moteur(DATABASE_REPLICA_URL)}}
+
+def lecture_sur_replique():
+    """Vrai si la requête HTTP en cours a été envoyée vers la réplique."""
+    return has_request_context() and g.get('lecture_replique', False)
+
+def lecture_replique(vue):
+    """Décorateur des routes de rapport en lecture seule (GET uniquement)."""
+    @functools.wraps(vue)
+    def enveloppe(*args, **kwargs):
+        ecriture_recente = time.time() - session_navigateur.get('derniere_ecriture', 0) < REPLIQUE_DELAI_LECTURE
+        if DATABASE_REPLICA_URL and request.method == 'GET' and not ecriture_recente:
+            g.lecture_replique = True
+        return vue(*args, **kwargs)
+    return enveloppe
+
+class SessionRouteur(SessionFlaskSQLAlchemy):
+    """Session qui envoie les SELECT des routes de rapport vers la réplique."""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and lecture_sur_replique() and not self._flushing
+                and not (self.new or self.dirty or self.deleted)
+                and (clause is None or getattr(clause, 'is_select', False))):
+            return self._db.engines['replique']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
 # ==============================================================================
 
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': SessionRouteur})
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Veuillez vous connecter pour accéder à cette page.'
 login_manager.login_message_category = 'warning'
 
 # ==================== DONNÉES DES COMMERCIAUX ====================
+# Portefeuilles de départ : ils ne servent qu'à alimenter les tables commerciaux,
+# clients et marches (migration 4) ; l'application lit ensuite le référentiel en base.
 COMMERCIAUX_DATA = {
     'YAYA CAMARA': {
         'clients': [
@@ -145,13 +257,61 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+class Commercial(db.Model):
+    __tablename__ = 'commerciaux'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    nom = db.Column(db.String(100), unique=True, nullable=False)
+    actif = db.Column(db.Boolean, default=True)
+
+class Marche(db.Model):
+    __tablename__ = 'marches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    nom = db.Column(db.String(200), nullable=False)
+    cle = db.Column(db.String(200), unique=True, nullable=False)
+
+class Client(db.Model):
+    """Client d'un commercial ; cle est le nom normalisé (normaliser_nom) qui regroupe les variantes de saisie."""
+    __tablename__ = 'clients'
+    __table_args__ = (
+        db.UniqueConstraint('commercial_id', 'cle', name='uq_clients_commercial_cle'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    commercial_id = db.Column(db.Integer, db.ForeignKey('commerciaux.id'), nullable=False)
+    marche_id = db.Column(db.Integer, db.ForeignKey('marches.id'), nullable=True)
+    nom_complet = db.Column(db.String(200), nullable=False)
+    prenom = db.Column(db.String(100), nullable=True)
+    nom = db.Column(db.String(100), nullable=True)
+    cle = db.Column(db.String(200), nullable=False)
+    contact = db.Column(db.String(50), nullable=True)
+
 class Creance(db.Model):
     __tablename__ = 'creances'
+    # Index calqués sur les requêtes des routes (voir MIGRATIONS pour les bases existantes)
+    __table_args__ = (
+        db.Index('ix_creances_commercial_date', 'commercial', 'date_creation', 'id'),
+        db.Index('ix_creances_date_creation', 'date_creation', 'id'),
+        db.Index('ix_creances_client_commercial', 'client', 'commercial'),
+        db.Index('ix_creances_situation_commercial', 'situation_paiement', 'commercial'),
+        db.Index('ix_creances_ouvertes', 'commercial', 'date_echeance',
+                 postgresql_where=db.text('solde > 0'), sqlite_where=db.text('solde > 0')),
+        db.Index('ix_creances_client_recherche', 'client_recherche', 'commercial'),
+        db.Index('ix_creances_commercial_id', 'commercial_id'),
+        db.Index('ix_creances_client_id', 'client_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    # commercial, client et marche restent les libellés affichés ; les regroupements
+    # se font sur les clés entières, renseignées à l'écriture (voir RÉFÉRENTIEL).
     commercial = db.Column(db.String(100), nullable=False)
     client = db.Column(db.String(200), nullable=False)
+    client_recherche = db.Column(db.String(200), nullable=True)
     marche = db.Column(db.String(200), nullable=True)
+    commercial_id = db.Column(db.Integer, db.ForeignKey('commerciaux.id'), nullable=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=True)
+    marche_id = db.Column(db.Integer, db.ForeignKey('marches.id'), nullable=True)
     montant = db.Column(db.Float, nullable=False)
     versement = db.Column(db.Float, default=0)
     solde = db.Column(db.Float, nullable=False)
@@ -197,47 +357,342 @@ class Creance(db.Model):
             self.situation_paiement = 'EN COURS'
             self.jours_retard = 0
 
-# ==================== INITIALISATION FORCÉE DE LA BASE ====================
-print("📦 Initialisation de la base de données...")
-with app.app_context():
-    try:
-        # Créer les tables
-        db.create_all()
-        print("✅ Tables de base de données créées")
-        
-        # Créer les utilisateurs par défaut si nécessaire
-        if not User.query.filter_by(username='admin').first():
-            admin = User(username='DAOUDA CISSE', role='admin')
-            admin.set_password('Csol2102@!*')
-            db.session.add(admin)
-            
-            commercial = User(username='CAMARA YAYA', role='commercial', commercial='YAYA CAMARA')
-            commercial.set_password('Socoma2030@')
-            db.session.add(commercial)
-            
-            user = User(username='BDM', role='user')
-            user.set_password('Diallobdm2026@')
-            db.session.add(user)
-            
-            db.session.commit()
-            print("✅ Utilisateurs par défaut créés:")
-            print("   - DAOUDA CISSE / Csol2102@!*")
-            print("   - CAMARA YAYA / Socoma2030@")
-            print("   - BDM / Diallobdm2026@")
-        else:
-            print("✅ Utilisateurs existent déjà")
-            
-        # Vérifier le nombre de créances existantes
-        creances_count = Creance.query.count()
-        print(f"📊 Créances dans la base: {creances_count}")
-        
-    except Exception as e:
-        print(f"⚠️ Erreur lors de l'initialisation: {str(e)}")
+class ClientRecherche(db.Model):
+    """Un nom de client distinct par commercial, indexé pour la recherche approchée."""
+    __tablename__ = 'clients_recherche'
+    __table_args__ = (db.UniqueConstraint('cle', 'commercial', name='uq_clients_recherche_cle'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cle = db.Column(db.String(200), nullable=False)
+    client = db.Column(db.String(200), nullable=False)
+    commercial = db.Column(db.String(100), nullable=False)
+
+class Job(db.Model):
+    """Tâche longue (import, export) exécutée hors de la requête HTTP."""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    type = db.Column(db.String(20), nullable=False)
+    statut = db.Column(db.String(20), default='en_attente')
+    progression = db.Column(db.Integer, default=0)
+    message = db.Column(db.String(200), nullable=True)
+    resultat = db.Column(db.Text, nullable=True)
+    fichier = db.Column(db.String(300), nullable=True)
+    cree_par = db.Column(db.String(80), nullable=True)
+    date_creation = db.Column(db.DateTime, default=datetime.now)
+    date_fin = db.Column(db.DateTime, nullable=True)
+    battement = db.Column(db.DateTime, nullable=True)  # dernier signe de vie du worker qui l'exécute
+
+class Paiement(db.Model):
+    """Journal des versements : une ligne par encaissement (négative pour une correction), jamais modifiée.
+
+    Quand la créance part dans creances_archive, le paiement y est rattaché par
+    creance_archive_id et creance_id passe à NULL.
+    """
+    __tablename__ = 'paiements'
+    __table_args__ = (
+        db.Index('ix_paiements_commercial_date', 'commercial_id', 'date_paiement'),
+        db.Index('ix_paiements_date', 'date_paiement'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    creance_id = db.Column(db.Integer, db.ForeignKey('creances.id', ondelete='SET NULL'), nullable=True, index=True)
+    creance_archive_id = db.Column(db.Integer, db.ForeignKey('creances_archive.id'), nullable=True, index=True)
+    commercial_id = db.Column(db.Integer, db.ForeignKey('commerciaux.id'), nullable=True)
+    montant = db.Column(db.Float, nullable=False)
+    date_paiement = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    saisi_par = db.Column(db.String(80), nullable=True)
+
+class SoldeQuotidien(db.Model):
+    """Instantané de fin de journée des encours par commercial (courbes de tendance)."""
+    __tablename__ = 'soldes_quotidiens'
+    
+    jour = db.Column(db.Date, primary_key=True)
+    commercial_id = db.Column(db.Integer, db.ForeignKey('commerciaux.id'), primary_key=True)
+    encours = db.Column(db.Float, nullable=False, default=0)
+    montant_retard = db.Column(db.Float, nullable=False, default=0)
+    nb_ouvertes = db.Column(db.Integer, nullable=False, default=0)
+    recouvre = db.Column(db.Float, nullable=False, default=0)
+    date_calcul = db.Column(db.DateTime, default=datetime.now)
+
+class ClientBalance(db.Model):
+    """Totaux par client (un client appartient à un commercial), tenus à jour à chaque écriture sur creances."""
+    __tablename__ = 'client_balances'
+    __table_args__ = (
+        db.Index('ix_client_balances_commercial', 'commercial_id'),
+    )
+    
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), primary_key=True)
+    commercial_id = db.Column(db.Integer, db.ForeignKey('commerciaux.id'), nullable=False)
+    nombre_creances = db.Column(db.Integer, nullable=False, default=0)
+    total_montant = db.Column(db.Float, nullable=False, default=0)
+    total_versement = db.Column(db.Float, nullable=False, default=0)
+    total_solde = db.Column(db.Float, nullable=False, default=0)
+    derniere_echeance = db.Column(db.Date, nullable=True)
+    mis_a_jour = db.Column(db.DateTime, default=datetime.now)
+
+class CreanceArchive(db.Model):
+    """Créance soldée sortie de creances par archiver_creances : mêmes colonnes, lue seulement à la demande.
+
+    creance_id garde le numéro d'origine (affiché et exporté) ; id est propre à
+    l'archive, SQLite pouvant réattribuer le plus grand id supprimé de creances.
+    """
+    __tablename__ = 'creances_archive'
+    __table_args__ = (
+        db.Index('ix_creances_archive_client_id', 'client_id'),
+        db.Index('ix_creances_archive_commercial', 'commercial', 'id'),
+        db.Index('ix_creances_archive_creance_id', 'creance_id'),
+    )
+    archivee = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    creance_id = db.Column(db.Integer, nullable=False)
+    commercial = db.Column(db.String(100), nullable=False)
+    client = db.Column(db.String(200), nullable=False)
+    client_recherche = db.Column(db.String(200), nullable=True)
+    marche = db.Column(db.String(200), nullable=True)
+    commercial_id = db.Column(db.Integer, db.ForeignKey('commerciaux.id'), nullable=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=True)
+    marche_id = db.Column(db.Integer, db.ForeignKey('marches.id'), nullable=True)
+    montant = db.Column(db.Float, nullable=False)
+    versement = db.Column(db.Float, default=0)
+    solde = db.Column(db.Float, nullable=False)
+    date_creation = db.Column(db.DateTime, nullable=True)
+    date_facturation = db.Column(db.Date, nullable=False)
+    date_echeance = db.Column(db.Date, nullable=True)
+    jours_retard = db.Column(db.Integer, default=0)
+    statut = db.Column(db.String(50), default='PAYE')
+    situation_paiement = db.Column(db.String(50), default='SOLDE')
+    commentaires = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(80), nullable=True)
+    date_archivage = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    archive_par = db.Column(db.String(80), nullable=True)
+
+class ActionAdmin(db.Model):
+    """Journal des actions en masse de la page Réinitialisation."""
+    __tablename__ = 'actions_admin'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date_action = db.Column(db.DateTime, default=datetime.now)
+    admin = db.Column(db.String(80), nullable=False)
+    commercial = db.Column(db.String(100), nullable=False)
+    action = db.Column(db.String(30), nullable=False)
+    cible = db.Column(db.String(100), nullable=True)
+    raison = db.Column(db.Text, nullable=True)
+    lignes = db.Column(db.Integer, nullable=True)
+    duree_ms = db.Column(db.Integer, nullable=True)
+
+class CreanceSupprimee(db.Model):
+    """Copie d'une créance supprimée par une action en masse, rattachée à son entrée du journal."""
+    __tablename__ = 'creances_supprimees'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    action_id = db.Column(db.Integer, db.ForeignKey('actions_admin.id'), nullable=False, index=True)
+    creance_id = db.Column(db.Integer, nullable=False)
+    commercial = db.Column(db.String(100), nullable=False)
+    client = db.Column(db.String(200), nullable=False)
+    marche = db.Column(db.String(200), nullable=True)
+    montant = db.Column(db.Float, nullable=False)
+    versement = db.Column(db.Float, nullable=True)
+    solde = db.Column(db.Float, nullable=False)
+    date_creation = db.Column(db.DateTime, nullable=True)
+    date_facturation = db.Column(db.Date, nullable=False)
+    date_echeance = db.Column(db.Date, nullable=True)
+    statut = db.Column(db.String(50), nullable=True)
+    situation_paiement = db.Column(db.String(50), nullable=True)
+    commentaires = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(80), nullable=True)
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    appliquee_le = db.Column(db.DateTime, default=datetime.now)
+
+# ==================== MIGRATIONS DE SCHÉMA ====================
+# db.create_all() ne modifie jamais une table existante : chaque évolution du
+# schéma d'une base déjà en production est ajoutée ici avec un numéro croissant.
+def _creer_index(table, *noms):
+    for index in table.indexes:
+        if index.name in noms:
+            index.create(db.engine, checkfirst=True)
+
+def _ajouter_colonne(table, nom):
+    """ALTER TABLE ... ADD COLUMN pour une colonne déclarée dans le modèle, si elle manque."""
+    existantes = {c['name'] for c in db.inspect(db.engine).get_columns(table.name)}
+    if nom in existantes:
+        return
+    colonne = table.columns[nom]
+    type_sql = colonne.type.compile(dialect=db.engine.dialect)
+    for cle_etrangere in colonne.foreign_keys:
+        type_sql += f' REFERENCES {cle_etrangere.column.table.name}({cle_etrangere.column.name})'
+    with db.engine.begin() as connection:
+        connection.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {nom} {type_sql}'))
+
+def _migration_recherche_clients():
+    _ajouter_colonne(Creance.__table__, 'client_recherche')
+    _creer_index(Creance.__table__, 'ix_creances_client_recherche')
+    ClientRecherche.__table__.create(db.engine, checkfirst=True)
+    
+    # Clé normalisée des lignes existantes : une requête par nom distinct
+    noms = db.session.query(Creance.client).filter(Creance.client_recherche.is_(None)).distinct().all()
+    for (nom,) in noms:
+        db.session.execute(
+            db.update(Creance).where(Creance.client == nom).values(client_recherche=normaliser_nom(nom))
+        )
+    db.session.commit()
+    
+    creer_index_recherche()
+    synchroniser_index_clients()
+
+def _migration_paiements_archives():
+    _ajouter_colonne(Paiement.__table__, 'creance_archive_id')
+    _creer_index(Paiement.__table__, 'ix_paiements_creance_archive_id')
+    # Paiements de créances déjà archivées dont la ligne d'origine n'existe plus
+    orphelins = db.and_(Paiement.creance_id.isnot(None), Paiement.creance_id.notin_(db.select(Creance.id)))
+    rattacher_paiements_archives(orphelins)
+    db.session.commit()
+
+def _migration_paiements_orphelins():
+    # Restes de suppressions sous SQLite : creance_id désigne une ligne qui n'existe plus
+    db.session.execute(
+        db.update(Paiement).where(Paiement.creance_id.isnot(None), Paiement.creance_id.notin_(db.select(Creance.id)))
+        .values(creance_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+MIGRATIONS = [
+    (1, 'Index composites sur creances', lambda: _creer_index(
+        Creance.__table__,
+        'ix_creances_commercial_date', 'ix_creances_date_creation', 'ix_creances_client_commercial',
+        'ix_creances_situation_commercial', 'ix_creances_ouvertes')),
+    (2, 'Recherche approchée des clients', _migration_recherche_clients),
+    (3, 'Soldes par client', lambda: ClientBalance.__table__.create(db.engine, checkfirst=True)),
+    (4, 'Référentiel commerciaux, clients et marchés', lambda: _migration_referentiel()),
+    (5, 'Journal des paiements et instantanés quotidiens', lambda: _migration_paiements()),
+    (6, 'Archive des créances soldées', lambda: CreanceArchive.__table__.create(db.engine, checkfirst=True)),
+    (7, 'Journal des actions en masse', lambda: db.metadata.create_all(
+        db.engine, tables=[ActionAdmin.__table__, CreanceSupprimee.__table__])),
+    (8, 'Paiements des créances archivées', _migration_paiements_archives),
+    (9, 'Paiements des créances supprimées', lambda: _migration_paiements_orphelins()),
+    (10, 'Signe de vie des tâches en arrière-plan', lambda: _ajouter_colonne(Job.__table__, 'battement')),
+]
+
+def appliquer_migrations():
+    """Applique dans l'ordre les migrations absentes de schema_migrations."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    deja_appliquees = {version for (version,) in db.session.query(SchemaMigration.version)}
+    
+    appliquees = []
+    for version, description, migration in MIGRATIONS:
+        if version in deja_appliquees:
+            continue
+        migration()
+        db.session.add(SchemaMigration(version=version, description=description))
+        db.session.commit()
+        appliquees.append(version)
+    return appliquees
+
+@app.cli.command('migrer')
+@click.option('--statut', is_flag=True, help='Afficher les migrations sans les appliquer')
+def migrer_command(statut):
+    """Applique les migrations de schéma en attente."""
+    if statut:
+        SchemaMigration.__table__.create(db.engine, checkfirst=True)
+        deja_appliquees = {m.version: m for m in SchemaMigration.query.all()}
+        for version, description, _ in MIGRATIONS:
+            m = deja_appliquees.get(version)
+            etat = f"appliquée le {m.appliquee_le.strftime('%d/%m/%Y %H:%M')}" if m else 'en attente'
+            print(f"   {version:03d} {description} - {etat}")
+        return
+    
+    appliquees = appliquer_migrations()
+    if appliquees:
+        print(f"✅ Migrations appliquées: {', '.join(str(v) for v in appliquees)}")
+    else:
+        print("✅ Schéma déjà à jour")
 
 # ==================== CONFIGURATION LOGIN ====================
+# L'utilisateur connecté est gardé en mémoire quelques instants : une page
+# ordinaire n'interroge plus la table users. Toute écriture sur un User
+# (création, suppression, changement de rôle) retire l'entrée au commit.
+UTILISATEURS_CACHE_TTL = int(os.environ.get('UTILISATEURS_CACHE_TTL', 60))  # secondes
+DERNIERE_CONNEXION_DELAI = int(os.environ.get('DERNIERE_CONNEXION_DELAI', 30))  # secondes entre deux écritures groupées
+
+class UtilisateurConnecte(UserMixin):
+    """Copie détachée d'un User (colonnes utilisées par les routes et les gabarits)."""
+    
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+        self.commercial = user.commercial
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    utilisateur = cache_utilisateurs.lire(int(user_id))
+    if utilisateur is None:
+        user = db.session.get(User, int(user_id))
+        if user is None:
+            return None
+        utilisateur = UtilisateurConnecte(user)
+        cache_utilisateurs.ecrire(utilisateur.id, utilisateur)
+    return utilisateur
+
+@db.event.listens_for(db.session, 'after_flush')
+def _ecritures_utilisateurs(session, flush_context):
+    ids = {objet.id for objet in (*session.new, *session.dirty, *session.deleted) if isinstance(objet, User)}
+    if ids:
+        session.info.setdefault('utilisateurs_modifies', set()).update(ids)
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalider_utilisateurs_apres_commit(session):
+    for user_id in session.info.pop('utilisateurs_modifies', ()):
+        cache_utilisateurs.supprimer(user_id)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _oublier_utilisateurs_annules(session):
+    session.info.pop('utilisateurs_modifies', None)
+
+# Dates de dernière connexion en attente d'écriture : user_id -> datetime
+_connexions_en_attente = {}
+_verrou_connexions = threading.Lock()
+_ecriture_connexions_lancee = False
+
+def noter_connexion(user_id, quand=None):
+    """Mémorise la connexion ; users.last_login est mis à jour par lots en arrière-plan."""
+    global _ecriture_connexions_lancee
+    with _verrou_connexions:
+        _connexions_en_attente[user_id] = quand or datetime.now()
+        lancer = not _ecriture_connexions_lancee
+        _ecriture_connexions_lancee = True
+    if lancer:
+        def boucle():
+            while True:
+                time.sleep(DERNIERE_CONNEXION_DELAI)
+                try:
+                    enregistrer_connexions()
+                except Exception as e:
+                    print(f"⚠️ Erreur lors de l'enregistrement des connexions: {str(e)}")
+        threading.Thread(target=boucle, name='dernieres-connexions', daemon=True).start()
+
+def enregistrer_connexions():
+    """Écrit en un executemany les last_login en attente ; retourne le nombre d'utilisateurs."""
+    with _verrou_connexions:
+        lignes = [{'b_id': user_id, 'b_last_login': quand} for user_id, quand in _connexions_en_attente.items()]
+        _connexions_en_attente.clear()
+    if not lignes:
+        return 0
+    table = User.__table__
+    requete = table.update().where(table.c.id == db.bindparam('b_id')).values(last_login=db.bindparam('b_last_login'))
+    with app.app_context():
+        with db.engine.begin() as connexion:
+            connexion.execute(requete, lignes)
+    return len(lignes)
+
+atexit.register(enregistrer_connexions)
 
 # ==================== FILTRES JINJA2 ====================
 @app.template_filter('format_money')
@@ -249,20 +704,1642 @@ def format_money_filter(value):
     except:
         return str(value)
 
-@app.template_filter('format_date')
-def format_date_filter(value):
-    if not value:
-        return ""
-    if isinstance(value, str):
-        try:
-            value = datetime.strptime(value, '%Y-%m-%d')
-        except:
-            return value
-    return value.strftime('%d/%m/%Y')
+@app.template_filter('format_date')
+def format_date_filter(value):
+    if not value:
+        return ""
+    if isinstance(value, str):
+        try:
+            value = datetime.strptime(value, '%Y-%m-%d')
+        except:
+            return value
+    return value.strftime('%d/%m/%Y')
+
+@app.context_processor
+def inject_now():
+    return {'now': datetime.now()}
+
+# ==================== AGRÉGATIONS SQL ====================
+def portefeuille_courant():
+    """Commercial auquel l'utilisateur connecté est limité, ou None s'il voit tout."""
+    if current_user.role == 'commercial' and current_user.commercial:
+        return current_user.commercial
+    return None
+
+def statistiques_portefeuille(commercial=None, commerciaux_list=None):
+    """Totaux globaux et par commercial calculés en un seul GROUP BY.
+
+    Aucune instance Creance n'est chargée : les sommes EN RETARD et les
+    comptages sont faits côté base avec des CASE.
+    """
+    en_retard = Creance.situation_paiement == 'EN RETARD'
+    query = db.session.query(
+        Commercial.nom.label('commercial'),
+        db.func.count(Creance.id).label('count'),
+        db.func.coalesce(db.func.sum(Creance.montant), 0).label('total'),
+        db.func.coalesce(db.func.sum(Creance.versement), 0).label('versement'),
+        db.func.coalesce(db.func.sum(Creance.solde), 0).label('solde'),
+        db.func.coalesce(db.func.sum(db.case((en_retard, Creance.solde), else_=0)), 0).label('retard'),
+        db.func.sum(db.case((en_retard, 1), else_=0)).label('nb_retard'),
+        db.func.sum(db.case((Creance.solde > 0, 1), else_=0)).label('nb_en_cours'),
+        db.func.count(db.func.distinct(Creance.client_id)).label('clients'),
+    ).join(Commercial, Commercial.id == Creance.commercial_id)
+    if commercial:
+        query = query.filter(Commercial.nom == commercial)
+    lignes = {row.commercial: row for row in query.group_by(Commercial.id, Commercial.nom)}
+
+    def total(champ):
+        return sum(getattr(row, champ) or 0 for row in lignes.values())
+
+    total_creances = total('total')
+    montant_retard = total('retard')
+
+    if commerciaux_list is None:
+        commerciaux_list = [commercial] if commercial else noms_commerciaux()
+
+    par_commercial = {}
+    for nom in commerciaux_list:
+        if not nom:
+            continue
+        row = lignes.get(nom)
+        total_comm = row.total if row else 0
+        retard_comm = row.retard if row else 0
+        par_commercial[nom] = {
+            'count': row.count if row else 0,
+            'total': total_comm,
+            'versement': row.versement if row else 0,
+            'retard': retard_comm,
+            'solde': row.solde if row else 0,
+            'nb_retard': row.nb_retard if row else 0,
+            'clients': row.clients if row else 0,
+            'performance': ((total_comm - retard_comm) / total_comm * 100) if total_comm > 0 else 0
+        }
+
+    return {
+        'total_creances': total_creances,
+        'total_versement': total('versement'),
+        'total_solde': total('solde'),
+        'montant_retard': montant_retard,
+        'nb_retard': total('nb_retard'),
+        'nb_en_cours': total('nb_en_cours'),
+        'tpar': (montant_retard / total_creances * 100) if total_creances > 0 else 0,
+        'par_commercial': par_commercial
+    }
+
+def top_retards(commercial=None, limit=5):
+    """Créances EN RETARD les plus anciennes, limitées aux colonnes affichées."""
+    query = db.session.query(
+        Creance.id, Creance.client, Creance.commercial, Creance.solde, Creance.jours_retard
+    ).filter(Creance.situation_paiement == 'EN RETARD')
+    if commercial:
+        query = query.filter(Creance.commercial == commercial)
+    return query.order_by(db.func.coalesce(Creance.jours_retard, 0).desc(), Creance.id).limit(limit).all()
+
+def recap_par_client(commercial=None):
+    """Totaux par client du portefeuille (page recap_clients), lus dans client_balances."""
+    colonnes = [Client.nom_complet.label('client'), Commercial.nom.label('commercial'), Marche.nom.label('marche'),
+                ClientBalance.nombre_creances, ClientBalance.total_montant,
+                ClientBalance.total_versement, ClientBalance.total_solde, ClientBalance.derniere_echeance]
+    query = db.select(*colonnes)\
+        .join(Client, Client.id == ClientBalance.client_id)\
+        .join(Commercial, Commercial.id == ClientBalance.commercial_id)\
+        .outerjoin(Marche, Marche.id == Client.marche_id)\
+        .order_by(Client.nom_complet, Commercial.nom)
+    if commercial:
+        query = query.where(Commercial.nom == commercial)
+    clients_recap = [dict(ligne) for ligne in db.session.execute(query).mappings()]
+    
+    return {
+        'clients': clients_recap,
+        'total_montant': sum(c['total_montant'] for c in clients_recap),
+        'total_versement': sum(c['total_versement'] for c in clients_recap),
+        'total_solde': sum(c['total_solde'] for c in clients_recap),
+        'total_creances': sum(c['nombre_creances'] for c in clients_recap)
+    }
+
+def resume_creances(query):
+    """Totaux d'une requête filtrée et répartition par statut, sans charger les lignes."""
+    en_retard = Creance.situation_paiement == 'EN RETARD'
+    totaux = query.with_entities(
+        db.func.count(Creance.id).label('count'),
+        db.func.coalesce(db.func.sum(Creance.montant), 0).label('montant'),
+        db.func.coalesce(db.func.sum(Creance.versement), 0).label('versement'),
+        db.func.coalesce(db.func.sum(Creance.solde), 0).label('solde'),
+        db.func.sum(db.case((Creance.solde > 0, 1), else_=0)).label('en_cours'),
+        db.func.sum(db.case((en_retard, 1), else_=0)).label('retard'),
+    ).one()
+    par_statut = query.with_entities(
+        Creance.statut, db.func.count(Creance.id), db.func.coalesce(db.func.sum(Creance.solde), 0)
+    ).group_by(Creance.statut).all()
+
+    return {
+        'count': totaux.count,
+        'montant': totaux.montant,
+        'versement': totaux.versement,
+        'solde': totaux.solde,
+        'en_cours': totaux.en_cours or 0,
+        'retard': totaux.retard or 0,
+        'par_statut': {statut: {'count': n, 'solde': solde} for statut, n, solde in par_statut}
+    }
+
+# ==================== CACHE DES RÉSULTATS ====================
+# Les pages de synthèse ne dépendent que du portefeuille (tout, ou un commercial) :
+# leurs agrégats sont mis en cache et invalidés dès qu'une transaction modifie les créances.
+# Les clés se terminent par le portefeuille (':TOUS' ou ':<commercial>') : un commit
+# n'invalide que les portefeuilles des créances touchées et le portefeuille global.
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+CACHE_TAILLE_MAX = int(os.environ.get('CACHE_TAILLE_MAX', 256))
+
+class CacheMemoire:
+    """Cache propre au processus, avec expiration (TTL) et éviction LRU."""
+    
+    def __init__(self, ttl=CACHE_TTL, taille_max=CACHE_TAILLE_MAX):
+        self.ttl = ttl
+        self.taille_max = taille_max
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        self._derniere_invalidation = 0.0
+    
+    def lire(self, cle):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                return None
+            expiration, valeur = entree
+            if expiration < time.monotonic():
+                del self._entrees[cle]
+                return None
+            self._entrees.move_to_end(cle)
+            return valeur
+    
+    def ecrire(self, cle, valeur):
+        with self._verrou:
+            self._entrees[cle] = (time.monotonic() + self.ttl, valeur)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+    
+    def supprimer(self, cle):
+        with self._verrou:
+            self._entrees.pop(cle, None)
+    
+    def invalider(self, portefeuilles):
+        """Retire les entrées des portefeuilles donnés (dernier segment de la clé)."""
+        with self._verrou:
+            for cle in [c for c in self._entrees if c.rsplit(':', 1)[-1] in portefeuilles]:
+                del self._entrees[cle]
+            self._derniere_invalidation = time.time()
+    
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self._derniere_invalidation = time.time()
+    
+    def derniere_invalidation(self):
+        """Horodatage (time.time()) de la dernière invalidation."""
+        return self._derniere_invalidation
+
+# Les valeurs partagées par Redis sont écrites en JSON, jamais en pickle : une donnée
+# lue dans Redis ne doit pas pouvoir exécuter de code. Dates, lignes SQL (Row), tuples
+# et dictionnaires à clés non textuelles sont balisés pour être relus à l'identique.
+def encoder_cache(valeur):
+    """Valeur en cache -> structure JSON (voir decoder_cache)."""
+    if isinstance(valeur, db.Row):
+        return {'__ligne__': list(valeur._fields), 'valeurs': [encoder_cache(v) for v in valeur]}
+    if isinstance(valeur, tuple):
+        return {'__tuple__': [encoder_cache(v) for v in valeur]}
+    if isinstance(valeur, list):
+        return [encoder_cache(v) for v in valeur]
+    if isinstance(valeur, dict):
+        if all(isinstance(k, str) for k in valeur):
+            return {k: encoder_cache(v) for k, v in valeur.items()}
+        return {'__paires__': [[encoder_cache(k), encoder_cache(v)] for k, v in valeur.items()]}
+    if isinstance(valeur, datetime):
+        return {'__datetime__': valeur.isoformat()}
+    if isinstance(valeur, date):
+        return {'__date__': valeur.isoformat()}
+    if isinstance(valeur, Decimal):
+        return float(valeur)
+    if valeur is None or isinstance(valeur, (str, int, float, bool)):
+        return valeur
+    raise TypeError(f'Valeur non sérialisable en cache : {type(valeur).__name__}')
+
+@functools.lru_cache(maxsize=64)
+def _type_ligne(champs):
+    return namedtuple('LigneCache', champs, rename=True)
+
+def _decoder_objet(objet):
+    if '__ligne__' in objet:
+        return _type_ligne(tuple(objet['__ligne__']))(*objet['valeurs'])
+    if '__tuple__' in objet:
+        return tuple(objet['__tuple__'])
+    if '__paires__' in objet:
+        return {(tuple(k) if isinstance(k, list) else k): v for k, v in objet['__paires__']}
+    if '__datetime__' in objet:
+        return datetime.fromisoformat(objet['__datetime__'])
+    if '__date__' in objet:
+        return date.fromisoformat(objet['__date__'])
+    return objet
+
+def decoder_cache(texte):
+    return json.loads(texte, object_hook=_decoder_objet)
+
+class CacheRedis:
+    """Cache partagé entre les workers gunicorn (CACHE_URL=redis://...).
+    
+    Les clés portent un numéro de génération global et un par portefeuille :
+    invalider revient à les incrémenter. L'éviction LRU est celle de Redis
+    (maxmemory-policy allkeys-lru). Même interface que CacheMemoire (lire,
+    ecrire, supprimer, invalider, vider).
+    """
+    
+    def __init__(self, url, ttl=CACHE_TTL):
+        import redis
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+    
+    def _cle(self, cle):
+        portefeuille = cle.rsplit(':', 1)[-1]
+        generation, generation_portefeuille = self._client.mget(
+            'socoma:cache:generation', f'socoma:cache:generation:{portefeuille}')
+        return f'socoma:cache:{int(generation or 0)}.{int(generation_portefeuille or 0)}:{cle}'
+    
+    def lire(self, cle):
+        valeur = self._client.get(self._cle(cle))
+        return decoder_cache(valeur) if valeur is not None else None
+    
+    def ecrire(self, cle, valeur):
+        self._client.setex(self._cle(cle), self.ttl, json.dumps(encoder_cache(valeur)))
+    
+    def supprimer(self, cle):
+        self._client.delete(self._cle(cle))
+    
+    def invalider(self, portefeuilles):
+        pipeline = self._client.pipeline()
+        for portefeuille in portefeuilles:
+            pipeline.incr(f'socoma:cache:generation:{portefeuille}')
+        pipeline.set('socoma:cache:derniere_invalidation', time.time())
+        pipeline.execute()
+    
+    def vider(self):
+        pipeline = self._client.pipeline()
+        pipeline.incr('socoma:cache:generation')
+        pipeline.set('socoma:cache:derniere_invalidation', time.time())
+        pipeline.execute()
+    
+    def derniere_invalidation(self):
+        """Horodatage de la dernière invalidation, tous workers confondus."""
+        return float(self._client.get('socoma:cache:derniere_invalidation') or 0)
+    
+    def publier(self, canal, message):
+        self._client.publish(f'socoma:{canal}', message)
+    
+    def ecouter(self, canal, rappel):
+        """Appelle rappel(message) dans un thread démon pour chaque message publié sur canal."""
+        abonnement = self._client.pubsub(ignore_subscribe_messages=True)
+        abonnement.subscribe(**{f'socoma:{canal}': lambda message: rappel(message['data'].decode())})
+        abonnement.run_in_thread(sleep_time=1, daemon=True)
+
+if os.environ.get('CACHE_URL'):
+    cache_resultats = CacheRedis(os.environ['CACHE_URL'])
+else:
+    cache_resultats = CacheMemoire()
+
+# Utilisateurs connectés (user_loader) : toujours propre au processus, d'où un TTL court
+cache_utilisateurs = CacheMemoire(ttl=UTILISATEURS_CACHE_TTL)
+
+def en_cache(nom, commercial, calcul):
+    """Résultat de calcul() pour la page nom et le portefeuille donné, recalculé si absent ou expiré."""
+    cle = f'{nom}:{commercial or "TOUS"}'
+    valeur = cache_resultats.lire(cle)
+    if valeur is None:
+        valeur = calcul()
+        # Un calcul lu sur la réplique juste après un commit peut précéder ce commit : il
+        # n'est pas mis en cache. Le commit peut venir d'un autre worker, d'où l'horodatage
+        # d'invalidation du cache lui-même (partagé dans Redis avec CACHE_URL).
+        if not (lecture_sur_replique()
+                and time.time() - cache_resultats.derniere_invalidation() < REPLIQUE_DELAI_LECTURE):
+            cache_resultats.ecrire(cle, valeur)
+    return valeur
+
+def invalider_cache_portefeuilles(portefeuilles):
+    """Entrées des portefeuilles touchés et du portefeuille global ; tout le cache si '*' (portefeuilles inconnus)."""
+    if '*' in portefeuilles:
+        cache_resultats.vider()
+    else:
+        cache_resultats.invalider({*portefeuilles, 'TOUS'})
+
+def marquer_creances_modifiees(session, commerciaux=None):
+    """À appeler pour les écritures qui contournent la session (COPY PostgreSQL).
+
+    commerciaux : portefeuilles touchés, None s'ils sont inconnus (tous sont alors notifiés).
+    """
+    portefeuilles = session.info.setdefault('creances_modifiees', set())
+    portefeuilles.update(commerciaux if commerciaux is not None else ['*'])
+    session.info['ecriture'] = True
+
+@db.event.listens_for(db.session, 'after_flush')
+def _ecritures_orm_creances(session, flush_context):
+    commerciaux = set()
+    for objet in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(objet, Creance):
+            commerciaux.add(objet.commercial)
+            commerciaux.update(db.inspect(objet).attrs.commercial.history.deleted or ())
+    if commerciaux:
+        marquer_creances_modifiees(session, commerciaux)
+
+@db.event.listens_for(db.session, 'do_orm_execute')
+def _ecritures_en_masse_creances(etat):
+    # insert()/update()/delete() exécutés par la session (import, recalcul, remise à zéro)
+    if etat.is_insert or etat.is_update or etat.is_delete:
+        if getattr(etat.statement.table, 'name', None) == Creance.__tablename__:
+            marquer_creances_modifiees(etat.session)
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalider_cache_apres_commit(session):
+    portefeuilles = session.info.pop('creances_modifiees', None)
+    if portefeuilles:
+        invalider_cache_portefeuilles(portefeuilles)
+        publier_kpi(portefeuilles)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _oublier_ecritures_annulees(session):
+    session.info.pop('creances_modifiees', None)
+    session.info.pop('ecriture', None)
+
+@db.event.listens_for(db.session, 'after_flush')
+def _noter_ecriture(session, flush_context):
+    session.info['ecriture'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+def _lire_ses_ecritures(session):
+    """Après un commit, l'utilisateur relit la base principale (voir lecture_replique)."""
+    if session.info.pop('ecriture', False):
+        if has_request_context():
+            session_navigateur['derniere_ecriture'] = time.time()
+
+# ==================== PAGINATION PAR CURSEUR ====================
+# Colonnes triables de la liste : clé URL -> (expression, type de la valeur du curseur)
+COLONNES_TRI = {
+    'id': (Creance.id, 'int'),
+    'client': (Creance.client, 'str'),
+    'commercial': (Creance.commercial, 'str'),
+    'montant': (Creance.montant, 'float'),
+    'versement': (db.func.coalesce(Creance.versement, 0), 'float'),
+    'solde': (Creance.solde, 'float'),
+    'date_facturation': (Creance.date_facturation, 'date'),
+    'date_echeance': (db.func.coalesce(Creance.date_echeance, datetime(1900, 1, 1).date()), 'date'),
+    'statut': (db.func.coalesce(Creance.statut, ''), 'str'),
+    'date_creation': (Creance.date_creation, 'datetime'),
+}
+TRI_DEFAUT = 'date_creation'
+TAILLES_PAGE = (25, 50, 100, 250)
+
+def encoder_curseur(valeur, id):
+    if isinstance(valeur, (datetime, date)):
+        valeur = valeur.isoformat()
+    brut = json.dumps([valeur, id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(brut).decode().rstrip('=')
+
+def decoder_curseur(curseur, type_valeur):
+    """Retourne (valeur, id) ou None si le curseur est invalide."""
+    try:
+        brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4))
+        valeur, id = json.loads(brut)
+        if type_valeur == 'date':
+            valeur = date.fromisoformat(valeur)
+        elif type_valeur == 'datetime':
+            valeur = datetime.fromisoformat(valeur)
+        elif type_valeur == 'float':
+            valeur = float(valeur)
+        elif type_valeur == 'int':
+            valeur = int(valeur)
+        return valeur, int(id)
+    except (ValueError, TypeError):
+        return None
+
+def paginer_par_curseur(query, tri, ordre, par_page, curseur=None):
+    """Page de résultats triée sur (tri, id) à partir du curseur de la page précédente.
+
+    Retourne (lignes, curseur_suivant) ; curseur_suivant vaut None sur la dernière page.
+    """
+    colonne, type_valeur = COLONNES_TRI[tri]
+    descendant = ordre == 'desc'
+
+    if curseur:
+        position = decoder_curseur(curseur, type_valeur)
+        if position:
+            valeur, dernier_id = position
+            if descendant:
+                query = query.filter(db.or_(colonne < valeur, db.and_(colonne == valeur, Creance.id < dernier_id)))
+            else:
+                query = query.filter(db.or_(colonne > valeur, db.and_(colonne == valeur, Creance.id > dernier_id)))
+
+    if descendant:
+        query = query.order_by(colonne.desc(), Creance.id.desc())
+    else:
+        query = query.order_by(colonne.asc(), Creance.id.asc())
+
+    lignes = query.add_columns(colonne.label('_cle_tri')).limit(par_page + 1).all()
+    suivant = None
+    if len(lignes) > par_page:
+        lignes = lignes[:par_page]
+        dernier = lignes[-1]
+        suivant = encoder_curseur(dernier._cle_tri, dernier[0].id)
+    return [ligne[0] for ligne in lignes], suivant
+
+# ==================== RECHERCHE DES CLIENTS ====================
+SEUIL_SIMILARITE = 0.6
+
+def normaliser_nom(texte):
+    """Clé de recherche : majuscules, sans accents ni ponctuation, espaces réduits."""
+    if not texte:
+        return ''
+    sans_accents = ''.join(c for c in unicodedata.normalize('NFKD', str(texte)) if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^0-9A-Z]+', ' ', sans_accents.upper()).split())
+
+@db.event.listens_for(Creance, 'before_insert')
+@db.event.listens_for(Creance, 'before_update')
+def _maj_client_recherche(mapper, connection, creance):
+    creance.client_recherche = normaliser_nom(creance.client)
+
+@db.event.listens_for(Creance, 'after_insert')
+@db.event.listens_for(Creance, 'after_update')
+def _indexer_client(mapper, connection, creance):
+    deja_indexe = db.select(ClientRecherche.id).where(
+        ClientRecherche.cle == creance.client_recherche,
+        ClientRecherche.commercial == creance.commercial
+    ).exists()
+    connection.execute(
+        db.insert(ClientRecherche).from_select(
+            ['cle', 'client', 'commercial'],
+            db.select(db.literal(creance.client_recherche), db.literal(creance.client),
+                      db.literal(creance.commercial)).where(~deja_indexe)
+        )
+    )
+
+def synchroniser_index_clients():
+    """Resynchronise clients_recherche avec creances (après un import en masse par exemple)."""
+    deja_indexe = db.select(ClientRecherche.id).where(
+        ClientRecherche.cle == Creance.client_recherche,
+        ClientRecherche.commercial == Creance.commercial
+    ).exists()
+    nouveaux = db.select(Creance.client_recherche, db.func.min(Creance.client), Creance.commercial).where(
+        Creance.client_recherche.isnot(None), Creance.client_recherche != '', ~deja_indexe
+    ).group_by(Creance.client_recherche, Creance.commercial)
+    db.session.execute(db.insert(ClientRecherche).from_select(['cle', 'client', 'commercial'], nouveaux))
+    
+    a_des_creances = db.select(Creance.id).where(
+        Creance.client_recherche == ClientRecherche.cle,
+        Creance.commercial == ClientRecherche.commercial
+    ).exists()
+    db.session.execute(db.delete(ClientRecherche).where(~a_des_creances))
+    db.session.commit()
+
+def creer_index_recherche():
+    """Index trigrammes : pg_trgm (GIN) sur PostgreSQL, table FTS5 sur SQLite."""
+    dialecte = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialecte == 'postgresql':
+            connection.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            connection.execute(db.text(
+                'CREATE INDEX IF NOT EXISTS ix_clients_recherche_trgm '
+                'ON clients_recherche USING gin (cle gin_trgm_ops)'))
+        elif dialecte == 'sqlite':
+            try:
+                connection.execute(db.text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS clients_recherche_fts "
+                    "USING fts5(cle, content='clients_recherche', content_rowid='id', tokenize='trigram')"))
+            except Exception as e:
+                print(f"⚠️ FTS5 trigram indisponible, recherche par LIKE: {str(e)}")
+                return
+            connection.execute(db.text(
+                "CREATE TRIGGER IF NOT EXISTS clients_recherche_ai AFTER INSERT ON clients_recherche BEGIN "
+                "INSERT INTO clients_recherche_fts(rowid, cle) VALUES (new.id, new.cle); END"))
+            connection.execute(db.text(
+                "CREATE TRIGGER IF NOT EXISTS clients_recherche_ad AFTER DELETE ON clients_recherche BEGIN "
+                "INSERT INTO clients_recherche_fts(clients_recherche_fts, rowid, cle) VALUES ('delete', old.id, old.cle); END"))
+            connection.execute(db.text(
+                "CREATE TRIGGER IF NOT EXISTS clients_recherche_au AFTER UPDATE ON clients_recherche BEGIN "
+                "INSERT INTO clients_recherche_fts(clients_recherche_fts, rowid, cle) VALUES ('delete', old.id, old.cle); "
+                "INSERT INTO clients_recherche_fts(rowid, cle) VALUES (new.id, new.cle); END"))
+            connection.execute(db.text("INSERT INTO clients_recherche_fts(clients_recherche_fts) VALUES ('rebuild')"))
+
+def _fts_disponible():
+    return db.session.execute(db.text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'clients_recherche_fts'")).first() is not None
+
+def _score_nom(cle, cle_client):
+    """Similarité entre 0 et 1, tolérante aux fautes et à l'ordre des mots."""
+    if cle in cle_client:
+        return 1.0 if cle_client.startswith(cle) else 0.9
+    mots_client = cle_client.split()
+    scores = [max(difflib.SequenceMatcher(None, mot, mot_client).ratio() for mot_client in mots_client)
+              for mot in cle.split()]
+    return sum(scores) / len(scores)
+
+def rechercher_clients(terme, commercial=None, limite=10):
+    """Clients dont le nom ressemble à terme, du plus proche au plus éloigné."""
+    cle = normaliser_nom(terme)
+    if not cle:
+        return []
+    
+    if db.engine.dialect.name == 'postgresql':
+        score = db.func.word_similarity(cle, ClientRecherche.cle)
+        query = db.session.query(ClientRecherche.cle, ClientRecherche.client, ClientRecherche.commercial,
+                                 score.label('score')).filter(
+            db.or_(db.literal(cle).op('<%')(ClientRecherche.cle), ClientRecherche.cle.contains(cle))
+        )
+        if commercial:
+            query = query.filter(ClientRecherche.commercial == commercial)
+        lignes = query.order_by(score.desc(), ClientRecherche.cle).limit(limite).all()
+        return [{'cle': l.cle, 'client': l.client, 'commercial': l.commercial, 'score': round(l.score, 3)}
+                for l in lignes]
+    
+    query = db.session.query(ClientRecherche)
+    trigrammes = sorted({cle[i:i + 3] for i in range(len(cle) - 2)})
+    if trigrammes and db.engine.dialect.name == 'sqlite' and _fts_disponible():
+        expression = ' OR '.join('"%s"' % t.replace('"', '""') for t in trigrammes)
+        candidats = db.text("SELECT rowid FROM clients_recherche_fts WHERE clients_recherche_fts MATCH :expr "
+                            "ORDER BY rank LIMIT 200").bindparams(expr=expression)
+        query = query.filter(ClientRecherche.id.in_(candidats))
+    else:
+        query = query.filter(ClientRecherche.cle.contains(cle))
+    if commercial:
+        query = query.filter(ClientRecherche.commercial == commercial)
+    
+    resultats = []
+    for c in query.all():
+        score = _score_nom(cle, c.cle)
+        if score >= SEUIL_SIMILARITE:
+            resultats.append({'cle': c.cle, 'client': c.client, 'commercial': c.commercial, 'score': round(score, 3)})
+    resultats.sort(key=lambda r: (-r['score'], r['cle']))
+    return resultats[:limite]
+
+def cles_clients_correspondantes(terme, commercial=None):
+    """Sous-requête des clés clients contenant terme (sans accents ni casse)."""
+    query = db.select(ClientRecherche.cle).where(ClientRecherche.cle.contains(normaliser_nom(terme)))
+    if commercial:
+        query = query.where(ClientRecherche.commercial == commercial)
+    return query
+
+@app.cli.command('reindexer-clients')
+def reindexer_clients_command():
+    """Reconstruit l'index de recherche des clients."""
+    creer_index_recherche()
+    synchroniser_index_clients()
+    print(f"✅ {ClientRecherche.query.count()} clients indexés")
+
+# ==================== RÉFÉRENTIEL COMMERCIAUX / CLIENTS / MARCHÉS ====================
+def _separer_nom(nom_complet):
+    prenom, _, nom = nom_complet.strip().partition(' ')
+    return prenom, nom
+
+def _id_reference(connexion, table, criteres, valeurs=None):
+    """Identifiant de la ligne de table correspondant aux critères, créée si elle n'existe pas."""
+    id_ = connexion.execute(db.select(table.c.id).filter_by(**criteres)).scalar()
+    if id_ is None:
+        id_ = connexion.execute(db.insert(table).values(**criteres, **(valeurs or {}))).inserted_primary_key[0]
+    return id_
+
+def _id_marche(connexion, marche):
+    if not marche or not marche.strip():
+        return None
+    return _id_reference(connexion, Marche.__table__, {'cle': normaliser_nom(marche)}, {'nom': marche.strip()})
+
+def references_creance(connexion, commercial, client, marche):
+    """(commercial_id, client_id, marche_id, nom du client au référentiel) pour une saisie texte."""
+    commercial_id = _id_reference(connexion, Commercial.__table__, {'nom': commercial})
+    marche_id = _id_marche(connexion, marche)
+    clients = Client.__table__
+    cle = normaliser_nom(client)
+    existant = connexion.execute(
+        db.select(clients.c.id, clients.c.nom_complet).where(clients.c.commercial_id == commercial_id, clients.c.cle == cle)
+    ).first()
+    if existant:
+        return commercial_id, existant.id, marche_id, existant.nom_complet
+    
+    prenom, nom = _separer_nom(client)
+    client_id = connexion.execute(db.insert(clients).values(
+        commercial_id=commercial_id, marche_id=marche_id, nom_complet=client.strip(),
+        prenom=prenom, nom=nom, cle=cle
+    )).inserted_primary_key[0]
+    return commercial_id, client_id, marche_id, client.strip()
+
+@db.event.listens_for(Creance, 'before_insert')
+@db.event.listens_for(Creance, 'before_update')
+def _lier_references(mapper, connection, creance):
+    etat = db.inspect(creance)
+    modifie = any(etat.attrs[nom].history.has_changes() for nom in ('commercial', 'client', 'marche'))
+    if creance.client_id is not None and not modifie:
+        return
+    (creance.commercial_id, creance.client_id,
+     creance.marche_id, creance.client) = references_creance(connection, creance.commercial, creance.client, creance.marche)
+
+def attribuer_references(lignes):
+    """Version ensembliste pour l'import : ajoute commercial_id, client_id et marche_id aux lignes.
+    
+    Les commerciaux, marchés et clients inconnus sont créés ; le libellé client
+    prend le nom du référentiel pour que les variantes de saisie se regroupent.
+    """
+    import pandas as pd
+    
+    connexion = db.session.connection()
+    lignes = lignes.copy()
+    
+    ids_commerciaux = {nom: _id_reference(connexion, Commercial.__table__, {'nom': nom})
+                       for nom in lignes['commercial'].unique()}
+    ids_marches = {nom: _id_marche(connexion, nom) for nom in lignes['marche'].dropna().unique()}
+    # Entiers nullables (Int64) : un marché manquant ne transforme pas les id en flottants (1.0)
+    lignes['commercial_id'] = lignes['commercial'].map(ids_commerciaux).astype('Int64')
+    lignes['marche_id'] = lignes['marche'].map(ids_marches).astype('Int64')
+    
+    clients = Client.__table__
+    
+    def clients_connus():
+        requete = db.select(clients.c.commercial_id, clients.c.cle, clients.c.id, clients.c.nom_complet).where(
+            clients.c.commercial_id.in_(list(ids_commerciaux.values())))
+        return {(r.commercial_id, r.cle): (r.id, r.nom_complet) for r in connexion.execute(requete)}
+    
+    connus = clients_connus()
+    cles = list(zip(lignes['commercial_id'], lignes['client_recherche']))
+    nouveaux = {}
+    for (commercial_id, cle), client, marche_id in zip(cles, lignes['client'], lignes['marche_id']):
+        if (commercial_id, cle) not in connus and (commercial_id, cle) not in nouveaux:
+            prenom, nom = _separer_nom(client)
+            nouveaux[(commercial_id, cle)] = {'commercial_id': int(commercial_id),
+                                              'marche_id': None if marche_id is pd.NA else int(marche_id),
+                                              'nom_complet': client, 'prenom': prenom, 'nom': nom, 'cle': cle}
+    if nouveaux:
+        connexion.execute(db.insert(clients), list(nouveaux.values()))
+        connus = clients_connus()
+    
+    references = [connus[cle] for cle in cles]
+    lignes['client_id'] = pd.array([id_ for id_, _ in references], dtype='Int64')
+    lignes['client'] = [nom for _, nom in references]
+    return lignes
+
+def initialiser_referentiel():
+    """Charge les portefeuilles de départ (COMMERCIAUX_DATA) dans le référentiel, sans doublon."""
+    connexion = db.session.connection()
+    for nom_commercial, data in COMMERCIAUX_DATA.items():
+        commercial_id = _id_reference(connexion, Commercial.__table__, {'nom': nom_commercial})
+        for client in data['clients']:
+            nom_complet = f"{client['prenom']} {client['nom']}"
+            _id_reference(connexion, Client.__table__,
+                          {'commercial_id': commercial_id, 'cle': normaliser_nom(nom_complet)},
+                          {'nom_complet': nom_complet, 'prenom': client['prenom'], 'nom': client['nom'],
+                           'marche_id': _id_marche(connexion, client['marche']), 'contact': client['contact']})
+    db.session.commit()
+
+def _migration_referentiel():
+    for table in (Commercial.__table__, Marche.__table__, Client.__table__):
+        table.create(db.engine, checkfirst=True)
+    for colonne in ('commercial_id', 'client_id', 'marche_id'):
+        _ajouter_colonne(Creance.__table__, colonne)
+    _creer_index(Creance.__table__, 'ix_creances_commercial_id', 'ix_creances_client_id')
+    initialiser_referentiel()
+    
+    # Chaînes existantes -> clés : une passe par valeur distincte, puis un UPDATE corrélé
+    connexion = db.session.connection()
+    for (nom,) in db.session.query(Creance.commercial).distinct().all():
+        _id_reference(connexion, Commercial.__table__, {'nom': nom})
+    for (nom,) in db.session.query(Creance.marche).filter(Creance.marche.isnot(None)).distinct().all():
+        marche_id = _id_marche(connexion, nom)
+        if marche_id:
+            db.session.execute(db.update(Creance).where(Creance.marche == nom).values(marche_id=marche_id)
+                               .execution_options(synchronize_session=False))
+    db.session.execute(db.update(Creance).values(commercial_id=db.select(Commercial.id).where(
+        Commercial.nom == Creance.commercial).scalar_subquery()).execution_options(synchronize_session=False))
+    
+    couples = db.session.query(Creance.commercial_id, Creance.client_recherche, db.func.min(Creance.client),
+                               db.func.min(Creance.marche_id)).group_by(Creance.commercial_id, Creance.client_recherche).all()
+    for commercial_id, cle, client, marche_id in couples:
+        prenom, nom = _separer_nom(client)
+        _id_reference(connexion, Client.__table__, {'commercial_id': commercial_id, 'cle': cle},
+                      {'nom_complet': client.strip(), 'prenom': prenom, 'nom': nom, 'marche_id': marche_id})
+    db.session.execute(db.update(Creance).values(client_id=db.select(Client.id).where(
+        Client.commercial_id == Creance.commercial_id, Client.cle == Creance.client_recherche
+    ).scalar_subquery()).execution_options(synchronize_session=False))
+    db.session.commit()
+    
+    # client_balances passe d'une clé texte (client, commercial) à client_id
+    ClientBalance.__table__.drop(db.engine, checkfirst=True)
+    ClientBalance.__table__.create(db.engine)
+    reconstruire_soldes_clients()
+
+def noms_commerciaux():
+    return [nom for (nom,) in db.session.query(Commercial.nom).filter_by(actif=True).order_by(Commercial.id)]
+
+def referentiel_commerciaux(commercial=None):
+    """{commercial: {'clients': [{prenom, nom, marche, contact}]}} lu en une requête (forme de COMMERCIAUX_DATA)."""
+    query = db.session.query(Commercial.nom, Client.prenom, Client.nom, Client.nom_complet, Marche.nom, Client.contact)\
+        .outerjoin(Client, Client.commercial_id == Commercial.id)\
+        .outerjoin(Marche, Marche.id == Client.marche_id)\
+        .filter(Commercial.actif.is_(True))
+    if commercial:
+        query = query.filter(Commercial.nom == commercial)
+    
+    referentiel = {}
+    for nom_commercial, prenom, nom, nom_complet, marche, contact in query.order_by(Commercial.id, Client.id):
+        clients = referentiel.setdefault(nom_commercial, {'clients': []})['clients']
+        if nom_complet is not None:
+            clients.append({'prenom': prenom or '', 'nom': nom or nom_complet, 'marche': marche or '', 'contact': contact or ''})
+    return referentiel
+
+# ==================== SOLDES PAR CLIENT ====================
+# client_balances est recalculée pour les seuls clients touchés par une
+# écriture : une lecture indexée de leurs créances, pas un parcours complet.
+TAILLE_LOT_SOLDES = 500
+
+def _selection_soldes():
+    return db.select(
+        Creance.client_id,
+        db.func.min(Creance.commercial_id),
+        db.func.count(Creance.id),
+        db.func.coalesce(db.func.sum(Creance.montant), 0),
+        db.func.coalesce(db.func.sum(Creance.versement), 0),
+        db.func.coalesce(db.func.sum(Creance.solde), 0),
+        db.func.max(Creance.date_echeance),
+        db.literal(datetime.now(), db.DateTime),
+    ).where(Creance.client_id.isnot(None)).group_by(Creance.client_id)
+
+def rafraichir_soldes_clients(connexion, client_ids):
+    """Recalcule les lignes de client_balances des clients donnés.
+    
+    Appelée automatiquement après chaque flush de Creance ; les écritures en masse
+    (import, suppressions par lot) l'appellent avec les clients qu'elles touchent.
+    """
+    table = ClientBalance.__table__
+    client_ids = [id_ for id_ in client_ids if id_ is not None]
+    for debut in range(0, len(client_ids), TAILLE_LOT_SOLDES):
+        lot = client_ids[debut:debut + TAILLE_LOT_SOLDES]
+        connexion.execute(db.delete(table).where(table.c.client_id.in_(lot)))
+        connexion.execute(db.insert(table).from_select(
+            [c.name for c in table.columns],
+            _selection_soldes().where(Creance.client_id.in_(lot))
+        ))
+
+def reconstruire_soldes_clients():
+    """Reconstruction complète de client_balances (réparation)."""
+    table = ClientBalance.__table__
+    with db.engine.begin() as connexion:
+        sans_delai_requetes(connexion)
+        connexion.execute(db.delete(table))
+        connexion.execute(db.insert(table).from_select([c.name for c in table.columns], _selection_soldes()))
+        return connexion.execute(db.select(db.func.count()).select_from(table)).scalar()
+
+def _clients_modifies(objet):
+    """client_id de la créance avant et après modification."""
+    return {objet.client_id, *db.inspect(objet).attrs.client_id.history.deleted}
+
+@db.event.listens_for(db.session, 'after_flush')
+def _maintenir_soldes_clients(session, flush_context):
+    client_ids = set()
+    for objet in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(objet, Creance):
+            client_ids |= _clients_modifies(objet)
+    if client_ids:
+        rafraichir_soldes_clients(session.connection(), client_ids)
+
+@app.cli.command('reconstruire-soldes')
+def reconstruire_soldes_command():
+    """Reconstruit entièrement la table client_balances à partir des créances."""
+    debut = time.perf_counter()
+    nb = reconstruire_soldes_clients()
+    print(f"✅ {nb} soldes clients reconstruits en {time.perf_counter() - debut:.2f}s")
+
+# ==================== PAIEMENTS ET INSTANTANÉS ====================
+# Creance.versement est le cumul du journal paiements ; soldes_quotidiens garde
+# l'encours de chaque fin de journée pour les tendances sans rejouer l'historique.
+def enregistrer_paiement(creance, montant, saisi_par, date_paiement=None):
+    """Ajoute un versement au journal et met à jour le cumul et le solde de la créance."""
+    creance.versement = (creance.versement or 0) + montant
+    creance.solde = creance.montant - creance.versement
+    if creance.id is None:
+        db.session.add(creance)
+        db.session.flush()
+    db.session.add(Paiement(
+        creance_id=creance.id,
+        commercial_id=creance.commercial_id,
+        montant=montant,
+        date_paiement=date_paiement or datetime.now(),
+        saisi_par=saisi_par
+    ))
+
+def journaliser_versements_initiaux(*filtres):
+    """Versements déjà portés par des créances (import, reprise de l'existant) : un paiement chacun, daté de la création."""
+    selection = db.select(Creance.id, Creance.commercial_id, Creance.versement,
+                          db.func.coalesce(Creance.date_creation, db.func.current_timestamp()), Creance.created_by)\
+        .where(Creance.versement > 0, *filtres)
+    db.session.execute(db.insert(Paiement.__table__).from_select(
+        ['creance_id', 'commercial_id', 'montant', 'date_paiement', 'saisi_par'], selection))
+
+def _migration_paiements():
+    Paiement.__table__.create(db.engine, checkfirst=True)
+    SoldeQuotidien.__table__.create(db.engine, checkfirst=True)
+    deja_journalisees = db.select(Paiement.creance_id).where(Paiement.creance_id.isnot(None))
+    journaliser_versements_initiaux(Creance.id.notin_(deja_journalisees))
+    db.session.commit()
+
+def prendre_instantane(jour=None):
+    """Enregistre (ou remplace) l'instantané du jour : encours actuels et paiements encaissés ce jour-là.
+    
+    Lancé par le planificateur juste après minuit pour la veille, ou par 'flask instantane-soldes'.
+    """
+    jour = jour or date.today()
+    en_retard = Creance.situation_paiement == 'EN RETARD'
+    encours = db.session.execute(db.select(
+        Creance.commercial_id,
+        db.func.coalesce(db.func.sum(Creance.solde), 0),
+        db.func.coalesce(db.func.sum(db.case((en_retard, Creance.solde), else_=0)), 0),
+        db.func.sum(db.case((Creance.solde > 0, 1), else_=0)),
+    ).where(Creance.commercial_id.isnot(None)).group_by(Creance.commercial_id)).all()
+    recouvre = dict(db.session.execute(db.select(
+        Paiement.commercial_id, db.func.sum(Paiement.montant)
+    ).where(
+        Paiement.date_paiement >= datetime.combine(jour, datetime.min.time()),
+        Paiement.date_paiement < datetime.combine(jour + timedelta(days=1), datetime.min.time())
+    ).group_by(Paiement.commercial_id)).all())
+    
+    lignes = {}
+    for commercial_id, solde, retard, ouvertes in encours:
+        lignes[commercial_id] = {'jour': jour, 'commercial_id': commercial_id, 'encours': solde,
+                                 'montant_retard': retard, 'nb_ouvertes': ouvertes or 0, 'recouvre': 0}
+    for commercial_id, montant in recouvre.items():
+        if commercial_id is not None:
+            lignes.setdefault(commercial_id, {'jour': jour, 'commercial_id': commercial_id, 'encours': 0,
+                                              'montant_retard': 0, 'nb_ouvertes': 0})['recouvre'] = montant
+    
+    db.session.execute(db.delete(SoldeQuotidien).where(SoldeQuotidien.jour == jour))
+    if lignes:
+        db.session.execute(db.insert(SoldeQuotidien), list(lignes.values()))
+    db.session.commit()
+    return len(lignes)
+
+def recouvrements_semaine(commercial=None, aujourdhui=None):
+    """Encaissements de la semaine en cours comparés à la même période de la semaine précédente.
+    
+    Les jours clos sont lus dans soldes_quotidiens ; seul le jour courant est lu dans le journal.
+    """
+    aujourdhui = aujourdhui or date.today()
+    debut = aujourdhui - timedelta(days=aujourdhui.weekday())
+    
+    def instantanes(du, au):
+        query = db.session.query(db.func.coalesce(db.func.sum(SoldeQuotidien.recouvre), 0))\
+            .filter(SoldeQuotidien.jour >= du, SoldeQuotidien.jour <= au)
+        if commercial:
+            query = query.join(Commercial, Commercial.id == SoldeQuotidien.commercial_id).filter(Commercial.nom == commercial)
+        return query.scalar()
+    
+    du_jour = db.session.query(db.func.coalesce(db.func.sum(Paiement.montant), 0))\
+        .filter(Paiement.date_paiement >= datetime.combine(aujourdhui, datetime.min.time()))
+    if commercial:
+        du_jour = du_jour.join(Commercial, Commercial.id == Paiement.commercial_id).filter(Commercial.nom == commercial)
+    
+    semaine = instantanes(debut, aujourdhui - timedelta(days=1)) + du_jour.scalar()
+    precedente = instantanes(debut - timedelta(days=7), aujourdhui - timedelta(days=7))
+    return {
+        'semaine': semaine,
+        'semaine_precedente': precedente,
+        'evolution': ((semaine - precedente) / precedente * 100) if precedente else None
+    }
+
+@app.cli.command('instantane-soldes')
+@click.option('--date', 'jour', default=None, help='Jour de l\'instantané (AAAA-MM-JJ), aujourd\'hui par défaut')
+def instantane_soldes_command(jour):
+    """Enregistre l'instantané des encours par commercial."""
+    jour = datetime.strptime(jour, '%Y-%m-%d').date() if jour else date.today()
+    nb = prendre_instantane(jour)
+    print(f"✅ Instantané du {jour.strftime('%d/%m/%Y')}: {nb} commerciaux")
+
+# ==================== ARCHIVAGE DES CRÉANCES SOLDÉES ====================
+# Les créances payées depuis longtemps passent dans creances_archive : tableaux
+# de bord, listes et soldes clients ne lisent que creances. L'archive n'est
+# relue qu'à la demande (detail_client et exports avec ?archive=1).
+ARCHIVE_MOIS = int(os.environ.get('ARCHIVE_MOIS', 12))
+
+def date_limite_archivage(mois, aujourdhui=None):
+    """Même jour, mois mois plus tôt (ramené au dernier jour du mois si besoin)."""
+    aujourdhui = aujourdhui or date.today()
+    annee, mois_index = divmod(aujourdhui.year * 12 + aujourdhui.month - 1 - mois, 12)
+    return date(annee, mois_index + 1, min(aujourdhui.day, calendar.monthrange(annee, mois_index + 1)[1]))
+
+def filtres_archivables(mois, commercial=None, aujourdhui=None):
+    """Créances soldées facturées avant la date limite."""
+    filtres = [Creance.solde <= 0, Creance.date_facturation < date_limite_archivage(mois, aujourdhui)]
+    if commercial:
+        filtres.append(Creance.commercial == commercial)
+    return filtres
+
+def rattacher_paiements_archives(*filtres):
+    """Reporte les paiements sélectionnés sur la ligne d'archive la plus récente de leur créance.
+
+    creance_id est remis à NULL explicitement : la suppression de la créance ne
+    dépend plus de ON DELETE SET NULL (PostgreSQL) ni d'un id réattribué (SQLite).
+    """
+    archive = db.select(db.func.max(CreanceArchive.id))\
+        .where(CreanceArchive.creance_id == Paiement.creance_id).scalar_subquery()
+    db.session.execute(
+        db.update(Paiement).where(*filtres, db.exists().where(CreanceArchive.creance_id == Paiement.creance_id))
+        .values(creance_archive_id=archive, creance_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+def deplacer_vers_archive(filtres, archive_par=None):
+    """INSERT ... SELECT dans creances_archive puis DELETE, sans commit : (nombre de créances, clients touchés).
+
+    Les paiements des créances déplacées sont rattachés à leur ligne d'archive avant le DELETE.
+    """
+    colonnes = [c.name for c in Creance.__table__.columns if c.name != 'id']
+    client_ids = [id_ for (id_,) in db.session.execute(db.select(Creance.client_id).where(*filtres).distinct())]
+    nb = db.session.execute(db.insert(CreanceArchive).from_select(
+        ['creance_id', *colonnes, 'date_archivage', 'archive_par'],
+        db.select(Creance.id, *[Creance.__table__.c[nom] for nom in colonnes],
+                  db.literal(datetime.now(), db.DateTime), db.literal(archive_par, db.String))
+        .where(*filtres)
+    )).rowcount
+    if nb:
+        archivees = db.select(CreanceArchive.creance_id)
+        rattacher_paiements_archives(Paiement.creance_id.in_(db.select(Creance.id).where(*filtres, Creance.id.in_(archivees))))
+        db.session.execute(db.delete(Creance).where(*filtres, Creance.id.in_(archivees))
+                           .execution_options(synchronize_session=False))
+    return nb, client_ids
+
+def archiver_creances(mois=ARCHIVE_MOIS, commercial=None, archive_par=None, aujourdhui=None):
+    """Déplace les créances archivables dans creances_archive, en une transaction.
+
+    INSERT ... SELECT puis DELETE côté base, sans charger de lignes ; les soldes
+    clients des clients touchés sont recalculés dans la même transaction.
+    """
+    try:
+        connexion = db.session.connection()
+        sans_delai_requetes(connexion)
+        nb, client_ids = deplacer_vers_archive(filtres_archivables(mois, commercial, aujourdhui), archive_par)
+        if nb:
+            rafraichir_soldes_clients(connexion, client_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if nb:
+        synchroniser_index_clients()
+    return {'archivees': nb, 'clients': len(client_ids), 'date_limite': date_limite_archivage(mois, aujourdhui)}
+
+@app.cli.command('archiver-creances')
+@click.option('--mois', default=ARCHIVE_MOIS, show_default=True, help='Ancienneté minimale (mois depuis la facturation)')
+@click.option('--commercial', default=None, help='Limiter à un commercial')
+@click.option('--simulation', is_flag=True, help='Compter les créances archivables sans les déplacer')
+def archiver_creances_command(mois, commercial, simulation):
+    """Archive les créances soldées anciennes (tâche planifiable, ex. cron mensuel)."""
+    if simulation:
+        nb = db.session.query(db.func.count(Creance.id)).filter(*filtres_archivables(mois, commercial)).scalar()
+        print(f"   {nb} créances soldées facturées avant le {date_limite_archivage(mois).strftime('%d/%m/%Y')}")
+        return
+    debut = time.perf_counter()
+    resultat = archiver_creances(mois, commercial, archive_par='cli')
+    print(f"✅ {resultat['archivees']} créances archivées ({resultat['clients']} clients, facturées avant le "
+          f"{resultat['date_limite'].strftime('%d/%m/%Y')}) en {time.perf_counter() - debut:.2f}s")
+
+# ==================== ACTIONS EN MASSE ====================
+# Page Réinitialisation : chaque action est une instruction ensembliste (UPDATE,
+# DELETE, INSERT ... SELECT) sur le portefeuille, exécutée avec son entrée du
+# journal actions_admin dans une seule transaction.
+ACTIONS_MASSE = {
+    'solder_toutes': 'Solder les créances',
+    'supprimer_soldees': 'Supprimer les créances soldées',
+    'supprimer_toutes': 'Supprimer toutes les créances',
+    'archiver_soldees': 'Archiver les créances soldées',
+    'reassigner': 'Réaffecter le portefeuille',
+}
+
+CODE_CONFIRMATION_VALIDITE = int(os.environ.get('CODE_CONFIRMATION_VALIDITE', 5))  # minutes
+RAISON_LONGUEUR_MIN = 10
+
+def code_confirmation(instant=None):
+    """Code affiché sur la page Réinitialisation : 'SOC' suivi de l'heure (HHMM)."""
+    return 'SOC' + (instant or datetime.now()).strftime('%H%M')
+
+def codes_confirmation_valides(instant=None):
+    """Codes acceptés : celui de la minute courante et des CODE_CONFIRMATION_VALIDITE minutes précédentes."""
+    instant = instant or datetime.now()
+    return {code_confirmation(instant - timedelta(minutes=n)) for n in range(CODE_CONFIRMATION_VALIDITE + 1)}
+
+def filtres_portefeuille(commercial):
+    """Créances d'un commercial, ou de tous avec 'TOUS'."""
+    return [] if commercial in (None, 'TOUS') else [Creance.commercial == commercial]
+
+def statistiques_reset(commercial, mois=ARCHIVE_MOIS):
+    """Compteurs de la page Réinitialisation en une requête COUNT/SUM."""
+    archivable = db.and_(*filtres_archivables(mois))
+    ligne = db.session.query(
+        db.func.count(Creance.id).label('count'),
+        db.func.coalesce(db.func.sum(db.case((Creance.solde <= 0, 1), else_=0)), 0).label('soldees'),
+        db.func.coalesce(db.func.sum(Creance.montant), 0).label('montant_total'),
+        db.func.coalesce(db.func.sum(Creance.solde), 0).label('montant_solde'),
+        db.func.coalesce(db.func.sum(db.case((archivable, 1), else_=0)), 0).label('archivables'),
+    ).filter(*filtres_portefeuille(commercial)).one()
+    return dict(ligne._mapping)
+
+def solder_en_masse(filtres, saisi_par):
+    """Verse le solde restant de chaque créance ouverte : une ligne de paiement chacune, puis un UPDATE."""
+    ouvertes = [*filtres, Creance.solde > 0]
+    client_ids = [id_ for (id_,) in db.session.execute(db.select(Creance.client_id).where(*ouvertes).distinct())]
+    db.session.execute(db.insert(Paiement.__table__).from_select(
+        ['creance_id', 'commercial_id', 'montant', 'date_paiement', 'saisi_par'],
+        db.select(Creance.id, Creance.commercial_id, Creance.solde,
+                  db.literal(datetime.now(), db.DateTime), db.literal(saisi_par, db.String)).where(*ouvertes)
+    ))
+    nb = db.session.execute(
+        db.update(Creance).where(*ouvertes)
+        .values(versement=Creance.montant, solde=0, statut='PAYE', situation_paiement='SOLDE', jours_retard=0)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return nb, client_ids
+
+def detacher_paiements(*filtres):
+    """Paiements des créances sélectionnées : creance_id passe à NULL, à appeler avant leur DELETE.
+
+    SQLite n'applique pas ON DELETE SET NULL et réattribue le plus grand id
+    supprimé : sans cela, une nouvelle créance hériterait de ces paiements.
+    """
+    db.session.execute(
+        db.update(Paiement).where(Paiement.creance_id.in_(db.select(Creance.id).where(*filtres)))
+        .values(creance_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+def supprimer_en_masse(filtres, action_id):
+    """Copie les créances dans creances_supprimees (audit) puis les supprime."""
+    colonnes = [c.name for c in CreanceSupprimee.__table__.columns if c.name not in ('id', 'action_id', 'creance_id')]
+    client_ids = [id_ for (id_,) in db.session.execute(db.select(Creance.client_id).where(*filtres).distinct())]
+    db.session.execute(db.insert(CreanceSupprimee).from_select(
+        ['action_id', 'creance_id', *colonnes],
+        db.select(db.literal(action_id, db.Integer), Creance.id, *[Creance.__table__.c[nom] for nom in colonnes])
+        .where(*filtres)
+    ))
+    detacher_paiements(*filtres)
+    nb = db.session.execute(
+        db.delete(Creance).where(*filtres).execution_options(synchronize_session=False)
+    ).rowcount
+    return nb, client_ids
+
+def reassigner_en_masse(commercial, cible):
+    """Transfère les créances de commercial à cible.
+
+    Les fiches clients manquantes chez cible sont copiées (même clé normalisée),
+    puis un seul UPDATE rattache chaque créance à la fiche correspondante.
+    """
+    if commercial in (None, 'TOUS') or not cible or cible == commercial:
+        raise ValueError('Choisissez un commercial d\'origine et un commercial de destination différents')
+    source = Commercial.query.filter_by(nom=commercial).first()
+    destination = Commercial.query.filter_by(nom=cible).first()
+    if not source or not destination:
+        raise ValueError(f'Commercial inconnu : {commercial if not source else cible}')
+    
+    cles_destination = db.select(Client.cle).where(Client.commercial_id == destination.id)
+    db.session.execute(db.insert(Client).from_select(
+        ['commercial_id', 'marche_id', 'nom_complet', 'prenom', 'nom', 'cle', 'contact'],
+        db.select(db.literal(destination.id, db.Integer), Client.marche_id, Client.nom_complet,
+                  Client.prenom, Client.nom, Client.cle, Client.contact)
+        .where(Client.commercial_id == source.id, Client.cle.notin_(cles_destination))
+    ))
+    
+    filtres = filtres_portefeuille(commercial)
+    anciens = [id_ for (id_,) in db.session.execute(db.select(Creance.client_id).where(*filtres).distinct())]
+    fiche_source = db.aliased(Client)
+    fiche_destination = db.aliased(Client)
+    nouvelle_fiche = db.select(fiche_destination.id)\
+        .join(fiche_source, fiche_source.cle == fiche_destination.cle)\
+        .where(fiche_source.id == Creance.client_id, fiche_destination.commercial_id == destination.id)\
+        .scalar_subquery()
+    nb = db.session.execute(
+        db.update(Creance).where(*filtres)
+        .values(commercial=destination.nom, commercial_id=destination.id, client_id=nouvelle_fiche)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    nouveaux = [id_ for (id_,) in db.session.execute(
+        db.select(Creance.client_id).where(Creance.commercial_id == destination.id).distinct())]
+    return nb, anciens + nouveaux
+
+def executer_action_masse(action, commercial, admin, raison, cible=None, mois=ARCHIVE_MOIS):
+    """Exécute une action de ACTIONS_MASSE et la journalise, dans une seule transaction.
+
+    Retourne l'entrée du journal (lignes touchées et durée en millisecondes).
+    """
+    if action not in ACTIONS_MASSE:
+        raise ValueError(f'Action inconnue : {action}')
+    debut = time.perf_counter()
+    filtres = filtres_portefeuille(commercial)
+    try:
+        connexion = db.session.connection()
+        sans_delai_requetes(connexion)
+        journal = ActionAdmin(admin=admin, commercial=commercial, action=action, cible=cible, raison=raison)
+        db.session.add(journal)
+        db.session.flush()
+        
+        if action == 'solder_toutes':
+            nb, client_ids = solder_en_masse(filtres, admin)
+        elif action == 'supprimer_soldees':
+            nb, client_ids = supprimer_en_masse([*filtres, Creance.solde <= 0], journal.id)
+        elif action == 'supprimer_toutes':
+            nb, client_ids = supprimer_en_masse(filtres, journal.id)
+        elif action == 'archiver_soldees':
+            journal.cible = f'{mois} mois'
+            nb, client_ids = deplacer_vers_archive(
+                filtres_archivables(mois, None if commercial == 'TOUS' else commercial), admin)
+        else:
+            nb, client_ids = reassigner_en_masse(commercial, cible)
+        
+        rafraichir_soldes_clients(connexion, client_ids)
+        journal.lignes = nb
+        journal.duree_ms = int((time.perf_counter() - debut) * 1000)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if nb and action != 'solder_toutes':
+        synchroniser_index_clients()
+    return journal
+
+# ==================== BALANCE ÂGÉE ====================
+# Répartition des soldes ouverts par ancienneté de l'échéance, calculée à la
+# volée depuis date_echeance (jours_retard n'est à jour qu'après le recalcul nocturne).
+TRANCHES_AGE = [
+    ('non_echu', 'Non échu'),
+    ('j1_30', '1-30 jours'),
+    ('j31_60', '31-60 jours'),
+    ('j61_90', '61-90 jours'),
+    ('plus_90', '> 90 jours'),
+]
+AXES_BALANCE_AGEE = {
+    'commercial': 'Commercial',
+    'marche': 'Marché',
+    'client': 'Client',
+}
+
+def conditions_tranches_age(aujourdhui):
+    echeance = Creance.date_echeance
+    non_echu = db.or_(echeance.is_(None), echeance >= aujourdhui)
+    return {
+        'non_echu': non_echu,
+        'j1_30': db.and_(echeance < aujourdhui, echeance >= aujourdhui - timedelta(days=30)),
+        'j31_60': db.and_(echeance < aujourdhui - timedelta(days=30), echeance >= aujourdhui - timedelta(days=60)),
+        'j61_90': db.and_(echeance < aujourdhui - timedelta(days=60), echeance >= aujourdhui - timedelta(days=90)),
+        'plus_90': echeance < aujourdhui - timedelta(days=90),
+    }
+
+def balance_agee(axe='commercial', commercial=None, aujourdhui=None):
+    """Matrice axe x tranche d'âge des soldes ouverts, en un seul GROUP BY."""
+    aujourdhui = aujourdhui or date.today()
+    conditions = conditions_tranches_age(aujourdhui)
+    montants = [db.func.coalesce(db.func.sum(db.case((conditions[code], Creance.solde), else_=0)), 0).label(code)
+                for code, _ in TRANCHES_AGE]
+    mesures = montants + [db.func.count(Creance.id).label('nb'),
+                          db.func.coalesce(db.func.sum(Creance.solde), 0).label('total')]
+    
+    if axe == 'marche':
+        libelles = [db.func.coalesce(Marche.nom, 'Non renseigné').label('libelle')]
+        groupes = [Marche.id, Marche.nom]
+    elif axe == 'client':
+        libelles = [Client.nom_complet.label('libelle'), Commercial.nom.label('commercial')]
+        groupes = [Client.id, Client.nom_complet, Commercial.nom]
+    else:
+        libelles = [Commercial.nom.label('libelle')]
+        groupes = [Commercial.id, Commercial.nom]
+    
+    query = db.select(*libelles, *mesures)\
+        .join(Commercial, Commercial.id == Creance.commercial_id)\
+        .where(Creance.solde > 0)
+    if axe == 'marche':
+        query = query.outerjoin(Marche, Marche.id == Creance.marche_id)
+    elif axe == 'client':
+        query = query.join(Client, Client.id == Creance.client_id)
+    if commercial:
+        query = query.where(Commercial.nom == commercial)
+    query = query.group_by(*groupes).order_by(db.desc('total'))
+    
+    lignes = [dict(ligne) for ligne in db.session.execute(query).mappings()]
+    totaux = {code: sum(l[code] for l in lignes) for code in [c for c, _ in TRANCHES_AGE] + ['nb', 'total']}
+    return {
+        'axe': axe,
+        'date': aujourdhui,
+        'tranches': TRANCHES_AGE,
+        'lignes': lignes,
+        'totaux': totaux
+    }
+
+def construire_balance_agee_excel(resultat, sortie):
+    """Classeur de la balance âgée, écrit à partir du résultat agrégé de balance_agee()."""
+    from openpyxl import Workbook
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet('Balance âgée')
+    entetes = [AXES_BALANCE_AGEE[resultat['axe']]]
+    if resultat['axe'] == 'client':
+        entetes.append('Commercial')
+    entetes += [libelle for _, libelle in resultat['tranches']] + ['Total (FCFA)', 'Nombre de créances']
+    feuille.append(entetes)
+    
+    codes = [code for code, _ in resultat['tranches']]
+    for ligne in resultat['lignes']:
+        valeurs = [ligne['libelle']] + ([ligne['commercial']] if resultat['axe'] == 'client' else [])
+        feuille.append(valeurs + [ligne[code] for code in codes] + [ligne['total'], ligne['nb']])
+    totaux = resultat['totaux']
+    feuille.append(['TOTAL'] + ([''] if resultat['axe'] == 'client' else [])
+                   + [totaux[code] for code in codes] + [totaux['total'], totaux['nb']])
+    classeur.save(sortie)
+
+# ==================== DONNÉES DES GRAPHIQUES ====================
+# Séries agrégées servies en JSON au tableau de bord : la page ne contient plus
+# les données, le navigateur les charge en parallèle et les revalide par ETag.
+GRAPHIQUES_MAX_AGE = 60
+
+def _expression_mois(colonne):
+    if db.engine.dialect.name == 'sqlite':
+        return db.func.strftime('%Y-%m', colonne)
+    return db.func.to_char(colonne, 'YYYY-MM')
+
+def serie_performance(commercial=None):
+    stats = statistiques_portefeuille(commercial)['par_commercial']
+    return {
+        'labels': list(stats.keys()),
+        'total': [s['total'] for s in stats.values()],
+        'retard': [s['retard'] for s in stats.values()],
+        'solde': [s['solde'] for s in stats.values()],
+    }
+
+def serie_repartition_statut(commercial=None):
+    query = db.session.query(Creance.statut, db.func.count(Creance.id), db.func.coalesce(db.func.sum(Creance.solde), 0))
+    if commercial:
+        query = query.filter(Creance.commercial == commercial)
+    lignes = query.group_by(Creance.statut).order_by(Creance.statut).all()
+    return {
+        'labels': [statut for statut, _, _ in lignes],
+        'nombre': [nombre for _, nombre, _ in lignes],
+        'solde': [solde for _, _, solde in lignes],
+    }
+
+def serie_top_retards(commercial=None, limite=5):
+    return [{'id': r.id, 'client': r.client, 'commercial': r.commercial, 'solde': r.solde, 'jours_retard': r.jours_retard or 0}
+            for r in top_retards(commercial, limite)]
+
+def serie_tendance_mensuelle(commercial=None, nb_mois=12, aujourdhui=None):
+    """Montants facturés (date de facturation) et recouvrés (journal des paiements) par mois."""
+    aujourdhui = aujourdhui or date.today()
+    mois = []
+    annee, numero = aujourdhui.year, aujourdhui.month
+    for _ in range(nb_mois):
+        mois.insert(0, f'{annee:04d}-{numero:02d}')
+        annee, numero = (annee - 1, 12) if numero == 1 else (annee, numero - 1)
+    debut = date(int(mois[0][:4]), int(mois[0][5:]), 1)
+    
+    mois_facture = _expression_mois(Creance.date_facturation)
+    facture = db.session.query(mois_facture, db.func.sum(Creance.montant)).filter(Creance.date_facturation >= debut)
+    if commercial:
+        facture = facture.filter(Creance.commercial == commercial)
+    facture = dict(facture.group_by(mois_facture).all())
+    
+    mois_paiement = _expression_mois(Paiement.date_paiement)
+    recouvre = db.session.query(mois_paiement, db.func.sum(Paiement.montant))\
+        .filter(Paiement.date_paiement >= datetime.combine(debut, datetime.min.time()))
+    if commercial:
+        recouvre = recouvre.join(Commercial, Commercial.id == Paiement.commercial_id).filter(Commercial.nom == commercial)
+    recouvre = dict(recouvre.group_by(mois_paiement).all())
+    
+    return {
+        'labels': mois,
+        'facture': [facture.get(m) or 0 for m in mois],
+        'recouvre': [recouvre.get(m) or 0 for m in mois],
+    }
+
+SERIES_GRAPHIQUES = {
+    'performance': serie_performance,
+    'repartition-statut': serie_repartition_statut,
+    'top-retards': serie_top_retards,
+    'tendance-mensuelle': serie_tendance_mensuelle,
+}
+
+def reponse_graphique(donnees):
+    """Réponse JSON avec ETag (contenu) et Cache-Control privé : 304 si le navigateur a déjà la série."""
+    reponse = jsonify(donnees)
+    reponse.set_etag(hashlib.md5(reponse.get_data()).hexdigest())
+    reponse.cache_control.private = True
+    reponse.cache_control.max_age = GRAPHIQUES_MAX_AGE
+    return reponse.make_conditional(request)
+
+# ==================== INDICATEURS EN DIRECT (SSE) ====================
+# Les tableaux de bord ouverts s'abonnent à /api/kpi/flux. Chaque commit touchant des
+# créances (hook after_commit) réveille les abonnés des portefeuilles concernés, qui
+# relisent les indicateurs via en_cache (un seul calcul par portefeuille) et ne
+# reçoivent que les valeurs qui ont changé.
+# Un flux se ferme après KPI_DUREE_FLUX secondes, sous le timeout des workers
+# synchrones de gunicorn (30 s) ; le navigateur le rouvre après KPI_RECONNEXION
+# secondes (champ retry) en renvoyant le dernier id reçu, une empreinte des
+# indicateurs : rien n'est renvoyé s'ils n'ont pas changé entre-temps.
+KPI_CANAL = 'kpi'
+KPI_BATTEMENT = int(os.environ.get('KPI_BATTEMENT', 10))  # secondes entre deux commentaires keep-alive
+KPI_DUREE_FLUX = int(os.environ.get('KPI_DUREE_FLUX', 25))  # durée maximale d'une connexion
+KPI_RECONNEXION = int(os.environ.get('KPI_RECONNEXION', 5))  # secondes avant réouverture par le navigateur
+CHAMPS_KPI = ('total_creances', 'total_versement', 'total_solde', 'montant_retard', 'nb_retard', 'nb_en_cours', 'tpar')
+
+_abonnes_kpi = {}  # portefeuille ('TOUS' ou nom du commercial) -> files des connexions ouvertes
+_verrou_abonnes_kpi = threading.Lock()
+_ecoute_kpi_demarree = False
+
+def indicateurs_kpi(commercial=None):
+    """Indicateurs affichés sur l'accueil, lus dans les mêmes entrées de cache que les pages."""
+    stats = en_cache('statistiques', commercial, lambda: statistiques_portefeuille(commercial))
+    repartition = en_cache('graphique_repartition_statut', commercial, lambda: serie_repartition_statut(commercial))
+    indicateurs = {champ: stats[champ] for champ in CHAMPS_KPI}
+    indicateurs['par_statut'] = dict(zip(repartition['labels'], repartition['nombre']))
+    return indicateurs
+
+def empreinte_kpi(indicateurs):
+    return hashlib.sha1(json.dumps(indicateurs, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _reveiller_abonnes_kpi(portefeuilles):
+    tous = '*' in portefeuilles
+    with _verrou_abonnes_kpi:
+        files = [f for portefeuille, abonnes in _abonnes_kpi.items()
+                 if tous or portefeuille == 'TOUS' or portefeuille in portefeuilles
+                 for f in abonnes]
+    for file in files:
+        try:
+            file.put_nowait(True)
+        except queue.Full:
+            pass  # un réveil est déjà en attente : les commits rapprochés sont regroupés
+
+def publier_kpi(portefeuilles):
+    """Notifie les abonnés SSE ; via Redis quand le cache est partagé entre workers."""
+    if isinstance(cache_resultats, CacheRedis):
+        cache_resultats.publier(KPI_CANAL, json.dumps(sorted(portefeuilles)))
+    else:
+        _reveiller_abonnes_kpi(portefeuilles)
+
+def abonner_kpi(commercial):
+    global _ecoute_kpi_demarree
+    file = queue.Queue(maxsize=1)
+    with _verrou_abonnes_kpi:
+        _abonnes_kpi.setdefault(commercial or 'TOUS', set()).add(file)
+        demarrer_ecoute = isinstance(cache_resultats, CacheRedis) and not _ecoute_kpi_demarree
+        _ecoute_kpi_demarree = _ecoute_kpi_demarree or demarrer_ecoute
+    if demarrer_ecoute:
+        cache_resultats.ecouter(KPI_CANAL, lambda message: _reveiller_abonnes_kpi(set(json.loads(message))))
+    return file
+
+def desabonner_kpi(commercial, file):
+    with _verrou_abonnes_kpi:
+        abonnes = _abonnes_kpi.get(commercial or 'TOUS', set())
+        abonnes.discard(file)
+        if not abonnes:
+            _abonnes_kpi.pop(commercial or 'TOUS', None)
+
+def evenement_sse(nom, donnees, identifiant):
+    return f'event: {nom}\nid: {identifiant}\ndata: {json.dumps(donnees, default=str)}\n\n'
+
+def flux_evenements_kpi(commercial, file, dernier_id=None, duree=None):
+    """Indicateurs complets à l'ouverture (sauf si dernier_id est encore à jour), puis les seuls champs modifiés.
+
+    Le flux se termine après duree secondes (KPI_DUREE_FLUX par défaut).
+    """
+    fin = time.monotonic() + (KPI_DUREE_FLUX if duree is None else duree)
+    try:
+        yield f'retry: {KPI_RECONNEXION * 1000}\n\n'
+        precedent = indicateurs_kpi(commercial)
+        db.session.remove()  # ne pas garder une connexion du pool pendant l'attente
+        if empreinte_kpi(precedent) != dernier_id:
+            yield evenement_sse('kpi', precedent, empreinte_kpi(precedent))
+        while True:
+            reste = fin - time.monotonic()
+            if reste <= 0:
+                break
+            try:
+                file.get(timeout=min(KPI_BATTEMENT, reste))
+            except queue.Empty:
+                yield ': battement\n\n'
+                continue
+            courant = indicateurs_kpi(commercial)
+            db.session.remove()
+            delta = {champ: valeur for champ, valeur in courant.items() if precedent.get(champ) != valeur}
+            precedent = courant
+            if delta:
+                yield evenement_sse('delta', delta, empreinte_kpi(courant))
+    finally:
+        desabonner_kpi(commercial, file)
+
+# ==================== PROFILAGE DES REQUÊTES ====================
+# Activé par PROFILAGE=1 : durée totale, nombre de requêtes SQL, temps SQL et
+# objets ORM chargés par route, en-tête Server-Timing, journal des requêtes lentes et page
+# /admin/profilage. Désactivé, aucun hook n'est installé.
+PROFILAGE_ACTIF = os.environ.get('PROFILAGE') == '1'
+PROFILAGE_SEUIL_LENT_MS = float(os.environ.get('PROFILAGE_SEUIL_LENT_MS', 200))
+PROFILAGE_ECHANTILLONS = 1000  # dernières mesures conservées par route
+PROFILAGE_CENTILES = (50, 90, 95, 99)
+
+_mesures_routes = {}  # endpoint -> deque de (durée ms, nb requêtes, durée SQL ms, objets chargés)
+_requetes_lentes = deque(maxlen=100)
+_verrou_profilage = threading.Lock()
+
+def _avant_requete_sql(connexion, curseur, instruction, parametres, contexte, executemany):
+    contexte._profilage_debut = time.perf_counter()
+
+def _apres_requete_sql(connexion, curseur, instruction, parametres, contexte, executemany):
+    duree = (time.perf_counter() - contexte._profilage_debut) * 1000
+    endpoint = None
+    if has_request_context() and 'profil' in g:
+        g.profil['requetes'] += 1
+        g.profil['duree_sql'] += duree
+        endpoint = request.endpoint
+    if duree >= PROFILAGE_SEUIL_LENT_MS:
+        _requetes_lentes.appendleft({'date': datetime.now(), 'endpoint': endpoint or '(hors requête)',
+                                     'duree': duree, 'sql': instruction, 'parametres': repr(parametres)[:500]})
+        print(f"🐢 Requête SQL lente ({duree:.0f} ms, {endpoint or 'hors requête'}): "
+              f"{' '.join(instruction.split())[:300]} | {repr(parametres)[:200]}")
+
+def _objet_charge(objet, contexte):
+    # cursor.rowcount ne compte pas les lignes d'un SELECT (0 sur SQLite, -1 avec un
+    # curseur serveur psycopg2) : on compte les objets au moment où l'ORM les construit.
+    # Les lignes de colonnes ou d'agrégats (Row) ne passent pas par ce hook.
+    if has_request_context() and 'profil' in g:
+        g.profil['objets'] += 1
+
+def _debut_profil():
+    g.profil = {'debut': time.perf_counter(), 'requetes': 0, 'duree_sql': 0.0, 'objets': 0}
+
+def _fin_profil(reponse):
+    profil = g.pop('profil', None)
+    if profil is None or request.endpoint in (None, 'static'):
+        return reponse
+    duree = (time.perf_counter() - profil['debut']) * 1000
+    with _verrou_profilage:
+        _mesures_routes.setdefault(request.endpoint, deque(maxlen=PROFILAGE_ECHANTILLONS)).append(
+            (duree, profil['requetes'], profil['duree_sql'], profil['objets']))
+    # Pour les réponses en flux (exports, SSE), mesure jusqu'au premier octet
+    reponse.headers['Server-Timing'] = (
+        f'app;dur={duree:.1f}, sql;dur={profil["duree_sql"]:.1f};desc="{profil["requetes"]} requêtes"')
+    return reponse
+
+def installer_profilage():
+    """Branche les hooks Flask et SQLAlchemy (appelé au démarrage si PROFILAGE=1)."""
+    for moteur in db.engines.values():
+        db.event.listen(moteur, 'before_cursor_execute', _avant_requete_sql)
+        db.event.listen(moteur, 'after_cursor_execute', _apres_requete_sql)
+    db.event.listen(db.Model, 'load', _objet_charge, propagate=True)
+    app.before_request(_debut_profil)
+    app.after_request(_fin_profil)
+
+def centile(valeurs_triees, pourcentage):
+    """Centile par rang le plus proche d'une liste déjà triée."""
+    rang = max(0, min(len(valeurs_triees) - 1, int(round(pourcentage / 100 * len(valeurs_triees))) - 1))
+    return valeurs_triees[rang]
+
+def statistiques_profilage():
+    """Une ligne par route : nombre d'appels et centiles de chaque mesure, triées par p95 décroissant."""
+    with _verrou_profilage:
+        mesures = {endpoint: list(valeurs) for endpoint, valeurs in _mesures_routes.items()}
+    routes = []
+    for endpoint, valeurs in mesures.items():
+        ligne = {'endpoint': endpoint, 'appels': len(valeurs)}
+        for indice, nom in enumerate(('duree', 'requetes', 'duree_sql', 'objets')):
+            serie = sorted(v[indice] for v in valeurs)
+            ligne[nom] = {p: centile(serie, p) for p in PROFILAGE_CENTILES}
+            ligne[nom]['max'] = serie[-1]
+        routes.append(ligne)
+    return sorted(routes, key=lambda r: r['duree'][95], reverse=True)
+
+def vider_profilage():
+    with _verrou_profilage:
+        _mesures_routes.clear()
+        _requetes_lentes.clear()
+
+# ==================== MÉTRIQUES PROMETHEUS ====================
+# /metrics au format texte d'exposition Prometheus. Les mesures sont propres au
+# processus (chaque worker gunicorn est une cible). Les indicateurs métier sont lus
+# dans le cache des résultats : une collecte coûte au plus un GROUP BY après un commit.
+METRIQUES_JETON = os.environ.get('METRIQUES_JETON')  # sinon /metrics est réservé aux admins connectés
+BORNES_LATENCE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BORNES_TRAITEMENT = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+METRIQUES = []
+
+def _etiquettes_prometheus(paires):
+    if not paires:
+        return ''
+    echapper = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nom}="{echapper(valeur)}"' for nom, valeur in paires) + '}'
+
+class Compteur:
+    """Compteur Prometheus ; etiquettes : noms des labels, valeurs passées en tuple."""
+    type_prometheus = 'counter'
+    
+    def __init__(self, nom, aide, etiquettes=()):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = etiquettes
+        self._valeurs = {}
+        self._verrou = threading.Lock()
+        METRIQUES.append(self)
+    
+    def inc(self, valeurs=(), montant=1):
+        with self._verrou:
+            self._valeurs[valeurs] = self._valeurs.get(valeurs, 0) + montant
+    
+    def exposition(self):
+        with self._verrou:
+            valeurs = dict(self._valeurs)
+        yield f'# HELP {self.nom} {self.aide}'
+        yield f'# TYPE {self.nom} {self.type_prometheus}'
+        for cle, valeur in sorted(valeurs.items()):
+            yield f'{self.nom}{_etiquettes_prometheus(list(zip(self.etiquettes, cle)))} {valeur}'
+
+class Histogramme(Compteur):
+    """Histogramme Prometheus à bornes fixes (compteurs cumulés, somme et nombre)."""
+    type_prometheus = 'histogram'
+    
+    def __init__(self, nom, aide, etiquettes=(), bornes=BORNES_LATENCE):
+        super().__init__(nom, aide, etiquettes)
+        self.bornes = bornes
+    
+    def observer(self, valeurs, mesure):
+        with self._verrou:
+            serie = self._valeurs.setdefault(valeurs, {'seaux': [0] * len(self.bornes), 'somme': 0.0, 'nombre': 0})
+            for indice, borne in enumerate(self.bornes):
+                if mesure <= borne:
+                    serie['seaux'][indice] += 1
+            serie['somme'] += mesure
+            serie['nombre'] += 1
+    
+    def exposition(self):
+        with self._verrou:
+            valeurs = {cle: dict(serie, seaux=list(serie['seaux'])) for cle, serie in self._valeurs.items()}
+        yield f'# HELP {self.nom} {self.aide}'
+        yield f'# TYPE {self.nom} histogram'
+        for cle, serie in sorted(valeurs.items()):
+            paires = list(zip(self.etiquettes, cle))
+            for borne, nombre in zip(self.bornes, serie['seaux']):
+                yield f'{self.nom}_bucket{_etiquettes_prometheus(paires + [("le", borne)])} {nombre}'
+            yield f'{self.nom}_bucket{_etiquettes_prometheus(paires + [("le", "+Inf")])} {serie["nombre"]}'
+            yield f'{self.nom}_sum{_etiquettes_prometheus(paires)} {serie["somme"]}'
+            yield f'{self.nom}_count{_etiquettes_prometheus(paires)} {serie["nombre"]}'
+
+LATENCE_REQUETES = Histogramme('socoma_requete_duree_secondes', 'Durée des requêtes HTTP par route.',
+                               ('endpoint', 'methode'))
+REQUETES_HTTP = Compteur('socoma_requetes_total', 'Requêtes HTTP par route et code de réponse.', ('endpoint', 'code'))
+DUREE_IMPORTS = Histogramme('socoma_import_duree_secondes', "Durée des imports de créances.",
+                            bornes=BORNES_TRAITEMENT)
+LIGNES_IMPORTEES = Compteur('socoma_import_lignes_total', "Lignes des fichiers d'import par résultat.", ('resultat',))
+DUREE_EXPORTS = Histogramme('socoma_export_duree_secondes', 'Durée des exports de créances par format.',
+                            ('format',), bornes=BORNES_TRAITEMENT)
+LIGNES_EXPORTEES = Compteur('socoma_export_lignes_total', 'Créances exportées par format.', ('format',))
+
+def observer_export(format_export, debut, nb_lignes):
+    DUREE_EXPORTS.observer((format_export,), time.perf_counter() - debut)
+    LIGNES_EXPORTEES.inc((format_export,), nb_lignes)
+
+@app.before_request
+def _debut_metriques():
+    g.debut_metriques = time.perf_counter()
+
+@app.after_request
+def _fin_metriques(reponse):
+    debut = g.pop('debut_metriques', None)
+    # Les URL inconnues (endpoint None) ne créent pas de série
+    if debut is not None and request.endpoint not in (None, 'static', 'metriques'):
+        LATENCE_REQUETES.observer((request.endpoint, request.method), time.perf_counter() - debut)
+        REQUETES_HTTP.inc((request.endpoint, str(reponse.status_code)))
+    return reponse
+
+def _jauge(nom, aide, series):
+    """Lignes d'une jauge calculée à la collecte ; series : [(paires d'étiquettes, valeur)]."""
+    yield f'# HELP {nom} {aide}'
+    yield f'# TYPE {nom} gauge'
+    for paires, valeur in series:
+        yield f'{nom}{_etiquettes_prometheus(paires)} {valeur}'
 
-@app.context_processor
-def inject_now():
-    return {'now': datetime.now()}
+def jauges_pool():
+    pool = db.engine.pool
+    for nom, methode, aide in (('taille', 'size', 'Taille configurée du pool de connexions.'),
+                               ('connexions_utilisees', 'checkedout', 'Connexions empruntées au pool.'),
+                               ('connexions_disponibles', 'checkedin', 'Connexions libres dans le pool.'),
+                               ('debordement', 'overflow', 'Connexions ouvertes au-delà de la taille du pool.')):
+        if hasattr(pool, methode):
+            yield from _jauge(f'socoma_db_pool_{nom}', aide, [([], getattr(pool, methode)())])
+
+def jauges_metier():
+    stats = en_cache('statistiques', None, lambda: statistiques_portefeuille(None))
+    par_commercial = sorted(stats['par_commercial'].items())
+    for nom, champ, aide in (('socoma_creances', 'count', 'Nombre de créances par commercial.'),
+                             ('socoma_creances_solde_fcfa', 'solde', 'Solde restant dû par commercial (FCFA).'),
+                             ('socoma_creances_retard_fcfa', 'retard', 'Solde des créances EN RETARD par commercial (FCFA).'),
+                             ('socoma_creances_en_retard', 'nb_retard', 'Nombre de créances EN RETARD par commercial.')):
+        yield from _jauge(nom, aide, [([('commercial', commercial)], valeurs[champ]) for commercial, valeurs in par_commercial])
+    yield from _jauge('socoma_tpar_pourcent', 'Taux de portefeuille à risque, tous commerciaux.', [([], stats['tpar'])])
+
+def exposition_metriques():
+    lignes = [ligne for metrique in METRIQUES for ligne in metrique.exposition()]
+    lignes.extend(jauges_pool())
+    lignes.extend(jauges_metier())
+    return '\n'.join(lignes) + '\n'
 
 # ==================== TOUTES LES ROUTES ====================
 
@@ -270,53 +2347,21 @@ def inject_now():
 @app.route('/')
 @login_required
 def accueil():
-    # Récupérer toutes les créances selon les permissions
-    if current_user.role == 'commercial' and current_user.commercial:
-        creances = Creance.query.filter_by(commercial=current_user.commercial).all()
-    else:
-        creances = Creance.query.all()
-    
-    # Calcul des statistiques
-    total_creances = sum(c.montant for c in creances) if creances else 0
-    total_versement = sum(c.versement for c in creances) if creances else 0
-    total_solde = sum(c.solde for c in creances) if creances else 0
-    
-    creances_retard = [c for c in creances if c.situation_paiement == 'EN RETARD']
-    montant_retard = sum(c.solde for c in creances_retard) if creances_retard else 0
-    
-    tpar = (montant_retard / total_creances * 100) if total_creances > 0 else 0
-    
-    montant_a_solder = total_solde
-    
-    # Statistiques par commercial
-    stats_commerciaux = {}
-    commerciaux_list = [current_user.commercial] if current_user.role == 'commercial' else COMMERCIAUX_DATA.keys()
-    
-    for commercial in commerciaux_list:
-        if commercial:
-            comm_creances = [c for c in creances if c.commercial == commercial]
-            total_comm = sum(c.montant for c in comm_creances)
-            retard_comm = sum(c.solde for c in comm_creances if c.situation_paiement == 'EN RETARD')
-            solde_comm = sum(c.solde for c in comm_creances)
-            
-            stats_commerciaux[commercial] = {
-                'count': len(comm_creances),
-                'total': total_comm,
-                'retard': retard_comm,
-                'solde': solde_comm,
-                'clients': len(set(c.client for c in comm_creances))
-            }
+    commercial = portefeuille_courant()
+    stats = en_cache('statistiques', commercial, lambda: statistiques_portefeuille(commercial))
+    retards = en_cache('top_retards', commercial, lambda: top_retards(commercial))
     
     return render_template('accueil.html',
-                         total_creances=total_creances,
-                         total_versement=total_versement,
-                         total_solde=total_solde,
-                         montant_retard=montant_retard,
-                         montant_a_solder=montant_a_solder,
-                         tpar=tpar,
-                         creances_retard=creances_retard[:5],
-                         stats_commerciaux=stats_commerciaux,
-                         total_creances_en_cours=len([c for c in creances if c.solde > 0]))
+                         total_creances=stats['total_creances'],
+                         total_versement=stats['total_versement'],
+                         total_solde=stats['total_solde'],
+                         montant_retard=stats['montant_retard'],
+                         montant_a_solder=stats['total_solde'],
+                         tpar=stats['tpar'],
+                         creances_retard=retards,
+                         nb_retard=stats['nb_retard'],
+                         stats_commerciaux=stats['par_commercial'],
+                         total_creances_en_cours=stats['nb_en_cours'])
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -331,8 +2376,7 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
-            user.last_login = datetime.now()
-            db.session.commit()
+            noter_connexion(user.id)
             login_user(user, remember=remember)
             flash(f'Bienvenue {username} !', 'success')
             return redirect(url_for('accueil'))
@@ -366,18 +2410,43 @@ def liste_creances():
     if statut_filter:
         query = query.filter_by(statut=statut_filter)
     if client_filter:
-        query = query.filter(Creance.client.contains(client_filter))
-    
-    creances = query.order_by(Creance.date_creation.desc()).all()
+        query = query.filter(Creance.client_recherche.in_(cles_clients_correspondantes(client_filter)))
+    
+    tri = request.args.get('tri', TRI_DEFAUT)
+    if tri not in COLONNES_TRI:
+        tri = TRI_DEFAUT
+    ordre = 'asc' if request.args.get('ordre') == 'asc' else 'desc'
+    par_page = request.args.get('par_page', 50, type=int)
+    if par_page not in TAILLES_PAGE:
+        par_page = 50
+    
+    # Totaux du filtre en cache (invalidé à chaque commit sur les créances) : les pages
+    # suivantes ne refont pas le COUNT/SUM sur toute la sélection.
+    filtre_resume = '|'.join((commercial_filter or '', statut_filter or '', normaliser_nom(client_filter or '')))
+    resume = en_cache(f'resume_creances:{filtre_resume}', portefeuille_courant(), lambda: resume_creances(query))
+    creances, curseur_suivant = paginer_par_curseur(query, tri, ordre, par_page, request.args.get('apres'))
     
     if current_user.role == 'commercial' and current_user.commercial:
         commerciaux_list = [current_user.commercial]
     else:
-        commerciaux_list = list(COMMERCIAUX_DATA.keys())
+        commerciaux_list = noms_commerciaux()
+    
+    # Paramètres à conserver dans les liens de tri et de pagination
+    filtres = {k: v for k, v in (('commercial', commercial_filter),
+                                  ('statut', statut_filter),
+                                  ('client', client_filter)) if v}
     
     return render_template('liste_creances.html',
                          creances=creances,
-                         commerciaux=commerciaux_list)
+                         resume=resume,
+                         commerciaux=commerciaux_list,
+                         filtres=filtres,
+                         tri=tri,
+                         ordre=ordre,
+                         par_page=par_page,
+                         tailles_page=TAILLES_PAGE,
+                         curseur_suivant=curseur_suivant,
+                         premiere_page=not request.args.get('apres'))
 
 @app.route('/creances/ajouter', methods=['GET', 'POST'])
 @login_required
@@ -426,8 +2495,6 @@ def ajouter_creance():
                 flash('Le versement ne peut pas dépasser le montant', 'error')
                 return redirect(url_for('ajouter_creance'))
             
-            solde = montant - versement
-            
             date_facturation_str = request.form.get('date_facturation')
             if not date_facturation_str:
                 flash('La date de facturation est obligatoire', 'error')
@@ -455,17 +2522,18 @@ def ajouter_creance():
                 client=client,
                 marche=marche,
                 montant=montant,
-                versement=versement,
-                solde=solde,
+                versement=0,
+                solde=montant,
                 date_facturation=date_facturation,
                 date_echeance=date_echeance,
                 commentaires=commentaires,
                 created_by=current_user.username
             )
+            db.session.add(nouvelle_creance)
+            if versement:
+                enregistrer_paiement(nouvelle_creance, versement, current_user.username)
             
             nouvelle_creance.update_statut()
-            
-            db.session.add(nouvelle_creance)
             db.session.commit()
             
             flash(f'Créance ajoutée avec succès pour {client} !', 'success')
@@ -479,11 +2547,11 @@ def ajouter_creance():
     if current_user.role == 'commercial':
         commerciaux_disponibles = [current_user.commercial]
     else:
-        commerciaux_disponibles = list(COMMERCIAUX_DATA.keys())
+        commerciaux_disponibles = noms_commerciaux()
     
     return render_template('ajouter_creance.html',
                          commerciaux=commerciaux_disponibles,
-                         commerciaux_data=COMMERCIAUX_DATA)
+                         commerciaux_data=referentiel_commerciaux(portefeuille_courant()))
 
 @app.route('/creances/modifier/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -511,8 +2579,9 @@ def modifier_creance(id):
                 flash('Le versement ne peut pas dépasser le montant initial', 'error')
                 return redirect(url_for('modifier_creance', id=id))
             
-            creance.versement = nouveau_versement
-            creance.solde = creance.montant - nouveau_versement
+            # Le formulaire saisit le cumul : l'écart est journalisé (négatif pour une correction)
+            if nouveau_versement != creance.versement:
+                enregistrer_paiement(creance, nouveau_versement - creance.versement, current_user.username)
             
             date_echeance_str = request.form.get('date_echeance')
             if date_echeance_str:
@@ -546,6 +2615,7 @@ def supprimer_creance(id):
     
     try:
         client_name = creance.client
+        detacher_paiements(Creance.id == creance.id)
         db.session.delete(creance)
         db.session.commit()
         flash(f'Créance pour {client_name} supprimée avec succès', 'success')
@@ -557,105 +2627,57 @@ def supprimer_creance(id):
 
 @app.route('/tableau-bord')
 @login_required
+@lecture_replique
 def tableau_bord():
-    # Récupérer les créances selon les permissions
-    if current_user.role == 'commercial' and current_user.commercial:
-        creances = Creance.query.filter_by(commercial=current_user.commercial).all()
-    else:
-        creances = Creance.query.all()
-    
-    # Statistiques globales - AJOUTER DES VALEURS PAR DÉFAUT
-    total_creances = sum(c.montant for c in creances) if creances else 0
-    total_versement = sum(c.versement for c in creances) if creances else 0
-    total_solde = sum(c.solde for c in creances) if creances else 0
-    
-    creances_retard = [c for c in creances if c.situation_paiement == 'EN RETARD']
-    montant_retard = sum(c.solde for c in creances_retard) if creances_retard else 0
-    
-    montant_a_solder = total_solde
-    
-    # PROTECTION CONTRE DIVISION PAR ZÉRO
-    if total_creances > 0:
-        tpar = (montant_retard / total_creances * 100)
-    else:
-        tpar = 0
-    
-    # Statistiques par commercial
-    stats_commerciaux = {}
-    commerciaux_list = [current_user.commercial] if current_user.role == 'commercial' else COMMERCIAUX_DATA.keys()
-    
-    for commercial in commerciaux_list:
-        if commercial:
-            comm_creances = [c for c in creances if c.commercial == commercial]
-            total_comm = sum(c.montant for c in comm_creances)
-            retard_comm = sum(c.solde for c in comm_creances if c.situation_paiement == 'EN RETARD')
-            solde_comm = sum(c.solde for c in comm_creances)
-            
-            # PROTECTION CONTRE DIVISION PAR ZÉRO
-            performance = 0
-            if total_comm > 0:
-                performance = ((total_comm - retard_comm) / total_comm) * 100
-            
-            stats_commerciaux[commercial] = {
-                'count': len(comm_creances),
-                'total': total_comm,
-                'retard': retard_comm,
-                'solde': solde_comm,
-                'performance': performance  # AJOUTER CE CHAMP
-            }
-    
-    # Top retards
-    top_retard = sorted(creances_retard, key=lambda x: x.jours_retard or 0, reverse=True)[:5]
+    commercial = portefeuille_courant()
+    stats = en_cache('statistiques', commercial, lambda: statistiques_portefeuille(commercial))
+    retards = en_cache('top_retards', commercial, lambda: top_retards(commercial))
+    recouvrements = en_cache('recouvrements', commercial, lambda: recouvrements_semaine(commercial))
     
     return render_template('tableau_bord.html',
-                         total_creances=total_creances,
-                         total_versement=total_versement,
-                         total_solde=total_solde,
-                         montant_retard=montant_retard,
-                         montant_a_solder=montant_a_solder,
-                         tpar=tpar,
-                         creances_retard=creances_retard,
-                         top_retard=top_retard,
-                         stats_commerciaux=stats_commerciaux)
+                         total_creances=stats['total_creances'],
+                         total_versement=stats['total_versement'],
+                         total_solde=stats['total_solde'],
+                         montant_retard=stats['montant_retard'],
+                         montant_a_solder=stats['total_solde'],
+                         tpar=stats['tpar'],
+                         nb_retard=stats['nb_retard'],
+                         top_retard=retards,
+                         recouvrements=recouvrements,
+                         stats_commerciaux=stats['par_commercial'])
+
+@app.route('/api/graphiques/<nom>')
+@login_required
+@lecture_replique
+def api_graphique(nom):
+    serie = SERIES_GRAPHIQUES.get(nom)
+    if serie is None:
+        abort(404)
+    commercial = portefeuille_courant()
+    return reponse_graphique(en_cache(f'graphique_{nom}', commercial, lambda: serie(commercial)))
+
+@app.route('/api/kpi/flux')
+@login_required
+def flux_kpi():
+    """Flux Server-Sent Events (durée bornée) des indicateurs du portefeuille courant."""
+    commercial = portefeuille_courant()
+    file = abonner_kpi(commercial)
+    flux = flux_evenements_kpi(commercial, file, request.headers.get('Last-Event-ID'))
+    reponse = Response(stream_with_context(flux), mimetype='text/event-stream')
+    reponse.headers['Cache-Control'] = 'no-cache'
+    reponse.headers['X-Accel-Buffering'] = 'no'  # pas de mise en tampon derrière nginx
+    return reponse
 
 @app.route('/recap-clients')
 @login_required
+@lecture_replique
 def recap_clients():
-    if current_user.role == 'commercial' and current_user.commercial:
-        creances = Creance.query.filter_by(commercial=current_user.commercial).all()
-    else:
-        creances = Creance.query.all()
-    
-    clients_data = {}
-    for creance in creances:
-        client_key = creance.client
-        if client_key not in clients_data:
-            clients_data[client_key] = {
-                'client': creance.client,
-                'commercial': creance.commercial,
-                'marche': creance.marche,
-                'nombre_creances': 0,
-                'total_montant': 0,
-                'total_versement': 0,
-                'total_solde': 0,
-                'derniere_echeance': None
-            }
-        
-        clients_data[client_key]['nombre_creances'] += 1
-        clients_data[client_key]['total_montant'] += creance.montant
-        clients_data[client_key]['total_versement'] += creance.versement
-        clients_data[client_key]['total_solde'] += creance.solde
-        
-        if creance.date_echeance and (not clients_data[client_key]['derniere_echeance'] or 
-                                      creance.date_echeance > clients_data[client_key]['derniere_echeance']):
-            clients_data[client_key]['derniere_echeance'] = creance.date_echeance
-    
-    clients_recap = list(clients_data.values())
-    
-    total_montant = sum(c['total_montant'] for c in clients_recap)
-    total_versement = sum(c['total_versement'] for c in clients_recap)
-    total_solde = sum(c['total_solde'] for c in clients_recap)
-    total_creances = len(creances)
+    recap = en_cache('recap_clients', portefeuille_courant(), lambda: recap_par_client(portefeuille_courant()))
+    clients_recap = recap['clients']
+    total_montant = recap['total_montant']
+    total_versement = recap['total_versement']
+    total_solde = recap['total_solde']
+    total_creances = recap['total_creances']
     
     selected_commercial = request.args.get('commercial')
     if selected_commercial and current_user.role != 'commercial':
@@ -664,7 +2686,7 @@ def recap_clients():
     if current_user.role == 'commercial':
         commerciaux_list = [current_user.commercial]
     else:
-        commerciaux_list = list(COMMERCIAUX_DATA.keys())
+        commerciaux_list = noms_commerciaux()
     
     return render_template('recap_clients.html',
                          clients_recap=clients_recap,
@@ -680,13 +2702,23 @@ def recap_clients():
 def detail_client(client_name):
     client_name = client_name.replace('_', ' ')
     
-    query = Creance.query.filter_by(client=client_name)
-    
+    # Toutes les fiches du référentiel portant ce nom (variantes de saisie comprises)
+    clients = db.select(Client.id).where(Client.cle == normaliser_nom(client_name))
     if current_user.role == 'commercial' and current_user.commercial:
-        query = query.filter_by(commercial=current_user.commercial)
+        clients = clients.join(Commercial, Commercial.id == Client.commercial_id)\
+            .where(Commercial.nom == current_user.commercial)
+    query = Creance.query.filter(Creance.client_id.in_(clients))
     
     creances = query.order_by(Creance.date_creation.desc()).all()
     
+    # Créances archivées sur demande, ou d'office si le client n'a plus que celles-là
+    inclure_archive = request.args.get('archive') == '1' or not creances
+    nb_archivees = db.session.query(db.func.count(CreanceArchive.id))\
+        .filter(CreanceArchive.client_id.in_(clients)).scalar()
+    if inclure_archive and nb_archivees:
+        archivees = CreanceArchive.query.filter(CreanceArchive.client_id.in_(clients)).all()
+        creances = sorted(creances + archivees, key=lambda c: c.date_creation or datetime.min, reverse=True)
+    
     if not creances:
         flash('Client non trouvé ou vous n\'avez pas accès à ce client', 'error')
         return redirect(url_for('recap_clients'))
@@ -704,32 +2736,83 @@ def detail_client(client_name):
                          total_montant=total_montant,
                          total_versement=total_versement,
                          total_solde=total_solde,
-                         derniere_date=derniere_date)
+                         derniere_date=derniere_date,
+                         inclure_archive=inclure_archive,
+                         nb_archivees=nb_archivees)
+
+@app.route('/balance-agee')
+@login_required
+@lecture_replique
+def balance_agee_page():
+    axe = request.args.get('axe', 'commercial')
+    if axe not in AXES_BALANCE_AGEE:
+        axe = 'commercial'
+    return render_template('balance_agee.html',
+                         balance=balance_agee(axe, portefeuille_courant()),
+                         axes=AXES_BALANCE_AGEE)
+
+@app.route('/api/balance-agee')
+@login_required
+@lecture_replique
+def api_balance_agee():
+    axe = request.args.get('axe', 'commercial')
+    if axe not in AXES_BALANCE_AGEE:
+        return jsonify({'erreur': f'Axe inconnu, axes acceptés : {", ".join(AXES_BALANCE_AGEE)}'}), 400
+    resultat = balance_agee(axe, portefeuille_courant())
+    resultat['date'] = resultat['date'].isoformat()
+    resultat['tranches'] = [{'code': code, 'libelle': libelle} for code, libelle in resultat['tranches']]
+    return jsonify(resultat)
+
+@app.route('/balance-agee/excel')
+@login_required
+@lecture_replique
+def balance_agee_excel():
+    axe = request.args.get('axe', 'commercial')
+    if axe not in AXES_BALANCE_AGEE:
+        axe = 'commercial'
+    output = BytesIO()
+    construire_balance_agee_excel(balance_agee(axe, portefeuille_courant()), output)
+    output.seek(0)
+    
+    return send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=f'balance_agee_{axe}_{datetime.now().strftime("%Y%m%d")}.xlsx'
+    )
+
+@app.route('/api/clients/recherche')
+@login_required
+def api_recherche_clients():
+    terme = request.args.get('q', '')
+    limite = min(request.args.get('limite', 10, type=int), 50)
+    return jsonify(rechercher_clients(terme, portefeuille_courant(), limite))
 
 @app.route('/commerciaux')
 @login_required
+@lecture_replique
 def commerciaux():
-    if current_user.role == 'commercial' and current_user.commercial:
-        creances = Creance.query.filter_by(commercial=current_user.commercial).all()
-        commerciaux_list = [current_user.commercial]
-    else:
-        creances = Creance.query.all()
-        commerciaux_list = list(COMMERCIAUX_DATA.keys())
+    commercial = portefeuille_courant()
+    
+    # Le gabarit affiche une carte par commercial : les autres portefeuilles
+    # restent à zéro pour un compte commercial.
+    par_commercial = en_cache(
+        'statistiques_commerciaux', commercial,
+        lambda: statistiques_portefeuille(commercial, noms_commerciaux())['par_commercial']
+    )
     
     stats = {}
-    for commercial in commerciaux_list:
-        if commercial:
-            comm_creances = [c for c in creances if c.commercial == commercial]
-            stats[commercial] = {
-                'total_creances': len(comm_creances),
-                'total_montant': sum(c.montant for c in comm_creances),
-                'total_versement': sum(c.versement for c in comm_creances),
-                'total_solde': sum(c.solde for c in comm_creances),
-                'clients': len(set(c.client for c in comm_creances))
-            }
+    for nom, s in par_commercial.items():
+        stats[nom] = {
+            'total_creances': s['count'],
+            'total_montant': s['total'],
+            'total_versement': s['versement'],
+            'total_solde': s['solde'],
+            'clients': s['clients']
+        }
     
     return render_template('commerciaux.html',
-                         commerciaux=COMMERCIAUX_DATA,
+                         commerciaux=en_cache('referentiel', None, referentiel_commerciaux),
                          stats=stats)
 
 # Gestion utilisateurs
@@ -740,6 +2823,7 @@ def gestion_utilisateurs():
         flash('Accès réservé aux administrateurs', 'error')
         return redirect(url_for('accueil'))
     
+    enregistrer_connexions()
     utilisateurs = User.query.all()
     return render_template('gestion_utilisateurs.html', utilisateurs=utilisateurs)
 
@@ -825,96 +2909,124 @@ def supprimer_utilisateur(id):
 @app.route('/export-excel')
 @login_required
 def export_excel():
-    if current_user.role == 'commercial' and current_user.commercial:
-        creances = Creance.query.filter_by(commercial=current_user.commercial).all()
-    else:
-        creances = Creance.query.all()
-    
-    data = []
-    for creance in creances:
-        data.append({
-            'ID': creance.id,
-            'Commercial': creance.commercial,
-            'Client': creance.client,
-            'Marché': creance.marche or '',
-            'Montant (FCFA)': creance.montant,
-            'Versement (FCFA)': creance.versement,
-            'Solde (FCFA)': creance.solde,
-            'Date Facturation': creance.date_facturation.strftime('%d/%m/%Y'),
-            'Date Échéance': creance.date_echeance.strftime('%d/%m/%Y') if creance.date_echeance else '',
-            'Jours Retard': creance.jours_retard or 0,
-            'Statut': creance.statut,
-            'Situation': creance.situation_paiement,
-            'Commentaires': creance.commentaires or '',
-            'Créé par': creance.created_by or '',
-            'Date Création': creance.date_creation.strftime('%d/%m/%Y %H:%M')
-        })
-    
-    df = pd.DataFrame(data)
-    output = BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Créances', index=False)
-        
-        if current_user.role != 'commercial':
-            summary_data = {
-                'Commercial': list(COMMERCIAUX_DATA.keys()),
-                'Nombre Clients': [len(COMMERCIAUX_DATA[c]['clients']) for c in COMMERCIAUX_DATA.keys()]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='Résumé', index=False)
+    # Le classeur est construit par une tâche de fond (job_export) : la page de suivi
+    # affiche sa progression puis télécharge le fichier, aucun worker n'attend la construction.
+    purger_jobs()
+    job_id = lancer_job('export', job_export, current_user.username, commercial=portefeuille_courant(),
+                        inclure_archive=request.args.get('archive') == '1')
+    return redirect(url_for('suivi_export', job_id=job_id))
+
+@app.route('/export-csv')
+@login_required
+@lecture_replique
+def export_csv():
+    # Les lignes partent au fur et à mesure de la lecture : le téléchargement démarre immédiatement.
+    filename = f'creances_socoma_{datetime.now().strftime("%Y%m%d_%H%M")}.csv'
+    if current_user.role == 'commercial':
+        filename = f'creances_{current_user.commercial.replace(" ", "_")}_{datetime.now().strftime("%Y%m%d")}.csv'
     
-    output.seek(0)
+    return Response(
+        stream_with_context(flux_export_csv(portefeuille_courant(), request.args.get('archive') == '1')),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/export')
+@login_required
+@lecture_replique
+def export_colonnaire():
+    # Export typé pour l'analyse (notebooks) : parquet, arrow ou csv, mêmes colonnes qu'export_excel
+    format_export = request.args.get('format', 'parquet').lower()
+    if format_export not in FORMATS_COLONNAIRES:
+        return jsonify({'erreur': f'Format inconnu, formats acceptés : {", ".join(FORMATS_COLONNAIRES)}'}), 400
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return jsonify({'erreur': 'pyarrow n\'est pas installé sur le serveur'}), 501
     
-    filename = f'creances_socoma_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
+    extension, mimetype = FORMATS_COLONNAIRES[format_export]
+    filename = f'creances_socoma_{datetime.now().strftime("%Y%m%d_%H%M")}.{extension}'
     if current_user.role == 'commercial':
-        filename = f'creances_{current_user.commercial.replace(" ", "_")}_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        filename = f'creances_{current_user.commercial.replace(" ", "_")}_{datetime.now().strftime("%Y%m%d")}.{extension}'
     
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
+    return Response(
+        stream_with_context(flux_export_colonnaire(format_export, portefeuille_courant(),
+                                                   request.args.get('archive') == '1')),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
     )
 
 # Routes admin
+@app.route('/metrics')
+def metriques():
+    if METRIQUES_JETON:
+        jeton = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(jeton, METRIQUES_JETON):
+            abort(403)
+    elif not (current_user.is_authenticated and current_user.role == 'admin'):
+        abort(404)
+    return Response(exposition_metriques(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/admin/profilage', methods=['GET', 'POST'])
+@login_required
+def admin_profilage():
+    if current_user.role != 'admin':
+        flash('Accès réservé aux administrateurs', 'error')
+        return redirect(url_for('accueil'))
+    
+    if request.method == 'POST':
+        vider_profilage()
+        flash('Mesures de profilage remises à zéro', 'success')
+        return redirect(url_for('admin_profilage'))
+    
+    return render_template('admin_profilage.html',
+                         actif=PROFILAGE_ACTIF,
+                         seuil=PROFILAGE_SEUIL_LENT_MS,
+                         centiles=PROFILAGE_CENTILES,
+                         routes=statistiques_profilage(),
+                         requetes_lentes=list(_requetes_lentes))
+
 @app.route('/admin/reset-creances', methods=['GET', 'POST'])
 @login_required
+@lecture_replique
 def admin_reset_creances():
     if current_user.role != 'admin':
         flash('Accès réservé aux administrateurs', 'error')
         return redirect(url_for('accueil'))
     
     commercial_selected = request.args.get('commercial')
-    stats = None
-    
-    if commercial_selected:
-        query = Creance.query
-        if commercial_selected != 'TOUS':
-            query = query.filter_by(commercial=commercial_selected)
-        
-        creances = query.all()
-        
-        stats = {
-            'count': len(creances),
-            'soldees': len([c for c in creances if c.solde <= 0]),
-            'montant_total': sum(c.montant for c in creances),
-            'montant_solde': sum(c.solde for c in creances)
-        }
+    stats = statistiques_reset(commercial_selected) if commercial_selected else None
     
     if request.method == 'POST':
         action = request.form.get('action')
         commercial = request.form.get('commercial')
-        reason = request.form.get('reason')
+        reason = (request.form.get('reason') or '').strip()
         confirmation_code = request.form.get('confirmation_code')
         
-        flash(f'Action {action} programmée pour {commercial}. Raison: {reason}', 'info')
+        if (confirmation_code or '').strip().upper() not in codes_confirmation_valides():
+            flash('Code de confirmation incorrect ou expiré, aucune action effectuée', 'error')
+            return redirect(url_for('admin_reset_creances', commercial=commercial))
+        if len(reason) < RAISON_LONGUEUR_MIN:
+            flash(f'La raison de l\'action doit comporter au moins {RAISON_LONGUEUR_MIN} caractères', 'error')
+            return redirect(url_for('admin_reset_creances', commercial=commercial))
+        try:
+            journal = executer_action_masse(action, commercial, current_user.username, reason,
+                                            cible=request.form.get('cible') or None,
+                                            mois=request.form.get('mois', ARCHIVE_MOIS, type=int))
+            flash(f'{ACTIONS_MASSE[action]} ({commercial}) : {journal.lignes} créances traitées '
+                  f'en {journal.duree_ms} ms', 'success')
+        except Exception as e:
+            flash(f'Erreur lors de l\'action {action}: {str(e)}', 'error')
         return redirect(url_for('admin_reset_creances', commercial=commercial))
     
     return render_template('admin_reset_creances.html',
                          commercial_selected=commercial_selected,
                          stats=stats,
-                         confirmation_code='SOC' + datetime.now().strftime('%H%M'))
+                         archive_mois=ARCHIVE_MOIS,
+                         commerciaux_cibles=[nom for nom in noms_commerciaux() if nom != commercial_selected],
+                         journal=ActionAdmin.query.order_by(ActionAdmin.id.desc()).limit(20).all(),
+                         actions=ACTIONS_MASSE,
+                         confirmation_code=code_confirmation())
 
 @app.route('/import-creances', methods=['GET', 'POST'])
 @login_required
@@ -929,79 +3041,21 @@ def import_creances():
         file = request.files['file']
         if file.filename != '':
             try:
-                if file.filename.endswith('.csv'):
-                    df = pd.read_csv(file)
-                else:
-                    df = pd.read_excel(file)
-                
-                imported = 0
-                errors = 0
-                ignored = 0
-                
-                for _, row in df.iterrows():
-                    try:
-                        commercial = row.get('Commercial')
-                        client = row.get('Client')
-                        montant = row.get('Montant')
-                        
-                        if not commercial or not client or montant is None:
-                            ignored += 1
-                            continue
-                        
-                        try:
-                            montant_val = float(montant)
-                            versement_val = float(row.get('Versement', 0))
-                        except ValueError:
-                            ignored += 1
-                            continue
-                        
-                        date_facturation_str = str(row.get('Date Facturation', ''))
-                        date_echeance_str = str(row.get('Date Échéance', ''))
-                        
-                        try:
-                            if date_facturation_str:
-                                date_facturation = datetime.strptime(date_facturation_str.split()[0], '%Y-%m-%d').date()
-                            else:
-                                date_facturation = datetime.now().date()
-                        except:
-                            date_facturation = datetime.now().date()
-                        
-                        date_echeance = None
-                        if date_echeance_str and date_echeance_str.strip():
-                            try:
-                                date_echeance = datetime.strptime(date_echeance_str.split()[0], '%Y-%m-%d').date()
-                            except:
-                                pass
-                        
-                        nouvelle_creance = Creance(
-                            commercial=str(commercial),
-                            client=str(client),
-                            marche=str(row.get('Marché', '')),
-                            montant=montant_val,
-                            versement=versement_val,
-                            solde=montant_val - versement_val,
-                            date_facturation=date_facturation,
-                            date_echeance=date_echeance,
-                            commentaires=str(row.get('Commentaires', '')),
-                            created_by=current_user.username
-                        )
-                        
-                        nouvelle_creance.update_statut()
-                        db.session.add(nouvelle_creance)
-                        imported += 1
-                        
-                    except Exception as e:
-                        errors += 1
-                
-                db.session.commit()
+                df = lire_fichier_import(file)
+                import_results = importer_creances(
+                    df,
+                    created_by=current_user.username,
+                    date_format=request.form.get('date_format', 'auto'),
+                    ignorer_erreurs='ignore_errors' in request.form
+                )
                 
-                import_results = {
-                    'imported': imported,
-                    'errors': errors,
-                    'ignored': ignored
-                }
-                
-                flash(f'Import terminé ! {imported} créances importées, {errors} erreurs, {ignored} lignes ignorées.', 'success')
+                imported = import_results['imported']
+                errors = import_results['errors']
+                ignored = import_results['ignored']
+                if errors and not imported and 'ignore_errors' not in request.form:
+                    flash(f'Import annulé : {errors} lignes en erreur. Corrigez le fichier ou cochez « Ignorer les lignes avec erreurs ».', 'error')
+                else:
+                    flash(f'Import terminé ! {imported} créances importées, {errors} erreurs, {ignored} lignes ignorées.', 'success')
                 
             except Exception as e:
                 db.session.rollback()
@@ -1009,6 +3063,813 @@ def import_creances():
     
     return render_template('import_creances.html', import_results=import_results)
 
+# ==================== MOTEUR D'IMPORT ====================
+TAILLE_LOT_IMPORT = 5000
+FORMATS_DATE = {
+    'auto': ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d.%m.%Y'],
+    'yyyy-mm-dd': ['%Y-%m-%d'],
+    'dd/mm/yyyy': ['%d/%m/%Y'],
+    'mm/dd/yyyy': ['%m/%d/%Y'],
+}
+COLONNES_IMPORT = ['commercial', 'client', 'client_recherche', 'marche', 'montant', 'versement', 'solde',
+                   'date_creation', 'date_facturation', 'date_echeance', 'jours_retard', 'statut',
+                   'situation_paiement', 'commentaires', 'created_by']
+
+def lire_fichier_import(fichier, nom=None):
+    """fichier : upload Werkzeug ou chemin sur disque (nom déduit du chemin)."""
+    import pandas as pd
+    nom = nom or getattr(fichier, 'filename', None) or str(fichier)
+    if nom.lower().endswith('.csv'):
+        return pd.read_csv(fichier, dtype=str, keep_default_na=False, na_values=[''])
+    return pd.read_excel(fichier)
+
+def _colonne(df, nom):
+    import pandas as pd
+    if nom in df.columns:
+        return df[nom]
+    return pd.Series(pd.NA, index=df.index, dtype='object')
+
+def _texte(serie):
+    import pandas as pd
+    return serie.astype('string').str.strip().replace('', pd.NA)
+
+def convertir_dates(serie, formats):
+    """Dates (datetime64) à partir de cellules Excel ou de textes dans l'un des formats ; NaT sinon."""
+    import pandas as pd
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.normalize()
+    
+    est_date = serie.map(lambda v: isinstance(v, (datetime, date)))
+    resultat = pd.to_datetime(serie.where(est_date), errors='coerce')
+    texte = _texte(serie.where(~est_date)).str.split().str[0]
+    for fmt in formats:
+        a_convertir = resultat.isna() & texte.notna()
+        if not a_convertir.any():
+            break
+        resultat[a_convertir] = pd.to_datetime(texte[a_convertir], format=fmt, errors='coerce')
+    return resultat.dt.normalize()
+
+def statuts_vectoriels(solde, echeance, aujourdhui):
+    """Équivalent vectoriel de Creance.update_statut() : (statut, situation_paiement, jours_retard)."""
+    import numpy as np
+    import pandas as pd
+    jours = (pd.Timestamp(aujourdhui) - echeance).dt.days
+    paye = (solde <= 0).to_numpy()
+    sans_echeance = echeance.isna().to_numpy()
+    jours = jours.fillna(0).astype(int).to_numpy()
+    en_retard = ~paye & ~sans_echeance & (jours > 0)
+    aujourdhui_meme = ~paye & ~sans_echeance & (jours == 0)
+    proche = ~paye & ~sans_echeance & (jours < 0) & (jours >= -3)
+    
+    statut = np.select(
+        [paye, en_retard & (jours <= 3), en_retard, aujourdhui_meme, proche],
+        ['PAYE', 'À SURVEILLER', 'EN RETARD', "AUJOURD'HUI", 'À SURVEILLER'],
+        default='À RELANCER')
+    situation = np.select(
+        [paye, en_retard, aujourdhui_meme | proche],
+        ['SOLDE', 'EN RETARD', 'À ÉCHÉANCE'],
+        default='EN COURS')
+    return statut, situation, np.where(en_retard, jours, 0)
+
+def preparer_import(df, created_by, date_format='auto'):
+    """Valide et convertit un fichier d'import colonne par colonne.
+
+    Retourne (lignes valides prêtes à insérer, lignes ignorées, lignes en erreur) ;
+    les deux derniers sont des listes de {'ligne', 'raison'} avec le numéro de
+    ligne du fichier (en-tête = ligne 1).
+    """
+    import pandas as pd
+    df = df.rename(columns=lambda c: str(c).strip())
+    numeros = pd.Series(df.index + 2, index=df.index)
+    aujourdhui = datetime.now().date()
+    formats = FORMATS_DATE.get(date_format, FORMATS_DATE['auto'])
+    
+    commercial = _texte(_colonne(df, 'Commercial'))
+    client = _texte(_colonne(df, 'Client'))
+    montant_brut = _colonne(df, 'Montant')
+    versement_brut = _colonne(df, 'Versement')
+    montant = pd.to_numeric(montant_brut, errors='coerce')
+    versement = pd.to_numeric(versement_brut, errors='coerce')
+    
+    raisons_ignore = pd.Series(pd.NA, index=df.index, dtype='object')
+    raisons_erreur = pd.Series(pd.NA, index=df.index, dtype='object')
+    
+    def signaler(raisons, masque, raison):
+        raisons[masque & raisons.isna() & raisons_ignore.isna()] = raison
+    
+    signaler(raisons_ignore, commercial.isna().to_numpy(), 'Commercial manquant')
+    signaler(raisons_ignore, client.isna().to_numpy(), 'Client manquant')
+    signaler(raisons_ignore, montant_brut.isna().to_numpy(), 'Montant manquant')
+    signaler(raisons_ignore, montant.isna().to_numpy(), 'Montant non numérique')
+    signaler(raisons_ignore, (versement.isna() & versement_brut.notna()).to_numpy(), 'Versement non numérique')
+    versement = versement.fillna(0)
+    
+    signaler(raisons_erreur, (montant <= 0).to_numpy(), 'Le montant doit être supérieur à 0')
+    signaler(raisons_erreur, (versement < 0).to_numpy(), 'Le versement ne peut pas être négatif')
+    signaler(raisons_erreur, (versement > montant).to_numpy(), 'Le versement dépasse le montant')
+    
+    date_facturation = convertir_dates(_colonne(df, 'Date Facturation'), formats)
+    date_facturation = date_facturation.fillna(pd.Timestamp(aujourdhui))
+    date_echeance = convertir_dates(_colonne(df, 'Date Échéance'), formats)
+    
+    valides = raisons_ignore.isna() & raisons_erreur.isna()
+    solde = montant - versement
+    statut, situation, jours_retard = statuts_vectoriels(solde[valides], date_echeance[valides], aujourdhui)
+    
+    lignes = pd.DataFrame({
+        'commercial': commercial[valides],
+        'client': client[valides],
+        'marche': _texte(_colonne(df, 'Marché'))[valides],
+        'montant': montant[valides],
+        'versement': versement[valides],
+        'solde': solde[valides],
+        'date_facturation': date_facturation[valides].dt.date,
+        'date_echeance': date_echeance[valides].dt.date,
+        'jours_retard': jours_retard,
+        'statut': statut,
+        'situation_paiement': situation,
+        'commentaires': _texte(_colonne(df, 'Commentaires'))[valides],
+    })
+    lignes['client_recherche'] = lignes['client'].map(normaliser_nom)
+    lignes['date_creation'] = datetime.now()
+    lignes['created_by'] = created_by
+    lignes = lignes[COLONNES_IMPORT].astype(object).where(lignes.notna(), None)
+    
+    def details(raisons):
+        presentes = raisons.notna()
+        return [{'ligne': int(n), 'raison': r} for n, r in zip(numeros[presentes], raisons[presentes])]
+    
+    return lignes, details(raisons_ignore), details(raisons_erreur)
+
+def csv_pour_copy(lignes):
+    """CSV du COPY : colonnes entières écrites en entiers (jamais 1.0), NULL en champ vide."""
+    entieres = [c.name for c in Creance.__table__.columns
+                if isinstance(c.type, db.Integer) and c.name in lignes.columns]
+    tampon = StringIO()
+    lignes.astype({nom: 'Int64' for nom in entieres}).to_csv(
+        tampon, header=False, index=False, na_rep='', date_format='%Y-%m-%d %H:%M:%S')
+    tampon.seek(0)
+    return tampon
+
+def _inserer_par_copy(lignes):
+    """COPY ... FROM STDIN (psycopg2) : chemin le plus rapide sur PostgreSQL."""
+    tampon = csv_pour_copy(lignes)
+    curseur = db.session.connection().connection.dbapi_connection.cursor()
+    curseur.copy_expert(f"COPY creances ({', '.join(lignes.columns)}) FROM STDIN WITH (FORMAT csv)", tampon)
+
+def _reserver_ids(nombre):
+    """Ids pris d'avance dans la séquence de creances (COPY ne retourne pas les id insérés)."""
+    return [id_ for (id_,) in db.session.execute(db.text(
+        "SELECT nextval(pg_get_serial_sequence('creances', 'id')) FROM generate_series(1, :nombre)"
+    ), {'nombre': nombre})]
+
+def inserer_creances_en_masse(lignes, taille_lot=TAILLE_LOT_IMPORT, progression=None):
+    """Insère les lignes préparées par lots, dans la transaction courante.
+
+    Le versement initial de chaque lot est journalisé d'après les id de ce lot
+    (réservés pour COPY, RETURNING sinon) : une créance saisie pendant l'import
+    par le même utilisateur n'est jamais reprise.
+    progression(fraction) est appelée après chaque lot avec la part déjà insérée.
+    """
+    copy_possible = db.engine.dialect.name == 'postgresql' and db.engine.dialect.driver == 'psycopg2'
+    lignes = attribuer_references(lignes)
+    total = len(lignes)
+    for debut in range(0, total, taille_lot):
+        lot = lignes.iloc[debut:debut + taille_lot]
+        if copy_possible:
+            ids = _reserver_ids(len(lot))
+            _inserer_par_copy(lot.assign(id=ids))
+            marquer_creances_modifiees(db.session)
+        else:
+            ids = db.session.execute(
+                db.insert(Creance.__table__).returning(Creance.__table__.c.id), lot.to_dict('records')
+            ).scalars().all()
+        journaliser_versements_initiaux(Creance.id.in_(ids))
+        if progression:
+            progression(min(debut + taille_lot, total) / total)
+    rafraichir_soldes_clients(db.session.connection(), lignes['client_id'].unique().tolist())
+
+def importer_creances(df, created_by, date_format='auto', ignorer_erreurs=True, progression=None):
+    """Importe un DataFrame lu depuis un fichier Excel/CSV ; retourne le rapport d'import.
+
+    progression(pourcentage, message) est appelée à chaque étape si fournie.
+    """
+    debut = time.perf_counter()
+    if progression:
+        progression(5, 'Validation des données')
+    lignes, ignorees, erreurs = preparer_import(df, created_by, date_format)
+    
+    importees = 0
+    if lignes.shape[0] and (ignorer_erreurs or not erreurs):
+        suivi_lots = None
+        if progression:
+            suivi_lots = lambda fraction: progression(20 + int(fraction * 75), 'Insertion des créances')
+        try:
+            inserer_creances_en_masse(lignes, progression=suivi_lots)
+            db.session.commit()
+            importees = lignes.shape[0]
+        except Exception:
+            db.session.rollback()
+            raise
+        synchroniser_index_clients()
+    
+    DUREE_IMPORTS.observer((), time.perf_counter() - debut)
+    LIGNES_IMPORTEES.inc(('importees',), importees)
+    LIGNES_IMPORTEES.inc(('ignorees',), len(ignorees))
+    LIGNES_IMPORTEES.inc(('erreurs',), len(erreurs))
+    return {
+        'imported': importees,
+        'errors': len(erreurs),
+        'ignored': len(ignorees),
+        'details': sorted(ignorees + erreurs, key=lambda d: d['ligne']),
+        'duree': round(time.perf_counter() - debut, 2)
+    }
+
+# ==================== EXPORT EXCEL ====================
+TAILLE_LOT_EXPORT = 2000
+TAILLE_BLOC_ENVOI = 64 * 1024
+
+COLONNES_EXPORT = [
+    ('ID', Creance.id),
+    ('Commercial', Creance.commercial),
+    ('Client', Creance.client),
+    ('Marché', Creance.marche),
+    ('Montant (FCFA)', Creance.montant),
+    ('Versement (FCFA)', Creance.versement),
+    ('Solde (FCFA)', Creance.solde),
+    ('Date Facturation', Creance.date_facturation),
+    ('Date Échéance', Creance.date_echeance),
+    ('Jours Retard', Creance.jours_retard),
+    ('Statut', Creance.statut),
+    ('Situation', Creance.situation_paiement),
+    ('Commentaires', Creance.commentaires),
+    ('Créé par', Creance.created_by),
+    ('Date Création', Creance.date_creation),
+]
+
+def requete_export(commercial=None, inclure_archive=False):
+    """SELECT des colonnes exportées (sans instancier d'objets Creance), dans l'ordre des ID.
+    
+    Avec inclure_archive, les créances archivées (sous leur numéro d'origine) sont ajoutées par UNION ALL.
+    """
+    query = db.select(*[colonne for _, colonne in COLONNES_EXPORT])
+    if commercial:
+        query = query.where(Creance.commercial == commercial)
+    if not inclure_archive:
+        return query.order_by(Creance.id)
+    
+    archive = db.select(*[
+        (CreanceArchive.creance_id if colonne.key == 'id' else getattr(CreanceArchive, colonne.key)).label(colonne.key)
+        for _, colonne in COLONNES_EXPORT])
+    if commercial:
+        archive = archive.where(CreanceArchive.commercial == commercial)
+    union = db.union_all(query, archive).subquery()
+    return db.select(*union.c).order_by(union.c.id)
+
+def lignes_brutes_export(commercial=None, taille_lot=TAILLE_LOT_EXPORT, inclure_archive=False):
+    """Lots de lignes lus par curseur serveur (yield_per) : la mémoire reste bornée à un lot."""
+    resultat = db.session.execute(
+        requete_export(commercial, inclure_archive).execution_options(yield_per=taille_lot, stream_results=True)
+    )
+    try:
+        for lot in resultat.partitions():
+            yield lot
+    finally:
+        resultat.close()
+
+def lignes_export(commercial=None, inclure_archive=False):
+    """Lignes formatées comme dans le classeur historique (dates jj/mm/aaaa, vides au lieu de NULL)."""
+    for lot in lignes_brutes_export(commercial, inclure_archive=inclure_archive):
+        for (id_, commercial_, client, marche, montant, versement, solde, date_facturation,
+             date_echeance, jours_retard, statut, situation, commentaires, cree_par, date_creation) in lot:
+            yield (
+                id_, commercial_, client, marche or '', montant, versement, solde,
+                date_facturation.strftime('%d/%m/%Y'),
+                date_echeance.strftime('%d/%m/%Y') if date_echeance else '',
+                jours_retard or 0, statut, situation, commentaires or '', cree_par or '',
+                date_creation.strftime('%d/%m/%Y %H:%M') if date_creation else ''
+            )
+
+def construire_export_excel(sortie, commercial=None, progression=None, inclure_archive=False):
+    """Écrit le classeur d'export des créances (limité à un commercial si indiqué) dans sortie.
+    
+    Classeur openpyxl en écriture seule : les lignes passent directement du curseur
+    au fichier, sans liste ni DataFrame intermédiaire.
+    """
+    debut = time.perf_counter()
+    total = db.session.execute(
+        db.select(db.func.count()).select_from(requete_export(commercial, inclure_archive).subquery())
+    ).scalar()
+    if progression:
+        progression(10, 'Écriture du classeur')
+    
+    from openpyxl import Workbook
+    classeur = Workbook(write_only=True)
+    try:
+        feuille = classeur.create_sheet('Créances')
+        feuille.append([entete for entete, _ in COLONNES_EXPORT])
+        nb_lignes = 0
+        for ligne in lignes_export(commercial, inclure_archive):
+            feuille.append(ligne)
+            nb_lignes += 1
+            if progression and total and nb_lignes % TAILLE_LOT_EXPORT == 0:
+                progression(10 + int(nb_lignes / total * 85), 'Écriture du classeur')
+        
+        if not commercial:
+            resume = classeur.create_sheet('Résumé')
+            resume.append(['Commercial', 'Nombre Clients'])
+            for nom, data in referentiel_commerciaux().items():
+                resume.append([nom, len(data['clients'])])
+        
+        classeur.save(sortie)
+    except BaseException:
+        # En écriture seule, chaque feuille passe par un fichier temporaire que save()
+        # supprime ; sans save(), openpyxl ne le supprime qu'à l'arrêt du processus.
+        for feuille in classeur.worksheets:
+            ecrivain = feuille._writer
+            if ecrivain is not None and os.path.exists(ecrivain.out):
+                if not feuille.closed:
+                    feuille.close()
+                ecrivain.cleanup()
+        raise
+    observer_export('xlsx', debut, nb_lignes)
+    return nb_lignes
+
+def flux_export_csv(commercial=None, inclure_archive=False):
+    """CSV (séparateur ';', BOM UTF-8 pour Excel) produit au fil de la lecture des lots."""
+    debut = time.perf_counter()
+    nb_lignes = 0
+    tampon = StringIO()
+    ecrivain = csv.writer(tampon, delimiter=';')
+    tampon.write('\ufeff')
+    ecrivain.writerow([entete for entete, _ in COLONNES_EXPORT])
+    for ligne in lignes_export(commercial, inclure_archive):
+        ecrivain.writerow(ligne)
+        nb_lignes += 1
+        if tampon.tell() >= TAILLE_BLOC_ENVOI:
+            yield tampon.getvalue().encode('utf-8')
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue().encode('utf-8')
+    observer_export('csv', debut, nb_lignes)
+
+# ==================== EXPORT COLONNAIRE ====================
+TAILLE_LOT_COLONNAIRE = 50000
+
+FORMATS_COLONNAIRES = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+}
+
+class _SortieFlux:
+    """Fichier en écriture seule dont on vide le contenu au fil de l'eau (pour pyarrow)."""
+    
+    def __init__(self):
+        self.blocs = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, donnees):
+        donnees = bytes(donnees)
+        self.blocs.append(donnees)
+        self.position += len(donnees)
+        return len(donnees)
+    
+    def tell(self):
+        return self.position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def vider(self):
+        contenu = b''.join(self.blocs)
+        self.blocs = []
+        return contenu
+
+def schema_export_arrow():
+    import pyarrow as pa
+    
+    return pa.schema([
+        ('ID', pa.int64()),
+        ('Commercial', pa.string()),
+        ('Client', pa.string()),
+        ('Marché', pa.string()),
+        ('Montant (FCFA)', pa.int64()),
+        ('Versement (FCFA)', pa.int64()),
+        ('Solde (FCFA)', pa.int64()),
+        ('Date Facturation', pa.date32()),
+        ('Date Échéance', pa.date32()),
+        ('Jours Retard', pa.int64()),
+        ('Statut', pa.string()),
+        ('Situation', pa.string()),
+        ('Commentaires', pa.string()),
+        ('Créé par', pa.string()),
+        ('Date Création', pa.timestamp('s')),
+    ])
+
+def lots_export_arrow(commercial=None, taille_lot=TAILLE_LOT_COLONNAIRE, inclure_archive=False):
+    """RecordBatch typés (montants arrondis au franc) construits colonne par colonne à partir des lots SQL."""
+    import pyarrow as pa
+    
+    schema = schema_export_arrow()
+    montants = {'Montant (FCFA)', 'Versement (FCFA)', 'Solde (FCFA)'}
+    for lot in lignes_brutes_export(commercial, taille_lot, inclure_archive):
+        colonnes = []
+        for champ, valeurs in zip(schema, zip(*lot)):
+            if champ.name in montants:
+                valeurs = [None if v is None else int(round(v)) for v in valeurs]
+            elif champ.name == 'Jours Retard':
+                valeurs = [v or 0 for v in valeurs]
+            elif champ.name == 'Date Création':
+                valeurs = [v.replace(microsecond=0) if v else None for v in valeurs]
+            colonnes.append(pa.array(valeurs, type=champ.type))
+        yield pa.RecordBatch.from_arrays(colonnes, schema=schema)
+
+def flux_export_colonnaire(format_export, commercial=None, inclure_archive=False):
+    """Fichier parquet, arrow (IPC) ou csv émis lot par lot : chaque RecordBatch part dès qu'il est écrit."""
+    import pyarrow as pa
+    
+    debut = time.perf_counter()
+    nb_lignes = 0
+    schema = schema_export_arrow()
+    sortie = _SortieFlux()
+    fichier = pa.PythonFile(sortie, mode='w')
+    if format_export == 'parquet':
+        import pyarrow.parquet as pq
+        ecrivain = pq.ParquetWriter(fichier, schema, compression='zstd')
+        ecrire = ecrivain.write_batch
+    elif format_export == 'arrow':
+        ecrivain = pa.ipc.new_file(fichier, schema)
+        ecrire = ecrivain.write_batch
+    else:
+        import pyarrow.csv as pacsv
+        ecrivain = pacsv.CSVWriter(fichier, schema)
+        ecrire = ecrivain.write_batch
+    
+    for lot in lots_export_arrow(commercial, inclure_archive=inclure_archive):
+        ecrire(lot)
+        nb_lignes += lot.num_rows
+        yield sortie.vider()
+    ecrivain.close()
+    yield sortie.vider()
+    observer_export(format_export, debut, nb_lignes)
+
+# ==================== TÂCHES EN ARRIÈRE-PLAN ====================
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+JOBS_DUREE_CONSERVATION = timedelta(hours=24)
+JOBS_BATTEMENT = int(os.environ.get('JOBS_BATTEMENT', 30))  # secondes entre deux signes de vie
+JOBS_DELAI_ABANDON = int(os.environ.get('JOBS_DELAI_ABANDON', 600))  # sans signe de vie : tâche abandonnée
+_executeur_jobs = ThreadPoolExecutor(max_workers=JOBS_WORKERS, thread_name_prefix='job')
+
+# Progression des tâches de ce processus. Elle est aussi écrite dans la table jobs
+# par une transaction courte, hors de la session de la tâche (l'import tient sa propre
+# transaction), pour que tous les workers la voient. Un thread note le signe de vie
+# des tâches du processus : une tâche sans signe de vie récent a perdu son worker.
+_progression_jobs = {}
+_verrou_jobs = threading.Lock()
+_battement_jobs_demarre = False
+
+def ecrire_jobs(ids, **valeurs):
+    """UPDATE jobs dans sa propre transaction, sans attendre un verrou SQLite.
+
+    Sous SQLite, l'import verrouille la base jusqu'à son commit : la mise à jour
+    est alors abandonnée, l'état final étant écrit à la fin de la tâche.
+    """
+    with db.engine.connect() as connexion:
+        sqlite = connexion.dialect.name == 'sqlite'
+        if sqlite:
+            delai = connexion.exec_driver_sql('PRAGMA busy_timeout').scalar()
+            connexion.exec_driver_sql('PRAGMA busy_timeout = 0')
+        try:
+            connexion.execute(db.update(Job).where(Job.id.in_(ids)).values(**valeurs))
+            connexion.commit()
+        except OperationalError:
+            connexion.rollback()
+            if not sqlite:
+                raise
+        finally:
+            if sqlite:
+                connexion.exec_driver_sql(f'PRAGMA busy_timeout = {delai}')
+                connexion.commit()
+
+def _battre_jobs():
+    while True:
+        time.sleep(JOBS_BATTEMENT)
+        ids = list(_progression_jobs)
+        if ids:
+            try:
+                with app.app_context():
+                    ecrire_jobs(ids, battement=datetime.now())
+            except Exception:
+                traceback.print_exc()
+
+def abandonner_jobs_orphelins(*filtres):
+    """Passe en erreur les tâches non terminées sans signe de vie depuis JOBS_DELAI_ABANDON.
+
+    Leur worker a été arrêté (redémarrage, déploiement) : elles ne finiront jamais.
+    """
+    limite = datetime.now() - timedelta(seconds=JOBS_DELAI_ABANDON)
+    nb = db.session.execute(
+        db.update(Job).where(
+            *filtres,
+            Job.statut.in_(['en_attente', 'en_cours']),
+            db.func.coalesce(Job.battement, Job.date_creation) < limite,
+            Job.id.notin_(list(_progression_jobs)),
+        ).values(statut='erreur', message='Tâche interrompue (arrêt du serveur)', date_fin=datetime.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return nb
+
+def dossier_jobs():
+    dossier = os.environ.get('JOBS_DIR') or os.path.join(app.instance_path, 'jobs')
+    os.makedirs(dossier, exist_ok=True)
+    return dossier
+
+def purger_jobs():
+    """Supprime les tâches terminées (et leurs fichiers) plus anciennes que la durée de conservation.
+
+    Supprime aussi les fichiers du dossier qu'aucune tâche ne référence : fichiers
+    importés ou exports partiels laissés par un worker arrêté en cours de tâche.
+    """
+    abandonner_jobs_orphelins()
+    limite = datetime.now() - JOBS_DUREE_CONSERVATION
+    for job in Job.query.filter(Job.date_creation < limite, Job.statut.in_(['termine', 'erreur'])).all():
+        if job.fichier and os.path.exists(job.fichier):
+            os.remove(job.fichier)
+        db.session.delete(job)
+    db.session.commit()
+    
+    references = {fichier for fichier, in db.session.query(Job.fichier).filter(Job.fichier.isnot(None))}
+    with os.scandir(dossier_jobs()) as entrees:
+        for entree in entrees:
+            if (entree.is_file() and entree.path not in references
+                    and datetime.fromtimestamp(entree.stat().st_mtime) < limite):
+                os.remove(entree.path)
+
+def lancer_job(type_job, fonction, cree_par, **parametres):
+    """Enregistre une tâche et l'exécute dans le pool ; fonction(job_id, progression, **parametres)."""
+    global _battement_jobs_demarre
+    job = Job(id=uuid.uuid4().hex, type=type_job, cree_par=cree_par, message='En attente', battement=datetime.now())
+    db.session.add(job)
+    db.session.commit()
+    _progression_jobs[job.id] = (0, 'En attente')
+    with _verrou_jobs:
+        demarrer = not _battement_jobs_demarre
+        _battement_jobs_demarre = True
+    if demarrer:
+        threading.Thread(target=_battre_jobs, name='battement-jobs', daemon=True).start()
+    _executeur_jobs.submit(_executer_job, job.id, fonction, parametres)
+    return job.id
+
+def _executer_job(job_id, fonction, parametres):
+    with app.app_context():
+        def progression(pourcentage, message=None):
+            precedent = _progression_jobs.get(job_id)
+            _progression_jobs[job_id] = (pourcentage, message)
+            if precedent != (pourcentage, message):
+                ecrire_jobs([job_id], progression=pourcentage, message=message, battement=datetime.now())
+        
+        job = db.session.get(Job, job_id)
+        job.statut = 'en_cours'
+        job.battement = datetime.now()
+        db.session.commit()
+        try:
+            resultat, fichier = fonction(job_id, progression, **parametres)
+            job = db.session.get(Job, job_id)
+            job.statut = 'termine'
+            job.progression = 100
+            job.message = 'Terminé'
+            job.resultat = json.dumps(resultat, default=str)
+            job.fichier = fichier
+        except Exception as e:
+            db.session.rollback()
+            traceback.print_exc()
+            job = db.session.get(Job, job_id)
+            job.statut = 'erreur'
+            job.message = str(e)[:200]
+        job.date_fin = datetime.now()
+        db.session.commit()
+        _progression_jobs.pop(job_id, None)
+        db.session.remove()
+
+def etat_job(job):
+    progression, message = _progression_jobs.get(job.id, (job.progression, job.message))
+    return {
+        'id': job.id,
+        'type': job.type,
+        'statut': job.statut,
+        'progression': progression,
+        'message': message,
+        'resultat': json.loads(job.resultat) if job.resultat else None,
+        'telechargement': url_for('telecharger_job', job_id=job.id) if job.fichier else None
+    }
+
+def job_import(job_id, progression, chemin, created_by, date_format, ignorer_erreurs):
+    progression(2, 'Lecture du fichier')
+    try:
+        df = lire_fichier_import(chemin)
+        resultat = importer_creances(df, created_by, date_format, ignorer_erreurs, progression=progression)
+    finally:
+        os.remove(chemin)
+    return resultat, None
+
+def job_export(job_id, progression, commercial, inclure_archive=False):
+    progression(5, 'Lecture des créances')
+    chemin = os.path.join(dossier_jobs(), f'{job_id}.xlsx')
+    try:
+        lignes = construire_export_excel(chemin, commercial, progression=progression, inclure_archive=inclure_archive)
+    except BaseException:
+        # Une tâche en erreur n'a pas de fichier : purger_jobs ne le retrouverait pas
+        if os.path.exists(chemin):
+            os.remove(chemin)
+        raise
+    return {'lignes': lignes}, chemin
+
+# ==================== RECALCUL QUOTIDIEN DES STATUTS ====================
+def _jours_depuis(colonne, aujourdhui):
+    """Nombre de jours entre une colonne date et aujourd'hui, selon le dialecte."""
+    if db.engine.dialect.name == 'sqlite':
+        return db.cast(db.func.julianday(aujourdhui.isoformat()) - db.func.julianday(colonne), db.Integer)
+    return db.cast(db.literal(aujourdhui, db.Date) - colonne, db.Integer)
+
+def expressions_statut(aujourdhui):
+    """Équivalent SQL de Creance.update_statut() : (statut, situation_paiement, jours_retard)."""
+    echeance = Creance.date_echeance
+    paye = Creance.solde <= 0
+    en_retard = db.and_(echeance.isnot(None), echeance < aujourdhui)
+    echeance_jour = echeance == aujourdhui
+    proche = db.and_(echeance.isnot(None), echeance <= aujourdhui + timedelta(days=3))
+
+    statut = db.case(
+        (paye, 'PAYE'),
+        (db.and_(en_retard, echeance >= aujourdhui - timedelta(days=3)), 'À SURVEILLER'),
+        (en_retard, 'EN RETARD'),
+        (echeance_jour, "AUJOURD'HUI"),
+        (proche, 'À SURVEILLER'),
+        else_='À RELANCER'
+    )
+    situation = db.case(
+        (paye, 'SOLDE'),
+        (en_retard, 'EN RETARD'),
+        (proche, 'À ÉCHÉANCE'),
+        else_='EN COURS'
+    )
+    jours = db.case(
+        (db.and_(db.not_(paye), en_retard), _jours_depuis(echeance, aujourdhui)),
+        else_=0
+    )
+    return statut, situation, jours
+
+def recalculer_statuts(aujourdhui=None):
+    """Bascule quotidienne : recalcule statut, situation et jours de retard en deux requêtes.
+
+    Seules les lignes dont une des trois colonnes change sont réécrites. Retourne
+    le nombre de lignes mises à jour et les changements de statut par transition.
+    """
+    aujourdhui = aujourdhui or datetime.now().date()
+    debut = datetime.now()
+    statut, situation, jours = expressions_statut(aujourdhui)
+
+    perime = db.or_(
+        Creance.statut.is_distinct_from(statut),
+        Creance.situation_paiement.is_distinct_from(situation),
+        Creance.jours_retard.is_distinct_from(jours)
+    )
+
+    try:
+        sans_delai_requetes(db.session.connection())
+        transitions = db.session.query(
+            Creance.statut, statut.label('nouveau'), db.func.count(Creance.id)
+        ).filter(Creance.statut.is_distinct_from(statut)).group_by(Creance.statut, statut).all()
+
+        resultat = db.session.execute(
+            db.update(Creance)
+            .where(perime)
+            .values(statut=statut, situation_paiement=situation, jours_retard=jours)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'lignes_mises_a_jour': resultat.rowcount,
+        'changements_statut': sum(n for _, _, n in transitions),
+        'transitions': {(ancien or '-', nouveau): n for ancien, nouveau, n in transitions},
+        'duree': (datetime.now() - debut).total_seconds()
+    }
+
+@app.cli.command('recalculer-statuts')
+@click.option('--date', 'date_str', default=None, help="Date de référence AAAA-MM-JJ (défaut : aujourd'hui)")
+def recalculer_statuts_command(date_str):
+    """Recalcule statut, situation_paiement et jours_retard de toutes les créances."""
+    aujourdhui = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else None
+    rapport = recalculer_statuts(aujourdhui)
+    print(f"✅ {rapport['lignes_mises_a_jour']} créances mises à jour en {rapport['duree']:.2f}s")
+    print(f"🔁 {rapport['changements_statut']} changements de statut")
+    for (ancien, nouveau), n in sorted(rapport['transitions'].items()):
+        print(f"   - {ancien} → {nouveau}: {n}")
+
+def demarrer_planificateur(heure=None):
+    """Lance en tâche de fond la bascule quotidienne à l'heure HH:MM indiquée."""
+    heure = heure or os.environ.get('RECALCUL_STATUTS_HEURE', '00:05')
+    heures, minutes = (int(x) for x in heure.split(':'))
+
+    def boucle():
+        while True:
+            maintenant = datetime.now()
+            prochain = maintenant.replace(hour=heures, minute=minutes, second=0, microsecond=0)
+            if prochain <= maintenant:
+                prochain += timedelta(days=1)
+            time.sleep((prochain - maintenant).total_seconds())
+            with app.app_context():
+                try:
+                    rapport = recalculer_statuts()
+                    print(f"🔁 Recalcul des statuts: {rapport['lignes_mises_a_jour']} lignes, "
+                          f"{rapport['changements_statut']} changements de statut")
+                    prendre_instantane(date.today() - timedelta(days=1))
+                except Exception as e:
+                    print(f"⚠️ Erreur lors du recalcul des statuts: {str(e)}")
+
+    thread = threading.Thread(target=boucle, name='recalcul-statuts', daemon=True)
+    thread.start()
+    return thread
+
+# Tâches en arrière-plan
+@app.route('/api/jobs/import', methods=['POST'])
+@login_required
+def api_job_import():
+    if current_user.role != 'admin':
+        return jsonify({'erreur': 'Accès réservé aux administrateurs'}), 403
+    
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'erreur': 'Aucun fichier reçu'}), 400
+    
+    purger_jobs()
+    extension = os.path.splitext(file.filename)[1].lower() or '.xlsx'
+    chemin = os.path.join(dossier_jobs(), f'import_{uuid.uuid4().hex}{extension}')
+    file.save(chemin)
+    
+    try:
+        job_id = lancer_job('import', job_import, current_user.username,
+                            chemin=chemin,
+                            created_by=current_user.username,
+                            date_format=request.form.get('date_format', 'auto'),
+                            ignorer_erreurs='ignore_errors' in request.form)
+    except BaseException:
+        os.remove(chemin)
+        raise
+    return jsonify({'job_id': job_id, 'suivi': url_for('api_job', job_id=job_id)}), 202
+
+@app.route('/api/jobs/export', methods=['POST'])
+@login_required
+def api_job_export():
+    purger_jobs()
+    job_id = lancer_job('export', job_export, current_user.username, commercial=portefeuille_courant(),
+                        inclure_archive=request.values.get('archive') == '1')
+    return jsonify({'job_id': job_id, 'suivi': url_for('api_job', job_id=job_id)}), 202
+
+def _job_autorise(job_id):
+    job = db.session.get(Job, job_id)
+    if not job or (current_user.role != 'admin' and job.cree_par != current_user.username):
+        abort(404)
+    return job
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job(job_id):
+    job = _job_autorise(job_id)
+    if abandonner_jobs_orphelins(Job.id == job.id):
+        db.session.refresh(job)
+    return jsonify(etat_job(job))
+
+@app.route('/exports/<job_id>')
+@login_required
+def suivi_export(job_id):
+    """Page d'attente d'un export Excel : suit la tâche puis lance le téléchargement."""
+    job = _job_autorise(job_id)
+    return render_template('suivi_export.html', job=job, suivi=url_for('api_job', job_id=job.id))
+
+@app.route('/api/jobs/<job_id>/telecharger')
+@login_required
+def telecharger_job(job_id):
+    job = _job_autorise(job_id)
+    if job.statut != 'termine' or not job.fichier or not os.path.exists(job.fichier):
+        abort(404)
+    return send_file(
+        job.fichier,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=f'creances_socoma_{job.date_creation.strftime("%Y%m%d_%H%M")}.xlsx'
+    )
+
 # ==================== GESTION DES ERREURS ====================
 @app.errorhandler(404)
 def page_not_found(e):
@@ -1022,12 +3883,81 @@ def internal_server_error(e):
 def forbidden(e):
     return render_template('403.html'), 403
 
+# ==================== INITIALISATION DE LA BASE ====================
+# Rien n'est exécuté à l'import du module : le schéma est créé par `flask init-db`
+# et les comptes par défaut par `flask seed` (commande de release sur Render).
+UTILISATEURS_PAR_DEFAUT = [
+    # (username, mot de passe, rôle, commercial)
+    ('DAOUDA CISSE', 'Csol2102@!*', 'admin', None),
+    ('CAMARA YAYA', 'Socoma2030@', 'commercial', 'YAYA CAMARA'),
+    ('BDM', 'Diallobdm2026@', 'user', None),
+]
+
+def initialiser_base():
+    """Crée les tables manquantes puis applique les migrations ; retourne les versions appliquées."""
+    db.create_all()
+    return appliquer_migrations()
+
+def creer_utilisateurs_par_defaut():
+    """Crée les comptes par défaut qui n'existent pas encore ; retourne leurs noms."""
+    existants = {username for (username,) in db.session.query(User.username)}
+    crees = []
+    for username, mot_de_passe, role, commercial in UTILISATEURS_PAR_DEFAUT:
+        if username in existants:
+            continue
+        utilisateur = User(username=username, role=role, commercial=commercial)
+        utilisateur.set_password(mot_de_passe)
+        db.session.add(utilisateur)
+        crees.append(username)
+    db.session.commit()
+    return crees
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Crée le schéma de la base et applique les migrations en attente."""
+    appliquees = initialiser_base()
+    print(f"✅ Tables de base de données créées ({db.engine.url.render_as_string(hide_password=True)})")
+    if appliquees:
+        print(f"✅ Migrations appliquées: {', '.join(str(v) for v in appliquees)}")
+
+@app.cli.command('seed')
+def seed_command():
+    """Crée les utilisateurs par défaut absents."""
+    crees = creer_utilisateurs_par_defaut()
+    if crees:
+        print("✅ Utilisateurs par défaut créés:")
+        for username, mot_de_passe, _, _ in UTILISATEURS_PAR_DEFAUT:
+            if username in crees:
+                print(f"   - {username} / {mot_de_passe}")
+    else:
+        print("✅ Utilisateurs existent déjà")
+
+# ==================== DÉMARRAGE ====================
+# Les routes sont déclarées sur l'objet app du module : gunicorn lance app:app.
+# L'import n'émet aucune requête, sauf INIT_DB_AU_DEMARRAGE=1 qui fait l'équivalent
+# de init-db + seed, pour les hébergements sans commande de release.
+with app.app_context():
+    configurer_moteur()
+    if PROFILAGE_ACTIF:
+        installer_profilage()
+
+if os.environ.get('INIT_DB_AU_DEMARRAGE') == '1':
+    with app.app_context():
+        initialiser_base()
+        creer_utilisateurs_par_defaut()
+
+# Un seul processus doit activer le planificateur (ex. RECALCUL_STATUTS_AUTO=1 sur un worker)
+if os.environ.get('RECALCUL_STATUTS_AUTO') == '1':
+    demarrer_planificateur()
+
 # ==================== POINT D'ENTRÉE PRINCIPAL ====================
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
+    with app.app_context():
+        initialiser_base()
+        creer_utilisateurs_par_defaut()
     print(f"\n🚀 Application SOCoMA démarrée sur le port {port}")
     print("🔑 Accès par défaut:")
-    print("   - admin / admin123")
-    print("   - commercial / commercial123")
-    print("   - user / user123")
+    for username, mot_de_passe, _, _ in UTILISATEURS_PAR_DEFAUT:
+        print(f"   - {username} / {mot_de_passe}")
     app.run(debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
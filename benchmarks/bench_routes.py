@@ -0,0 +1,136 @@
+"""Temps de réponse des routes principales sur un portefeuille synthétique.
+
+Usage (pip install pytest pytest-benchmark) :
+    BENCH_CREANCES=100k pytest benchmarks/bench_routes.py
+    BENCH_CREANCES=1M pytest benchmarks/bench_routes.py --benchmark-autosave
+    pytest-benchmark compare            # écart entre deux sauvegardes
+
+La base (générée par benchmarks/donnees.py au premier lancement, puis
+réutilisée) dépend de BENCH_CREANCES : 10k par défaut. DATABASE_URL est
+remplacé avant tout import de app (BENCH_DATABASE_URL pour une autre base). Le cache des résultats
+est vidé avant chaque mesure, pour chronométrer le calcul et non la lecture du
+cache. L'import ajoute 2 000 créances, retirées avant la mesure suivante.
+"""
+import os
+import sys
+import time
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import donnees  # noqa: E402  (n'importe pas app)
+
+NOMBRE = donnees.nombre_creances(os.environ.get('BENCH_CREANCES', '10k'))
+# Les mesures suppriment des créances : jamais la base de DATABASE_URL, sauf BENCH_DATABASE_URL explicite
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or donnees.url_base(NOMBRE)
+
+from app import (app, db, Creance, Paiement, cache_resultats, rafraichir_soldes_clients,  # noqa: E402
+                 synchroniser_index_clients)
+
+ADMIN = ('DAOUDA CISSE', 'Csol2102@!*')
+COMMERCIAL = ('CAMARA YAYA', 'Socoma2030@')
+LIGNES_IMPORT = 2000
+
+
+@pytest.fixture(scope='session')
+def base():
+    with app.app_context():
+        donnees.preparer_base(NOMBRE)
+        dernier_id = db.session.query(db.func.max(Creance.id)).scalar()
+        client = db.session.query(Creance.client).filter(Creance.commercial == 'YAYA CAMARA')\
+            .group_by(Creance.client).order_by(db.func.count(Creance.id).desc()).limit(1).scalar()
+        db.session.remove()
+    return {'dernier_id': dernier_id, 'client': client}
+
+
+def connecter(identifiants):
+    client = app.test_client()
+    reponse = client.post('/login', data={'username': identifiants[0], 'password': identifiants[1]})
+    assert reponse.status_code == 302
+    return client
+
+
+@pytest.fixture(scope='session', params=['admin', 'commercial'])
+def navigateur(request, base):
+    return connecter(ADMIN if request.param == 'admin' else COMMERCIAL)
+
+
+def mesurer(benchmark, appel, rounds=5):
+    """Mesure appel() à froid : cache des résultats vidé avant chaque tour."""
+    def executer():
+        reponse = appel()
+        assert reponse.status_code == 200, reponse.status_code
+        reponse.get_data()
+        return reponse
+    return benchmark.pedantic(executer, setup=cache_resultats.vider, rounds=rounds, warmup_rounds=1)
+
+
+def test_accueil(benchmark, navigateur):
+    mesurer(benchmark, lambda: navigateur.get('/'))
+
+
+def test_liste_creances(benchmark, navigateur):
+    mesurer(benchmark, lambda: navigateur.get('/creances'))
+
+
+def test_recap_clients(benchmark, navigateur):
+    mesurer(benchmark, lambda: navigateur.get('/recap-clients'))
+
+
+def test_detail_client(benchmark, navigateur, base):
+    mesurer(benchmark, lambda: navigateur.get(f"/client/{base['client'].replace(' ', '_')}"))
+
+
+def exporter_excel(navigateur):
+    """Bouton Export Excel : lancement de la tâche, suivi jusqu'à la fin, puis téléchargement."""
+    job_id = navigateur.get('/export-excel').location.rsplit('/', 1)[-1]
+    while True:
+        etat = navigateur.get(f'/api/jobs/{job_id}').get_json()
+        if etat['statut'] in ('termine', 'erreur'):
+            break
+        time.sleep(0.05)
+    assert etat['statut'] == 'termine', etat['message']
+    return navigateur.get(etat['telechargement'])
+
+
+def test_export_excel(benchmark, navigateur):
+    mesurer(benchmark, lambda: exporter_excel(navigateur), rounds=2)
+
+
+def _fichier_import():
+    tampon = BytesIO()
+    fichier = donnees.generer_fichier(LIGNES_IMPORT, graine=7)
+    fichier['Date Facturation'] = fichier['Date Facturation'].dt.strftime('%d/%m/%Y')
+    fichier['Date Échéance'] = fichier['Date Échéance'].dt.strftime('%d/%m/%Y')
+    fichier.to_csv(tampon, index=False)
+    return tampon.getvalue()
+
+
+def _retirer_import(dernier_id):
+    """Supprime les créances ajoutées par la mesure précédente et recalcule leurs soldes clients."""
+    with app.app_context():
+        ajoutees = db.session.query(Creance.client_id).filter(Creance.id > dernier_id).distinct().all()
+        if ajoutees:
+            db.session.execute(db.delete(Paiement).where(Paiement.creance_id > dernier_id))
+            db.session.execute(db.delete(Creance).where(Creance.id > dernier_id))
+            rafraichir_soldes_clients(db.session.connection(), [client_id for (client_id,) in ajoutees])
+            db.session.commit()
+            synchroniser_index_clients()
+        db.session.remove()
+
+
+def test_import_creances(benchmark, base):
+    navigateur = connecter(ADMIN)
+    contenu = _fichier_import()
+
+    def importer():
+        reponse = navigateur.post('/import-creances', content_type='multipart/form-data', data={
+            'file': (BytesIO(contenu), 'bench.csv'), 'date_format': 'dd/mm/yyyy', 'ignore_errors': 'on'})
+        assert reponse.status_code == 200, reponse.status_code
+        return reponse
+
+    try:
+        benchmark.pedantic(importer, setup=lambda: _retirer_import(base['dernier_id']), rounds=3)
+    finally:
+        _retirer_import(base['dernier_id'])
@@ -0,0 +1,126 @@
+"""Écritures concurrentes : profil du moteur par défaut contre profil optimisé.
+
+Usage :
+    python benchmarks/concurrence.py [--duree 20] [--ecrivains 4] [--lecteurs 4] [--lot-import 20000] [--creances 10k]
+
+Pour chaque profil (DB_PROFIL=defaut puis optimise), un processus neuf ouvre une
+copie de la même base synthétique (benchmarks/donnees.py). Pendant --duree
+secondes, plusieurs threads tournent en même temps :
+- des écrivains qui enregistrent des versements, comme modifier_creance ;
+- un import qui insère des lots de --lot-import créances, un lot par transaction ;
+- des lecteurs qui recalculent les statistiques de l'accueil.
+On compte les opérations réussies et les erreurs « database is locked ».
+Avec DATABASE_URL=postgresql://..., le même scénario mesure le pool PostgreSQL.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+
+
+def scenario(duree, ecrivains, lecteurs, lot):
+    """Exécuté dans le processus fils : retourne les compteurs par type d'opération."""
+    sys.path.insert(0, DOSSIER)
+    import donnees
+    from app import app, db, Creance, enregistrer_paiement, statistiques_portefeuille, \
+        preparer_import, inserer_creances_en_masse
+
+    with app.app_context():
+        ids = [i for (i,) in db.session.query(Creance.id).filter(Creance.solde > 1000)]
+        lot_import, _, _ = preparer_import(donnees.generer_fichier(lot, graine=3), 'concurrence')
+        db.session.remove()
+
+    compteurs = {nom: {'ok': 0, 'verrou': 0, 'autre': 0, 'attente_max': 0.0}
+                 for nom in ('ecriture', 'import', 'lecture')}
+    fin = time.monotonic() + duree
+
+    def boucle(nom, operation):
+        resultat = compteurs[nom]
+        with app.app_context():
+            while time.monotonic() < fin:
+                debut = time.perf_counter()
+                try:
+                    operation()
+                    db.session.commit()
+                    resultat['ok'] += 1
+                except Exception as e:
+                    db.session.rollback()
+                    resultat['verrou' if 'locked' in str(e) else 'autre'] += 1
+                resultat['attente_max'] = max(resultat['attente_max'], time.perf_counter() - debut)
+            db.session.remove()
+
+    def ecrire():
+        enregistrer_paiement(db.session.get(Creance, random.choice(ids)), 500, 'concurrence')
+
+    threads = [threading.Thread(target=boucle, args=('ecriture', ecrire)) for _ in range(ecrivains)]
+    threads.append(threading.Thread(target=boucle, args=('import', lambda: inserer_creances_en_masse(lot_import))))
+    threads += [threading.Thread(target=boucle, args=('lecture', statistiques_portefeuille)) for _ in range(lecteurs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return compteurs
+
+
+def mesurer(profil, url, args):
+    env = dict(os.environ, DB_PROFIL=profil, DATABASE_URL=url)
+    sortie = subprocess.run(
+        [sys.executable, __file__, '--fils', '--duree', str(args.duree),
+         '--ecrivains', str(args.ecrivains), '--lecteurs', str(args.lecteurs), '--lot-import', str(args.lot_import)],
+        env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(sortie.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duree', type=float, default=20)
+    parser.add_argument('--ecrivains', type=int, default=4)
+    parser.add_argument('--lecteurs', type=int, default=4)
+    parser.add_argument('--lot-import', type=int, default=20000)
+    parser.add_argument('--creances', default='10k')
+    parser.add_argument('--fils', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fils:
+        print(json.dumps(scenario(args.duree, args.ecrivains, args.lecteurs, args.lot_import)))
+        sys.exit(0)
+
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        # Base synthétique générée une fois, copiée pour que chaque profil parte du même état
+        sys.path.insert(0, DOSSIER)
+        import donnees
+        nombre = donnees.nombre_creances(args.creances)
+        modele = donnees.url_base(nombre)
+        subprocess.run([sys.executable, os.path.join(DOSSIER, 'donnees.py'), args.creances],
+                       env=dict(os.environ, DATABASE_URL=modele, DB_PROFIL='defaut'), check=True,
+                       stdout=subprocess.DEVNULL)
+
+    resultats = {}
+    for profil in ('defaut', 'optimise'):
+        if url:
+            resultats[profil] = mesurer(profil, url, args)
+            continue
+        dossier = tempfile.mkdtemp()
+        copie = os.path.join(dossier, 'concurrence.db')
+        shutil.copy(modele.removeprefix('sqlite:///'), copie)
+        try:
+            resultats[profil] = mesurer(profil, 'sqlite:///' + copie, args)
+        finally:
+            shutil.rmtree(dossier, ignore_errors=True)
+
+    print(f"\n{args.ecrivains} écrivains, 1 import ({args.lot_import} lignes par lot), "
+          f"{args.lecteurs} lecteurs pendant {args.duree:.0f}s")
+    print(f"{'profil':10s} {'opération':10s} {'réussies':>9s} {'/s':>8s} {'verrou':>7s} {'autres':>7s} {'attente max':>12s}")
+    for profil, compteurs in resultats.items():
+        for nom, c in compteurs.items():
+            print(f"{profil:10s} {nom:10s} {c['ok']:9d} {c['ok'] / args.duree:8.1f} {c['verrou']:7d} "
+                  f"{c['autre']:7d} {c['attente_max']:11.2f}s")
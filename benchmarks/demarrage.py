@@ -0,0 +1,80 @@
+"""Temps de démarrage d'un worker : import de app.py dans un processus neuf.
+
+Usage :
+    python benchmarks/demarrage.py [--avant REF_GIT] [--repetitions N]
+
+Chaque mesure lance un interpréteur Python qui importe le module app, comme le
+fait un worker gunicorn, et relève la durée de l'import, la mémoire maximale
+et la présence de pandas. Avec --avant, la même mesure est faite sur la
+version de app.py du commit indiqué (ex. --avant HEAD~1) pour comparer. La
+base SQLite est temporaire et partagée par les répétitions : comme sur Render,
+seul le premier démarrage trouve une base vide (il n'est pas compté).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESURE = """
+import resource, sys, time
+debut = time.perf_counter()
+import app
+duree = time.perf_counter() - debut
+print('{"import": %f, "rss_ko": %d, "pandas": %s}' % (
+    duree, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, str('pandas' in sys.modules).lower()))
+"""
+
+
+def mesurer(dossier, repetitions):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'demarrage.db'))
+    env.pop('RECALCUL_STATUTS_AUTO', None)
+    resultats = []
+    for i in range(repetitions + 1):
+        sortie = subprocess.run([sys.executable, '-c', MESURE], cwd=dossier, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        if i:  # le premier démarrage crée éventuellement le schéma
+            resultats.append(json.loads(sortie.strip().splitlines()[-1]))
+    return resultats
+
+
+def version_git(ref):
+    """Copie de travail minimale (app.py + gabarits) pour la révision ref."""
+    dossier = tempfile.mkdtemp()
+    source = subprocess.run(['git', 'show', f'{ref}:app.py'], cwd=RACINE,
+                            capture_output=True, text=True, check=True).stdout
+    with open(os.path.join(dossier, 'app.py'), 'w', encoding='utf-8') as f:
+        f.write(source)
+    shutil.copytree(os.path.join(RACINE, 'templates'), os.path.join(dossier, 'templates'))
+    return dossier
+
+
+def afficher(titre, resultats):
+    durees = [r['import'] * 1000 for r in resultats]
+    print(f"{titre:12s} import médian {statistics.median(durees):8.1f} ms "
+          f"(min {min(durees):.1f}, max {max(durees):.1f}) | "
+          f"mémoire {statistics.median(r['rss_ko'] for r in resultats) / 1024:6.1f} Mo | "
+          f"pandas chargé : {'oui' if resultats[0]['pandas'] else 'non'}")
+    return statistics.median(durees)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--avant', help='Révision git à comparer (ex. HEAD~1)')
+    parser.add_argument('--repetitions', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.avant:
+        dossier = version_git(args.avant)
+        try:
+            avant = afficher(args.avant, mesurer(dossier, args.repetitions))
+        finally:
+            shutil.rmtree(dossier, ignore_errors=True)
+    apres = afficher('actuel', mesurer(RACINE, args.repetitions))
+    if args.avant:
+        print(f"Gain : {avant - apres:.1f} ms par worker ({(1 - apres / avant) * 100:.0f} %)")
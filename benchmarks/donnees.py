@@ -0,0 +1,152 @@
+"""Portefeuille synthétique de grande taille (10k, 100k, 1M créances).
+
+Usage :
+    python benchmarks/donnees.py 100k [--graine 42]
+
+Sans DATABASE_URL, la base est un fichier SQLite du dossier temporaire,
+réutilisé par benchmarks/bench_routes.py pour la même taille. Le module app
+n'est importé qu'au premier besoin et jamais sur la base par défaut
+(instance/creances.db) : DATABASE_URL doit être fixé avant. Les lignes
+passent par le moteur d'import (preparer_import puis inserer_creances_en_masse) :
+référentiel, soldes par client et journal des paiements sont donc alimentés
+comme pour un vrai fichier, par lots (COPY sur PostgreSQL).
+
+Distributions :
+- clients : ceux de COMMERCIAUX_DATA plus des homonymes synthétiques rattachés
+  aux marchés de chaque commercial (environ 1 client pour 40 créances), avec une
+  activité très inégale (loi log-normale) ;
+- montants : log-normale centrée sur 2,5 M FCFA, arrondie à 5 000 ;
+- facturation sur les 18 derniers mois, échéance à 7, 15, 30, 45 ou 60 jours ;
+- paiements : soldées, partielles ou impayées selon que l'échéance est passée.
+"""
+import os
+import sys
+import tempfile
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+TAILLES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+TAILLE_LOT_GENERATION = 100_000
+CREE_PAR = 'generateur'
+BASE_PAR_DEFAUT = 'sqlite:///creances.db'  # base de développement de app.py, jamais remplie ici
+
+
+def nombre_creances(texte):
+    """'10k', '100k', '1M' ou un entier."""
+    return TAILLES.get(texte) or int(texte)
+
+
+def url_base(nombre):
+    return 'sqlite:///' + os.path.join(tempfile.gettempdir(), f'socoma_bench_{nombre}.db')
+
+
+def application():
+    """Module app, importé à la demande ; refuse la base par défaut de l'application."""
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit("⚠️ DATABASE_URL non défini : les mesures n'écrivent pas dans instance/creances.db")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app
+    if app.app.config['SQLALCHEMY_DATABASE_URI'] == BASE_PAR_DEFAUT:
+        raise SystemExit("⚠️ DATABASE_URL désigne la base par défaut de l'application")
+    return app
+
+
+def clients_synthetiques(nombre, rng):
+    """(commercial, client, marché, poids) : référentiel de départ complété d'homonymes."""
+    COMMERCIAUX_DATA = application().COMMERCIAUX_DATA
+    prenoms = sorted({c['prenom'] for data in COMMERCIAUX_DATA.values() for c in data['clients']})
+    noms = sorted({c['nom'] for data in COMMERCIAUX_DATA.values() for c in data['clients']})
+    clients = {(commercial, f"{c['prenom']} {c['nom']}"): c['marche']
+               for commercial, data in COMMERCIAUX_DATA.items() for c in data['clients']}
+    commerciaux = list(COMMERCIAUX_DATA)
+    marches = {commercial: sorted({c['marche'] for c in data['clients']}) for commercial, data in COMMERCIAUX_DATA.items()}
+
+    cible = min(max(len(clients), nombre // 40), len(prenoms) * len(noms) * len(commerciaux))
+    while len(clients) < cible:
+        commercial = commerciaux[rng.integers(len(commerciaux))]
+        cle = (commercial, f"{prenoms[rng.integers(len(prenoms))]} {noms[rng.integers(len(noms))]}")
+        clients.setdefault(cle, marches[commercial][rng.integers(len(marches[commercial]))])
+
+    poids = rng.lognormal(0, 1, len(clients))
+    return [(commercial, client, marche) for (commercial, client), marche in clients.items()], poids / poids.sum()
+
+
+def generer_fichier(nombre, graine=42, aujourdhui=None):
+    """DataFrame au format d'un fichier d'import (mêmes en-têtes que l'écran d'import)."""
+    rng = np.random.default_rng(graine)
+    aujourdhui = pd.Timestamp(aujourdhui or datetime.now().date())
+    clients, poids = clients_synthetiques(nombre, rng)
+    choix = rng.choice(len(clients), size=nombre, p=poids)
+    commercial, client, marche = (np.array(colonne, dtype=object)[choix] for colonne in zip(*clients))
+
+    montant = np.maximum(np.round(rng.lognormal(np.log(2_500_000), 0.8, nombre) / 5000) * 5000, 50_000)
+    facturation = aujourdhui - pd.to_timedelta(rng.integers(0, 540, nombre), unit='D')
+    echeance = facturation + pd.to_timedelta(rng.choice([7, 15, 30, 45, 60], nombre, p=[.1, .3, .35, .15, .1]), unit='D')
+
+    echue = np.asarray(echeance < aujourdhui)
+    tirage = rng.random(nombre)
+    solde_complet = np.where(echue, tirage < .65, tirage < .15)
+    partiel = ~solde_complet & np.where(echue, tirage < .85, tirage < .5)
+    versement = np.where(solde_complet, montant, 0.0)
+    versement = np.where(partiel, np.round(montant * rng.beta(2, 2, nombre) / 5000) * 5000, versement)
+
+    return pd.DataFrame({
+        'Commercial': commercial,
+        'Client': client,
+        'Marché': marche,
+        'Montant': montant,
+        'Versement': np.minimum(versement, montant),
+        'Date Facturation': facturation,
+        'Date Échéance': echeance,
+        'Commentaires': None,
+    })
+
+
+def charger(nombre, graine=42, progression=print):
+    """Insère nombre créances générées dans la base de l'application (contexte applicatif requis)."""
+    app = application()
+    debut = time.perf_counter()
+    for depart in range(0, nombre, TAILLE_LOT_GENERATION):
+        taille = min(TAILLE_LOT_GENERATION, nombre - depart)
+        lignes, _, erreurs = app.preparer_import(generer_fichier(taille, graine + depart), CREE_PAR)
+        assert not erreurs, erreurs[:5]
+        # Date de création = date de facturation, pour que la liste triée par date soit réaliste
+        lignes['date_creation'] = [datetime.combine(jour, datetime.min.time()) for jour in lignes['date_facturation']]
+        app.inserer_creances_en_masse(lignes)
+        app.db.session.commit()
+        progression(f"   {depart + taille:>9} créances ({time.perf_counter() - debut:.1f}s)")
+    app.synchroniser_index_clients()
+    return time.perf_counter() - debut
+
+
+def preparer_base(nombre, graine=42, progression=print):
+    """Schéma, comptes par défaut et jeu de données (générés seulement si la base est vide)."""
+    app = application()
+    db, Creance = app.db, app.Creance
+    app.initialiser_base()
+    app.creer_utilisateurs_par_defaut()
+    existantes = db.session.query(db.func.count(Creance.id)).scalar()
+    if existantes == 0:
+        progression(f"Génération de {nombre} créances...")
+        charger(nombre, graine, progression)
+    elif existantes < nombre:
+        progression(f"⚠️ La base contient déjà {existantes} créances, rien n'est ajouté")
+    return db.session.query(db.func.count(Creance.id)).scalar()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('nombre', type=nombre_creances, help='10k, 100k, 1M ou un entier')
+    parser.add_argument('--graine', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', url_base(args.nombre))
+    app = application()
+    with app.app.app_context():
+        print(f"Base : {app.db.engine.url.render_as_string(hide_password=True)}")
+        total = preparer_base(args.nombre, args.graine)
+        print(f"✅ {total} créances dans la base")
@@ -0,0 +1,121 @@
+"""Plans d'exécution des requêtes des routes, avant et après les index de creances.
+
+Usage :
+    python benchmarks/plans_index.py [nombre_de_creances]
+
+Par défaut une base SQLite temporaire est créée et remplie. Avec
+DATABASE_URL=postgresql://... le script utilise cette base (qui doit déjà
+contenir des données) et affiche EXPLAIN ANALYZE : les index sont supprimés
+puis recréés, à ne lancer que sur une copie.
+
+Les créances sont générées par benchmarks/donnees.py (moteur d'import) : les
+colonnes commercial_id, client_id et marche_id sont donc renseignées comme en
+production. REQUETES reprend le SQL émis par les fonctions de app.py nommées
+en commentaire ; à mettre à jour avec elles.
+"""
+import os
+import sys
+import tempfile
+import time
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'plans_index.db')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import app, db, Creance, initialiser_base, normaliser_nom  # noqa: E402
+import donnees  # noqa: E402
+
+COMMERCIAL = 'YAYA CAMARA'
+CLIENT = 'FANTA DIARRA'
+
+# Forme SQL des requêtes émises par chaque route
+REQUETES = {
+    # statistiques_portefeuille
+    'accueil / tableau_bord (commercial)': (
+        "SELECT commerciaux.nom, count(creances.id), sum(creances.montant), sum(creances.versement), "
+        "sum(creances.solde), "
+        "sum(CASE WHEN creances.situation_paiement = 'EN RETARD' THEN creances.solde ELSE 0 END), "
+        "sum(CASE WHEN creances.situation_paiement = 'EN RETARD' THEN 1 ELSE 0 END), "
+        "sum(CASE WHEN creances.solde > 0 THEN 1 ELSE 0 END), count(DISTINCT creances.client_id) "
+        "FROM creances JOIN commerciaux ON commerciaux.id = creances.commercial_id "
+        "WHERE commerciaux.nom = :commercial GROUP BY commerciaux.id, commerciaux.nom"),
+    # liste_creances
+    'liste_creances (commercial, 1re page)': (
+        "SELECT * FROM creances WHERE commercial = :commercial "
+        "ORDER BY date_creation DESC, id DESC LIMIT 51"),
+    'liste_creances (admin, 1re page)': (
+        "SELECT * FROM creances ORDER BY date_creation DESC, id DESC LIMIT 51"),
+    # detail_client (connecté en commercial)
+    'detail_client': (
+        "SELECT * FROM creances WHERE client_id IN ("
+        "SELECT clients.id FROM clients JOIN commerciaux ON commerciaux.id = clients.commercial_id "
+        "WHERE clients.cle = :cle AND commerciaux.nom = :commercial) "
+        "ORDER BY date_creation DESC"),
+    # top_retards
+    'top_retards (commercial)': (
+        "SELECT id, client, commercial, solde, jours_retard FROM creances "
+        "WHERE situation_paiement = 'EN RETARD' AND commercial = :commercial "
+        "ORDER BY coalesce(jours_retard, 0) DESC, id LIMIT 5"),
+    # balance_agee (axe commercial ; les CASE par tranche d'âge ne changent pas le plan)
+    'balance âgée (commercial)': (
+        "SELECT commerciaux.nom, count(creances.id), sum(creances.solde) "
+        "FROM creances JOIN commerciaux ON commerciaux.id = creances.commercial_id "
+        "WHERE creances.solde > 0 AND commerciaux.nom = :commercial "
+        "GROUP BY commerciaux.id, commerciaux.nom"),
+}
+PARAMS = {'commercial': COMMERCIAL, 'cle': normaliser_nom(CLIENT)}
+
+
+def remplir(nombre):
+    """Créances générées par le moteur d'import : référentiel et clés étrangères renseignés."""
+    donnees.charger(nombre)
+
+
+def plan(sql):
+    if db.engine.dialect.name == 'sqlite':
+        lignes = db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql), PARAMS).fetchall()
+        return [ligne[-1] for ligne in lignes]
+    lignes = db.session.execute(db.text('EXPLAIN ANALYZE ' + sql), PARAMS).fetchall()
+    return [ligne[0] for ligne in lignes]
+
+
+def chronometrer(sql, repetitions=20):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        db.session.execute(db.text(sql), PARAMS).fetchall()
+    return (time.perf_counter() - debut) / repetitions * 1000
+
+
+def mesurer(titre):
+    print(f"\n===== {titre} =====")
+    resultats = {}
+    for nom, sql in REQUETES.items():
+        resultats[nom] = chronometrer(sql)
+        print(f"\n-- {nom}: {resultats[nom]:.2f} ms")
+        for ligne in plan(sql):
+            print(f"   {ligne}")
+    return resultats
+
+
+if __name__ == '__main__':
+    nombre = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with app.app_context():
+        initialiser_base()
+        if Creance.query.count() == 0:
+            print(f"Création de {nombre} créances...")
+            remplir(nombre)
+        indexes = [index for index in Creance.__table__.indexes]
+
+        for index in indexes:
+            index.drop(db.engine, checkfirst=True)
+        db.session.execute(db.text('ANALYZE'))
+        avant = mesurer('SANS INDEX')
+
+        for index in indexes:
+            index.create(db.engine, checkfirst=True)
+        db.session.execute(db.text('ANALYZE'))
+        apres = mesurer('AVEC INDEX')
+
+        print("\n===== RÉSUMÉ (ms par requête) =====")
+        for nom in REQUETES:
+            print(f"{nom:45s} {avant[nom]:9.2f} -> {apres[nom]:9.2f}")
@@ -0,0 +1,71 @@
+"""Base SQLite temporaire, recréée pour chaque test.
+
+DATABASE_URL et JOBS_DIR sont fixés avant l'import de app : les tests ne touchent
+jamais instance/ ni une base configurée dans l'environnement.
+"""
+import glob
+import os
+import sys
+import tempfile
+
+import pytest
+
+DOSSIER_BASE = tempfile.mkdtemp(prefix='socoma_tests_')
+CHEMIN_BASE = os.path.join(DOSSIER_BASE, 'tests.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + CHEMIN_BASE
+os.environ['JOBS_DIR'] = os.path.join(DOSSIER_BASE, 'jobs')
+for variable in ('DATABASE_REPLICA_URL', 'CACHE_URL', 'INIT_DB_AU_DEMARRAGE', 'RECALCUL_STATUTS_AUTO', 'PROFILAGE'):
+    os.environ.pop(variable, None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as application  # noqa: E402
+
+ADMIN = ('DAOUDA CISSE', 'Csol2102@!*')
+
+
+def supprimer_base():
+    for chemin in glob.glob(CHEMIN_BASE + '*'):
+        os.remove(chemin)
+
+
+@pytest.fixture
+def base():
+    """Contexte applicatif sur une base neuve (schéma, migrations et comptes par défaut)."""
+    application.app.config['TESTING'] = True
+    supprimer_base()
+    with application.app.app_context():
+        application.initialiser_base()
+        application.creer_utilisateurs_par_defaut()
+        yield application.db
+        application.enregistrer_connexions()
+        application.db.session.remove()
+        for moteur in application.db.engines.values():
+            moteur.dispose()
+    application.cache_resultats.vider()
+    application.cache_utilisateurs.vider()
+    supprimer_base()
+
+
+@pytest.fixture
+def navigateur_admin(base):
+    client = application.app.test_client()
+    reponse = client.post('/login', data={'username': ADMIN[0], 'password': ADMIN[1]})
+    assert reponse.status_code == 302
+    return client
+
+
+def creance(commercial='YAYA CAMARA', client='FANTA DIARRA', marche='BAGADADJI', montant=100000,
+            versement=0, date_facturation=None, **colonnes):
+    """Créance enregistrée par l'ORM (références et soldes clients renseignés par les hooks)."""
+    from datetime import date
+    ligne = application.Creance(commercial=commercial, client=client, marche=marche, montant=montant,
+                                versement=versement, solde=montant - versement,
+                                date_facturation=date_facturation or date.today(), **colonnes)
+    ligne.update_statut()
+    application.db.session.add(ligne)
+    application.db.session.flush()
+    if versement:
+        application.db.session.add(application.Paiement(
+            creance_id=ligne.id, commercial_id=ligne.commercial_id, montant=versement, saisi_par='tests'))
+    application.db.session.commit()
+    return ligne
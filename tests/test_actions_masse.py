@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import app as application
+from conftest import creance
+
+
+def compter_creances():
+    return application.db.session.query(application.db.func.count(application.Creance.id)).scalar()
+
+
+def poster(navigateur, **champs):
+    donnees = {'action': 'supprimer_toutes', 'commercial': 'TOUS',
+               'reason': 'Nettoyage de fin d\'exercice', 'confirmation_code': application.code_confirmation()}
+    donnees.update(champs)
+    return navigateur.post('/admin/reset-creances', data=donnees, follow_redirects=True)
+
+
+def test_code_de_confirmation_absent_ou_faux_refuse(navigateur_admin):
+    creance()
+    for code in (None, '', 'SOC0000X', 'ABC123'):
+        champs = {'confirmation_code': code} if code is not None else {}
+        donnees = {'action': 'supprimer_toutes', 'commercial': 'TOUS', 'reason': 'Nettoyage de fin d\'exercice'}
+        donnees.update(champs)
+        reponse = navigateur_admin.post('/admin/reset-creances', data=donnees, follow_redirects=True)
+        assert 'Code de confirmation incorrect' in reponse.get_data(as_text=True)
+    assert compter_creances() == 1
+    assert application.ActionAdmin.query.count() == 0
+
+
+def test_code_expire_refuse():
+    il_y_a = datetime.now() - timedelta(minutes=application.CODE_CONFIRMATION_VALIDITE + 1)
+    assert application.code_confirmation(il_y_a) not in application.codes_confirmation_valides()
+    assert application.code_confirmation() in application.codes_confirmation_valides()
+
+
+def test_raison_trop_courte_refusee(navigateur_admin):
+    creance()
+    reponse = poster(navigateur_admin, reason='x')
+    assert 'au moins 10 caractères' in reponse.get_data(as_text=True)
+    assert compter_creances() == 1
+
+
+def test_suppression_confirmee_journalisee_avec_copie(navigateur_admin):
+    supprimee = creance(montant=50000, versement=50000).id
+    creance(client='AWA TRAORE', montant=80000)
+    reponse = poster(navigateur_admin, action='supprimer_soldees', commercial='YAYA CAMARA')
+    assert '1 créances traitées' in reponse.get_data(as_text=True)
+
+    assert compter_creances() == 1
+    journal = application.ActionAdmin.query.one()
+    assert (journal.action, journal.lignes, journal.admin) == ('supprimer_soldees', 1, 'DAOUDA CISSE')
+    copie = application.CreanceSupprimee.query.one()
+    assert (copie.creance_id, copie.action_id, copie.montant) == (supprimee, journal.id, 50000)
+
+
+def _archiver_id_reattribue(supprimer):
+    """Supprime une créance payée, en crée une autre sur le même id, puis l'archive."""
+    ancienne = datetime.now().date() - timedelta(days=800)
+    id_initial = creance(montant=1000, versement=1000, date_facturation=ancienne).id
+    supprimer(id_initial)
+    assert application.Paiement.query.filter_by(creance_id=id_initial).count() == 0
+
+    nouvelle = creance(client='AWA TRAORE', montant=500, versement=500, date_facturation=ancienne)
+    assert nouvelle.id == id_initial  # SQLite réattribue le plus grand id supprimé
+    application.archiver_creances(mois=12)
+
+    archive = application.CreanceArchive.query.one()
+    rattaches = application.Paiement.query.filter_by(creance_archive_id=archive.id).all()
+    assert [p.montant for p in rattaches] == [archive.versement] == [500]
+    # Le paiement de la créance supprimée reste au journal, sans créance
+    assert application.Paiement.query.filter_by(creance_id=None, creance_archive_id=None).one().montant == 1000
+
+
+def test_suppression_unitaire_detache_les_paiements(navigateur_admin):
+    _archiver_id_reattribue(lambda id_: navigateur_admin.get(f'/creances/supprimer/{id_}'))
+
+
+def test_suppression_en_masse_detache_les_paiements(navigateur_admin):
+    _archiver_id_reattribue(lambda id_: poster(navigateur_admin, action='supprimer_soldees', commercial='TOUS'))
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import app as application
+from conftest import creance
+
+
+def test_archivage_garde_les_paiements(base):
+    ancienne = date.today() - timedelta(days=800)
+    soldee = creance(montant=100000, versement=100000, date_facturation=ancienne)
+    ouverte = creance(client='AWA TRAORE', montant=50000, versement=20000, date_facturation=ancienne)
+    id_soldee, id_ouverte = soldee.id, ouverte.id
+
+    resultat = application.archiver_creances(mois=12, archive_par='DAOUDA CISSE')
+    assert resultat['archivees'] == 1
+
+    archive = application.CreanceArchive.query.one()
+    assert (archive.creance_id, archive.versement, archive.solde) == (id_soldee, 100000, 0)
+    assert application.db.session.get(application.Creance, id_soldee) is None
+
+    paiements = application.Paiement.query.order_by(application.Paiement.id).all()
+    assert [(p.creance_id, p.creance_archive_id, p.montant) for p in paiements] == [
+        (None, archive.id, 100000),
+        (id_ouverte, None, 20000),
+    ]
+    # Le journal reste complet : les encaissements totaux ne changent pas
+    total = application.db.session.query(application.db.func.sum(application.Paiement.montant)).scalar()
+    assert total == 120000
+
+
+def test_id_reattribue_ne_recupere_pas_les_paiements_archives(base):
+    ancienne = date.today() - timedelta(days=800)
+    soldee = creance(montant=100000, versement=100000, date_facturation=ancienne)
+    id_soldee = soldee.id
+    application.archiver_creances(mois=12)
+
+    # SQLite peut réattribuer le plus grand id supprimé
+    nouvelle = creance(client='AWA TRAORE', montant=30000, id=id_soldee)
+    assert nouvelle.id == id_soldee
+    assert application.Paiement.query.filter_by(creance_id=id_soldee).count() == 0
+
+
+def test_migration_rattache_les_paiements_orphelins(base):
+    ancienne = date.today() - timedelta(days=800)
+    soldee = creance(montant=100000, versement=100000, date_facturation=ancienne)
+    id_soldee = soldee.id
+    # Archivage d'avant la migration 8 : la créance part sans toucher aux paiements
+    application.db.session.execute(application.db.insert(application.CreanceArchive).values(
+        creance_id=id_soldee, commercial='YAYA CAMARA', client='FANTA DIARRA', montant=100000,
+        versement=100000, solde=0, date_facturation=ancienne))
+    application.db.session.execute(application.db.delete(application.Creance)
+                                   .where(application.Creance.id == id_soldee))
+    application.db.session.commit()
+
+    application._migration_paiements_archives()
+
+    archive = application.CreanceArchive.query.one()
+    paiement = application.Paiement.query.one()
+    assert (paiement.creance_id, paiement.creance_archive_id) == (None, archive.id)
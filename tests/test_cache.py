@@ -0,0 +1,147 @@
+from datetime import date, timedelta
+
+import pytest
+
+import app as application
+from conftest import creance
+
+
+class RedisEnMemoire:
+    """Sous-ensemble du client redis utilisé par CacheRedis (get, mget, set, setex, delete, incr, pipeline)."""
+
+    def __init__(self):
+        self.valeurs = {}
+
+    def get(self, cle):
+        valeur = self.valeurs.get(cle)
+        return valeur.encode() if isinstance(valeur, str) else valeur
+
+    def mget(self, *cles):
+        return [self.get(cle) for cle in cles]
+
+    def set(self, cle, valeur):
+        self.valeurs[cle] = str(valeur)
+
+    def setex(self, cle, ttl, valeur):
+        self.valeurs[cle] = valeur
+
+    def delete(self, cle):
+        self.valeurs.pop(cle, None)
+
+    def incr(self, cle):
+        self.valeurs[cle] = str(int(self.valeurs.get(cle) or 0) + 1)
+
+    def pipeline(self):
+        return PipelineEnMemoire(self)
+
+
+class PipelineEnMemoire:
+    def __init__(self, client):
+        self.client, self.commandes = client, []
+
+    def incr(self, cle):
+        self.commandes.append((self.client.incr, cle))
+
+    def set(self, cle, valeur):
+        self.commandes.append((self.client.set, cle, valeur))
+
+    def execute(self):
+        for commande, *arguments in self.commandes:
+            commande(*arguments)
+
+
+@pytest.fixture
+def cache_redis():
+    cache = application.CacheRedis.__new__(application.CacheRedis)
+    cache.ttl = 60
+    cache._client = RedisEnMemoire()
+    return cache
+
+
+def test_memes_methodes_pour_les_deux_caches():
+    for methode in ('lire', 'ecrire', 'supprimer', 'invalider', 'vider', 'derniere_invalidation'):
+        assert callable(getattr(application.CacheMemoire, methode))
+        assert callable(getattr(application.CacheRedis, methode))
+
+
+def test_redis_stocke_du_json_et_relit_les_agregats(base, cache_redis):
+    creance(montant=100000, date_echeance=date.today() - timedelta(days=10))
+    creance(client='AWA TRAORE', montant=50000, versement=50000)
+    valeurs = {
+        'statistiques': application.statistiques_portefeuille(),
+        'top_retards': application.top_retards(),
+        'recap_clients': application.recap_par_client(),
+        'resume': application.resume_creances(application.Creance.query),
+        'referentiel': application.referentiel_commerciaux(),
+    }
+    for cle, valeur in valeurs.items():
+        cache_redis.ecrire(cle, valeur)
+        brut = cache_redis._client.valeurs[cache_redis._cle(cle)]
+        assert isinstance(brut, str) and not brut.startswith('\x80')  # pas un pickle
+        assert cache_redis.lire(cle) == valeur
+
+    retard = cache_redis.lire('top_retards')[0]
+    assert (retard.client, retard.solde) == ('FANTA DIARRA', 100000)
+    echeances = {c['client']: c['derniere_echeance'] for c in cache_redis.lire('recap_clients')['clients']}
+    assert echeances['FANTA DIARRA'] == date.today() - timedelta(days=10)
+
+
+def test_redis_supprimer_et_vider(cache_redis):
+    cache_redis.ecrire('a', {'x': 1})
+    cache_redis.ecrire('b', {'x': 2})
+    cache_redis.supprimer('a')
+    assert cache_redis.lire('a') is None and cache_redis.lire('b') == {'x': 2}
+    cache_redis.vider()
+    assert cache_redis.lire('b') is None
+
+
+def test_valeur_non_serialisable_refusee():
+    with pytest.raises(TypeError):
+        application.encoder_cache(object())
+
+
+def remplir_portefeuilles(cache):
+    for portefeuille in ('TOUS', 'YAYA CAMARA', 'BADRA KEITA'):
+        cache.ecrire(f'statistiques:{portefeuille}', {'portefeuille': portefeuille})
+        cache.ecrire(f'resume_creances:YAYA CAMARA|PAYE|:{portefeuille}', {'portefeuille': portefeuille})
+
+
+@pytest.mark.parametrize('fabrique', ['memoire', 'redis'])
+def test_invalider_ne_touche_que_les_portefeuilles_donnes(fabrique, cache_redis):
+    cache = application.CacheMemoire() if fabrique == 'memoire' else cache_redis
+    remplir_portefeuilles(cache)
+    cache.invalider({'BADRA KEITA', 'TOUS'})
+    for nom in ('statistiques', 'resume_creances:YAYA CAMARA|PAYE|'):
+        assert cache.lire(f'{nom}:YAYA CAMARA') == {'portefeuille': 'YAYA CAMARA'}
+        assert cache.lire(f'{nom}:BADRA KEITA') is None and cache.lire(f'{nom}:TOUS') is None
+
+
+def test_commit_garde_le_cache_des_autres_commerciaux(base, monkeypatch):
+    cache = application.CacheMemoire()
+    monkeypatch.setattr(application, 'cache_resultats', cache)
+    remplir_portefeuilles(cache)
+    creance(commercial='BADRA KEITA', client='AWA TRAORE', montant=70000)
+    assert cache.lire('statistiques:YAYA CAMARA') is not None
+    assert cache.lire('statistiques:BADRA KEITA') is None and cache.lire('statistiques:TOUS') is None
+
+    # Écriture en masse sans portefeuille connu : tout le cache est invalidé
+    base.session.execute(base.update(application.Creance).values(commentaires='revu'))
+    base.session.commit()
+    assert cache.lire('statistiques:YAYA CAMARA') is None
+
+
+@pytest.mark.parametrize('sur_replique, partage', [(True, False), (False, True)])
+def test_invalidation_d_un_autre_worker_retient_les_calculs_de_la_replique(
+        base, cache_redis, monkeypatch, sur_replique, partage):
+    monkeypatch.setattr(application, 'cache_resultats', cache_redis)
+    monkeypatch.setattr(application, 'lecture_sur_replique', lambda: sur_replique)
+    # Commit d'un autre worker : seul l'horodatage partagé dans Redis en garde la trace.
+    cache_redis.invalider({'YAYA CAMARA', 'TOUS'})
+
+    assert application.en_cache('statistiques', 'YAYA CAMARA', lambda: {'total': 1}) == {'total': 1}
+    assert (cache_redis.lire('statistiques:YAYA CAMARA') is not None) is partage
+
+    # Passé le délai de réplication, la réplique alimente de nouveau le cache partagé.
+    cache_redis._client.set('socoma:cache:derniere_invalidation', 0)
+    application.en_cache('statistiques', 'YAYA CAMARA', lambda: {'total': 1})
+    assert cache_redis.lire('statistiques:YAYA CAMARA') == {'total': 1}
@@ -0,0 +1,65 @@
+from datetime import date
+
+import pandas as pd
+
+import app as application
+
+
+def fichier_import():
+    return pd.DataFrame({
+        'Commercial': ['YAYA CAMARA', 'YAYA CAMARA', 'BADRA KEITA'],
+        'Client': ['FANTA DIARRA', 'NOUVEAU CLIENT', 'AWA TRAORE'],
+        'Marché': ['BAGADADJI', None, None],
+        'Montant': [100000, 250000, 80000],
+        'Versement': [20000, 0, 80000],
+        'Date Facturation': ['01/03/2026', '15/03/2026', '20/03/2026'],
+        'Date Échéance': ['31/03/2026', None, '20/04/2026'],
+    })
+
+
+def test_import_avec_marches_manquants(base):
+    rapport = application.importer_creances(fichier_import(), created_by='tests', date_format='dd/mm/yyyy')
+    assert (rapport['imported'], rapport['errors']) == (3, 0)
+
+    lignes = application.Creance.query.order_by(application.Creance.id).all()
+    assert [c.marche_id is None for c in lignes] == [False, True, True]
+    assert all(isinstance(c.client_id, int) and isinstance(c.commercial_id, int) for c in lignes)
+    soldes = dict(base.session.query(application.ClientBalance.client_id, application.ClientBalance.total_solde))
+    assert soldes == {lignes[0].client_id: 80000, lignes[1].client_id: 250000, lignes[2].client_id: 0}
+    assert base.session.query(base.func.sum(application.Paiement.montant)).scalar() == 100000
+
+
+def test_csv_du_copy_ecrit_des_entiers(base):
+    lignes, _, erreurs = application.preparer_import(fichier_import(), 'tests', 'dd/mm/yyyy')
+    assert not erreurs
+    lignes = application.attribuer_references(lignes)
+    base.session.rollback()
+
+    colonnes = list(lignes.columns)
+    for champs in (ligne.split(',') for ligne in application.csv_pour_copy(lignes).read().splitlines()):
+        valeurs = dict(zip(colonnes, champs))
+        for nom in ('commercial_id', 'client_id', 'marche_id'):
+            assert valeurs[nom] == '' or valeurs[nom].isdigit(), (nom, valeurs[nom])
+    assert application.csv_pour_copy(lignes).read().count(',,') >= 2  # marche_id NULL
+
+
+def test_creance_saisie_pendant_import_non_journalisee_deux_fois(base):
+    lignes, _, erreurs = application.preparer_import(fichier_import(), 'DAOUDA CISSE', 'dd/mm/yyyy')
+    assert not erreurs
+    saisies = []
+
+    def saisie_concurrente(fraction):
+        # Créance enregistrée par le même utilisateur entre deux lots (ajouter_creance)
+        if not saisies:
+            saisie = application.Creance(commercial='YAYA CAMARA', client='AWA TRAORE', montant=30000,
+                                         versement=0, solde=30000, date_facturation=date.today(),
+                                         created_by='DAOUDA CISSE')
+            application.enregistrer_paiement(saisie, 10000, 'DAOUDA CISSE')
+            saisies.append(saisie)
+
+    application.inserer_creances_en_masse(lignes, taille_lot=1, progression=saisie_concurrente)
+    base.session.commit()
+
+    paiements = base.session.query(application.Paiement.creance_id, application.Paiement.montant).all()
+    assert sorted(montant for _, montant in paiements) == [10000, 20000, 80000]
+    assert [montant for creance_id, montant in paiements if creance_id == saisies[0].id] == [10000]
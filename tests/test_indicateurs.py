@@ -0,0 +1,67 @@
+import json
+
+import app as application
+from conftest import creance
+
+
+def evenements(morceaux):
+    """[(nom, id, données)] des événements d'un flux SSE (commentaires et retry ignorés)."""
+    resultat = []
+    for bloc in ''.join(morceaux).split('\n\n'):
+        champs = dict(ligne.split(': ', 1) for ligne in bloc.splitlines() if not ligne.startswith(':'))
+        if 'event' in champs:
+            resultat.append((champs['event'], champs['id'], json.loads(champs['data'])))
+    return resultat
+
+
+def test_commit_pousse_le_delta_aux_abonnes(base):
+    id_creance = creance(montant=100000).id
+    file = application.abonner_kpi(None)
+    flux = application.flux_evenements_kpi(None, file, duree=0.5)
+    assert next(flux) == f'retry: {application.KPI_RECONNEXION * 1000}\n\n'
+    [(nom, _, complet)] = evenements([next(flux)])
+    assert (nom, complet['total_solde']) == ('kpi', 100000)
+
+    application.enregistrer_paiement(application.db.session.get(application.Creance, id_creance), 40000, 'tests')
+    application.db.session.commit()  # hook after_commit -> réveil de l'abonné
+    [(nom, _, delta)] = evenements([next(flux)])
+    assert nom == 'delta'
+    assert (delta['total_solde'], delta['total_versement']) == (60000, 40000)
+    assert 'total_creances' not in delta  # seuls les champs modifiés
+
+    reste = list(flux)  # le flux se termine de lui-même après sa durée maximale
+    assert all(morceau.startswith(':') for morceau in reste)
+    assert not application._abonnes_kpi
+
+
+def test_commit_ne_reveille_que_les_portefeuilles_touches(base):
+    yaya = application.abonner_kpi('YAYA CAMARA')
+    admin = application.abonner_kpi(None)
+    try:
+        creance(commercial='BADRA KEITA', client='AWA TRAORE', montant=70000)
+        assert yaya.empty() and not admin.empty()
+    finally:
+        application.desabonner_kpi('YAYA CAMARA', yaya)
+        application.desabonner_kpi(None, admin)
+
+
+def test_reconnexion_sans_changement_ne_renvoie_rien(navigateur_admin, monkeypatch):
+    creance(montant=100000)
+    monkeypatch.setattr(application, 'KPI_DUREE_FLUX', 0.2)
+    reponse = navigateur_admin.get('/api/kpi/flux')
+    assert reponse.mimetype == 'text/event-stream'
+    [(nom, identifiant, complet)] = evenements([reponse.get_data(as_text=True)])
+    assert nom == 'kpi' and complet['total_creances'] == 100000
+
+    reprise = navigateur_admin.get('/api/kpi/flux', headers={'Last-Event-ID': identifiant})
+    assert evenements([reprise.get_data(as_text=True)]) == []
+
+
+def test_flux_limite_au_portefeuille_du_commercial(base, monkeypatch):
+    creance(commercial='YAYA CAMARA', montant=100000)
+    creance(commercial='BADRA KEITA', client='AWA TRAORE', montant=70000)
+    monkeypatch.setattr(application, 'KPI_DUREE_FLUX', 0.1)
+    navigateur = application.app.test_client()
+    navigateur.post('/login', data={'username': 'CAMARA YAYA', 'password': 'Socoma2030@'})
+    [(_, _, complet)] = evenements([navigateur.get('/api/kpi/flux').get_data(as_text=True)])
+    assert complet['total_creances'] == 100000
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as application
+from conftest import creance
+
+
+def attendre_job(navigateur, job_id, delai=20):
+    fin = time.monotonic() + delai
+    while time.monotonic() < fin:
+        etat = navigateur.get(f'/api/jobs/{job_id}').get_json()
+        if etat['statut'] in ('termine', 'erreur'):
+            return etat
+        time.sleep(0.1)
+    raise AssertionError(f'tâche {job_id} non terminée')
+
+
+def relire_job(job_id):
+    """Ligne jobs telle qu'un autre worker la lit (sans la progression propre à ce processus)."""
+    application.db.session.expire_all()
+    return application.db.session.get(application.Job, job_id)
+
+
+def test_bouton_export_passe_par_une_tache(navigateur_admin):
+    creance(montant=100000)
+    reponse = navigateur_admin.get('/export-excel')
+    assert reponse.status_code == 302 and '/exports/' in reponse.location
+    job_id = reponse.location.rsplit('/', 1)[-1]
+    assert 'Export Excel' in navigateur_admin.get(reponse.location).get_data(as_text=True)
+
+    etat = attendre_job(navigateur_admin, job_id)
+    assert (etat['statut'], etat['resultat']) == ('termine', {'lignes': 1})
+    fichier = navigateur_admin.get(etat['telechargement'])
+    assert fichier.status_code == 200 and fichier.data[:2] == b'PK'  # archive xlsx
+
+
+def test_progression_ecrite_dans_la_table(base):
+    etape_atteinte, reprise = threading.Event(), threading.Event()
+
+    def tache(job_id, progression):
+        progression(40, 'Étape intermédiaire')
+        etape_atteinte.set()
+        reprise.wait(10)
+        return {}, None
+
+    job_id = application.lancer_job('export', tache, 'tests')
+    assert etape_atteinte.wait(10)
+    job = relire_job(job_id)
+    assert (job.statut, job.progression, job.message) == ('en_cours', 40, 'Étape intermédiaire')
+    assert job.battement is not None
+    reprise.set()
+
+    fin = time.monotonic() + 10
+    while relire_job(job_id).statut != 'termine' and time.monotonic() < fin:
+        time.sleep(0.05)
+    assert relire_job(job_id).progression == 100
+
+
+def test_tache_sans_signe_de_vie_passe_en_erreur(navigateur_admin):
+    ancienne = datetime.now() - timedelta(seconds=application.JOBS_DELAI_ABANDON + 60)
+    for job_id, battement in (('orpheline', ancienne), ('vivante', datetime.now())):
+        application.db.session.add(application.Job(id=job_id, type='import', statut='en_cours', cree_par='DAOUDA CISSE',
+                                                   date_creation=ancienne, battement=battement))
+    application.db.session.commit()
+
+    orpheline = navigateur_admin.get('/api/jobs/orpheline').get_json()
+    assert orpheline['statut'] == 'erreur' and 'interrompue' in orpheline['message']
+    assert navigateur_admin.get('/api/jobs/vivante').get_json()['statut'] == 'en_cours'
+
+
+def test_progression_n_attend_pas_le_verrou_sqlite(base):
+    application.db.session.add(application.Job(id='verrou', type='import', statut='en_cours'))
+    application.db.session.commit()
+    with application.db.engine.connect() as import_en_cours:
+        # Une autre connexion tient le verrou d'écriture, comme l'import dans sa transaction
+        import_en_cours.exec_driver_sql('BEGIN IMMEDIATE')
+        debut = time.monotonic()
+        application.ecrire_jobs(['verrou'], progression=50)
+        assert time.monotonic() - debut < 1
+        import_en_cours.rollback()
+    application.ecrire_jobs(['verrou'], progression=60)
+    assert relire_job('verrou').progression == 60
+
+
+def test_export_en_erreur_ne_laisse_aucun_fichier(base, monkeypatch):
+    for numero in range(3):
+        creance(client=f'CLIENT {numero}')
+    exports = set(os.listdir(application.dossier_jobs()))
+    temporaires = set(os.listdir(tempfile.gettempdir()))
+
+    lignes_export = application.lignes_export
+
+    def lignes_interrompues(*args, **kwargs):
+        yield next(lignes_export(*args, **kwargs))
+        raise RuntimeError('connexion perdue')
+
+    monkeypatch.setattr(application, 'lignes_export', lignes_interrompues)
+    with pytest.raises(RuntimeError):
+        application.job_export('interrompu', lambda *args: None, None)
+    assert set(os.listdir(application.dossier_jobs())) == exports
+    assert set(os.listdir(tempfile.gettempdir())) <= temporaires  # feuilles temporaires d'openpyxl
+
+
+def test_purge_des_fichiers_sans_tache(base):
+    dossier = application.dossier_jobs()
+    noms = {'import_abandonne.xlsx', 'export_partiel.xlsx', 'recent.xlsx', 'conserve.xlsx'}
+    ancien = (datetime.now() - application.JOBS_DUREE_CONSERVATION - timedelta(hours=1)).timestamp()
+    for nom in noms:
+        with open(os.path.join(dossier, nom), 'wb') as fichier:
+            fichier.write(b'PK')
+        if nom != 'recent.xlsx':
+            os.utime(os.path.join(dossier, nom), (ancien, ancien))
+    application.db.session.add(application.Job(id='conserve', type='export', statut='termine',
+                                               fichier=os.path.join(dossier, 'conserve.xlsx')))
+    application.db.session.commit()
+
+    application.purger_jobs()
+    assert noms & set(os.listdir(dossier)) == {'conserve.xlsx', 'recent.xlsx'}
@@ -0,0 +1,35 @@
+import app as application
+from conftest import creance
+
+
+def requetes_resume(navigateur, url):
+    """Nombre de requêtes SQL agrégées (résumé de la liste) émises par une page."""
+    executees = []
+    moteur = application.db.engine
+
+    def noter(connexion, curseur, instruction, *args):
+        executees.append(instruction)
+    application.db.event.listen(moteur, 'before_cursor_execute', noter)
+    try:
+        reponse = navigateur.get(url)
+    finally:
+        application.db.event.remove(moteur, 'before_cursor_execute', noter)
+    assert reponse.status_code == 200
+    return sum('GROUP BY creances.statut' in sql for sql in executees), reponse.get_data(as_text=True)
+
+
+def test_resume_calcule_une_fois_par_filtre(navigateur_admin):
+    for i in range(3):
+        creance(client=f'CLIENT {i}', montant=100000 * (i + 1))
+
+    assert requetes_resume(navigateur_admin, '/creances?statut=À RELANCER')[0] == 1
+    assert requetes_resume(navigateur_admin, '/creances?statut=À RELANCER&par_page=25')[0] == 0
+    assert requetes_resume(navigateur_admin, '/creances?commercial=BADRA KEITA')[0] == 1
+
+
+def test_resume_invalide_apres_ecriture(navigateur_admin):
+    creance(montant=100000)
+    assert '100 000 FCFA' in requetes_resume(navigateur_admin, '/creances')[1]
+    creance(client='AWA TRAORE', montant=250000)
+    nb, page = requetes_resume(navigateur_admin, '/creances')
+    assert nb == 1 and '350 000 FCFA' in page
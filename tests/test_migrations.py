@@ -0,0 +1,74 @@
+import pytest
+
+import app as application
+from conftest import supprimer_base
+
+VERSIONS = [version for version, _, _ in application.MIGRATIONS]
+
+# Schéma d'origine (avant toute migration) : users et creances seulement
+SCHEMA_INITIAL = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, password_hash VARCHAR(200) NOT NULL,
+        role VARCHAR(20), commercial VARCHAR(100), date_creation DATETIME, last_login DATETIME)""",
+    """CREATE TABLE creances (
+        id INTEGER PRIMARY KEY, commercial VARCHAR(100) NOT NULL, client VARCHAR(200) NOT NULL,
+        marche VARCHAR(200), montant FLOAT NOT NULL, versement FLOAT, solde FLOAT NOT NULL,
+        date_creation DATETIME, date_facturation DATE NOT NULL, date_echeance DATE, jours_retard INTEGER,
+        statut VARCHAR(50), situation_paiement VARCHAR(50), commentaires TEXT, created_by VARCHAR(80))""",
+    """INSERT INTO creances (commercial, client, marche, montant, versement, solde, date_creation,
+        date_facturation, statut, situation_paiement, created_by) VALUES
+        ('YAYA CAMARA', 'FANTA DIARRA', 'BAGADADJI', 100000, 40000, 60000, '2025-01-10 09:00:00',
+         '2025-01-10', 'EN RETARD', 'EN RETARD', 'import'),
+        ('YAYA CAMARA', 'fanta  diarra', NULL, 50000, 0, 50000, '2025-02-10 09:00:00',
+         '2025-02-10', 'À RELANCER', 'EN COURS', 'import')""",
+]
+
+
+@pytest.fixture
+def base_vierge():
+    """Contexte applicatif sur un fichier de base vide, sans schéma."""
+    supprimer_base()
+    with application.app.app_context():
+        yield application.db
+        application.db.session.remove()
+        for moteur in application.db.engines.values():
+            moteur.dispose()
+    application.cache_resultats.vider()
+    supprimer_base()
+
+
+def test_base_vide_recoit_toutes_les_migrations(base_vierge):
+    assert application.initialiser_base() == VERSIONS
+    enregistrees = [m.version for m in application.SchemaMigration.query.order_by(application.SchemaMigration.version)]
+    assert enregistrees == VERSIONS
+    # Deuxième passage : rien à appliquer
+    assert application.initialiser_base() == []
+
+
+def test_base_existante_migree_et_reprise(base_vierge):
+    db = base_vierge
+    for instruction in SCHEMA_INITIAL:
+        db.session.execute(db.text(instruction))
+    db.session.commit()
+
+    assert application.initialiser_base() == VERSIONS
+
+    colonnes = {c['name'] for c in db.inspect(db.engine).get_columns('creances')}
+    assert {'client_recherche', 'commercial_id', 'client_id', 'marche_id'} <= colonnes
+    assert 'creance_archive_id' in {c['name'] for c in db.inspect(db.engine).get_columns('paiements')}
+
+    creances = application.Creance.query.order_by(application.Creance.id).all()
+    yaya = application.Commercial.query.filter_by(nom='YAYA CAMARA').one()
+    assert {c.commercial_id for c in creances} == {yaya.id}
+    # Les deux variantes de saisie pointent sur la même fiche client
+    assert creances[0].client_id is not None and creances[0].client_id == creances[1].client_id
+    assert creances[1].marche_id is None
+
+    # Versement existant repris dans le journal, soldes clients reconstruits
+    paiements = application.Paiement.query.all()
+    assert [(p.creance_id, p.montant) for p in paiements] == [(creances[0].id, 40000)]
+    solde = application.ClientBalance.query.filter_by(client_id=creances[0].client_id).one()
+    assert (solde.nombre_creances, solde.total_solde) == (2, 110000)
+
+    stats = application.statistiques_portefeuille('YAYA CAMARA')
+    assert stats['total_creances'] == 150000